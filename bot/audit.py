@@ -0,0 +1,103 @@
+import os
+import asyncio
+import logging
+
+from local_store import now_iso
+from metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Записей в пачке и период сброса буфера журнала модерации (сек)
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "50"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2"))
+# Предел буфера, если база долго не принимает записи: старейшие отбрасываются
+AUDIT_MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", "10000"))
+
+AUDIT_BUFFERED = REGISTRY.register(Gauge(
+    "bot_audit_buffered", "Записи журнала модерации, ожидающие записи в базу"))
+AUDIT_DROPPED = REGISTRY.register(Counter(
+    "bot_audit_dropped_total", "Записи журнала модерации, отброшенные из-за переполнения буфера"))
+
+class AuditLog:
+    """
+    Журнал модерации с отложенной записью.
+
+    record() только добавляет запись в буфер (время фиксируется сразу),
+    поэтому модерация не ждёт лишнего запроса к базе. Буфер сбрасывается
+    одним insert, когда набирается batch_size записей, раз в flush_interval
+    секунд и при остановке (close). Неудачная пачка остаётся в буфере
+    до следующей попытки.
+    """
+
+    def __init__(self, db, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, max_buffer: int = AUDIT_MAX_BUFFER):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._flush_task = None
+        self._flushing = None
+        # Сброс по таймеру, по размеру пачки и из render_history не должны
+        # писать пачки одновременно: создаётся в event loop при первом сбросе
+        self._lock = None
+
+    def record(self, telegram_id: int, actor_id: int, old_status: str, new_status: str):
+        """Записать смену статуса; old_status=None — строки до смены не было"""
+        self._buffer.append({
+            "telegram_id": telegram_id,
+            "actor_id": actor_id,
+            "old_status": old_status,
+            "new_status": new_status,
+            "created_at": now_iso(),
+        })
+        if len(self._buffer) > self.max_buffer:
+            dropped = len(self._buffer) - self.max_buffer
+            del self._buffer[:dropped]
+            AUDIT_DROPPED.inc(amount=dropped)
+            logger.error(f"Журнал модерации: буфер переполнен, отброшено записей: {dropped}")
+        AUDIT_BUFFERED.set(len(self._buffer))
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if len(self._buffer) >= self.batch_size and (self._flushing is None or self._flushing.done()):
+            self._flushing = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Записать накопленное пачками по batch_size; одновременно идёт только один сброс"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                while self._buffer:
+                    # Пачка забирается из буфера до запроса: пока он идёт, record() может дописывать
+                    batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+                    written = False
+                    try:
+                        written = await self.db.insert_audit_entries(batch)
+                    finally:
+                        # Ошибка или отмена — пачка возвращается в начало буфера
+                        if not written:
+                            self._buffer[:0] = batch
+                    if not written:
+                        break
+            finally:
+                AUDIT_BUFFERED.set(len(self._buffer))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        """Остановить фоновый сброс и записать остаток буфера"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        if self._flushing:
+            await asyncio.gather(self._flushing, return_exceptions=True)
+            self._flushing = None
+        await self.flush()
+        if self._buffer:
+            logger.error(f"Журнал модерации: не записано {len(self._buffer)} записей")
@@ -0,0 +1,344 @@
+"""
+Нагрузочный тест диспетчера без сети.
+
+Поднимает fake_telegram.py и fake_supabase.py (с заданной задержкой) в отдельном
+процессе, импортирует бота и прогоняет через dp синтетический поток обновлений:
+/start, отправку номера, кнопки меню и действия админа в заданной пропорции.
+Печатает пропускную способность, перцентили времени обработки по типам
+обновлений и память процесса.
+
+Запуск:
+    python benchmark.py --updates 5000 --concurrency 100 --db-latency 0.02 --tg-latency 0.01
+
+Сравнение с сохранённым результатом (код выхода 1, если стало хуже):
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json --max-regression 0.2
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import asyncio
+import argparse
+import resource
+import statistics
+import tracemalloc
+import multiprocessing
+from datetime import datetime, timezone, timedelta
+
+from aiohttp import web
+
+from fake_telegram import FakeTelegram
+from fake_supabase import FakeSupabase
+
+ADMIN_ID = 1
+BOT_TOKEN = "123456:benchmark"
+DEFAULT_MIX = "start:30,contact:10,menu:45,admin:15"
+# Доли статусов у заранее созданных пользователей
+SEED_STATUSES = (("approved", 0.7), ("pending", 0.2), ("banned", 0.1))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def seed_users(count: int):
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    users = []
+    for i in range(count):
+        roll, status = random.random(), "approved"
+        for name, share in SEED_STATUSES:
+            if roll < share:
+                status = name
+                break
+            roll -= share
+        users.append({
+            "id": i + 1,
+            "telegram_id": 1000 + i,
+            "phone_number": f"7999{i:07d}",
+            "full_name": f"User {i}",
+            "username": f"user{i}",
+            "status": status,
+            "created_at": (started + timedelta(seconds=i)).isoformat(timespec="microseconds"),
+        })
+    return users
+
+def run_fakes(tg_port, db_port, tg_latency, db_latency, users, ready):
+    """Фейковые Bot API и Supabase в отдельном процессе, чтобы не делить с ботом event loop"""
+    async def serve():
+        fake_db = FakeSupabase(db_latency)
+        fake_db.tables["users"] = users
+        fake_db._ids["users"] = len(users)
+        for app, port in ((FakeTelegram(tg_latency).make_app(), tg_port), (fake_db.make_app(), db_port)):
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split(":")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"start", "contact", "menu", "admin"}
+    if unknown:
+        raise SystemExit(f"Неизвестные типы обновлений: {', '.join(sorted(unknown))}")
+    return mix
+
+class ErrorCounter(logging.Handler):
+    """Собирает ошибки обработки, которые планировщик пишет в лог"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+class UpdateFactory:
+    """Синтетические обновления разных типов"""
+
+    def __init__(self, bot_main, users):
+        self.m = bot_main
+        self.fake = FakeTelegram()
+        self.approved = [u["telegram_id"] for u in users if u["status"] == "approved"] or [ADMIN_ID]
+        self.pending = [u["telegram_id"] for u in users if u["status"] == "pending"]
+        self.known = [u["telegram_id"] for u in users]
+        self.next_new_id = 10_000_000
+
+    def start(self):
+        # Половина — знакомые пользователи, половина — новые
+        user_id = random.choice(self.known) if self.known and random.random() < 0.5 else self._new_id()
+        return self.fake.message_update(user_id, "/start")
+
+    def contact(self):
+        user_id = self._new_id()
+        return self.fake.message_update(user_id, contact={
+            "phone_number": f"7900{user_id % 10_000_000:07d}",
+            "first_name": f"New{user_id}",
+            "user_id": user_id,
+        })
+
+    def menu(self):
+        m = self.m
+        code = random.choice((m.CB_CHATS, m.CB_CONTACTS, m.CB_SETTINGS, m.CB_HELP, m.CB_MAIN_MENU))
+        return self.fake.callback_update(random.choice(self.approved), m.router.pack(code))
+
+    def admin(self):
+        m = self.m
+        if self.pending and random.random() < 0.3:
+            data = m.router.pack(m.CB_APPROVE, self.pending.pop())
+        else:
+            data = m.router.pack(random.choice((m.CB_REQUESTS, m.CB_USERS, m.CB_STATS, m.CB_ADMIN_PANEL)))
+        return self.fake.callback_update(ADMIN_ID, data)
+
+    def _new_id(self):
+        self.next_new_id += 1
+        return self.next_new_id
+
+def percentile(sorted_values, share):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * share))]
+
+async def run(args, bot_main, users):
+    from aiogram import Bot, Dispatcher, types
+    import scheduler as scheduler_module
+
+    m = bot_main
+    Bot.set_current(m.bot)
+    Dispatcher.set_current(m.dp)
+    await m.sender.start()
+    await m.db.start()
+    await m.db.wait_connected()
+    # Обновления идут так же, как в бою: dp.process_updates -> планировщик ->
+    # updates_handler с мидлварями. Планировщик сам ловит исключения обработчиков
+    # и пишет их в лог — ошибки считаем по этим записям
+    await m.scheduler.start()
+    failures = ErrorCounter()
+    logging.getLogger("scheduler").addHandler(failures)
+
+    factory = UpdateFactory(m, users)
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    plan = random.choices(kinds, weights, k=args.warmup + args.updates)
+
+    latencies = {kind: [] for kind in kinds}
+    errors = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def feed(index, kind):
+        update = types.Update(**getattr(factory, kind)())
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await m.dp.process_updates([update])
+            except Exception as e:
+                errors.append(e)
+                return
+            if index >= args.warmup:
+                latencies[kind].append(time.perf_counter() - started)
+
+    # Прогрев: соединения, кэши, JIT-пути aiogram
+    await asyncio.gather(*(feed(i, kind) for i, kind in enumerate(plan[:args.warmup])))
+
+    gc.collect()
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        feed(i, kind) for i, kind in enumerate(plan[args.warmup:], start=args.warmup)
+    ))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    errors.extend(failures.records)
+    dropped = sum(scheduler_module.SCHEDULER_DROPPED.values.values())
+    logging.getLogger("scheduler").removeHandler(failures)
+    await m.scheduler.stop(timeout=1)
+    queued = m.sender.qsize()
+    await m.sender.stop(timeout=1)
+    await m.db.close()
+    session = await m.bot.get_session()
+    await session.close()
+
+    everything = sorted(v for values in latencies.values() for v in values)
+    result = {
+        "updates": len(everything),
+        "errors": len(errors),
+        "elapsed": elapsed,
+        "throughput": len(everything) / elapsed if elapsed else 0,
+        "p50": percentile(everything, 0.5),
+        "p90": percentile(everything, 0.9),
+        "p99": percentile(everything, 0.99),
+        "max": everything[-1] if everything else 0,
+        "by_kind": {
+            kind: {
+                "count": len(values),
+                "p50": percentile(sorted(values), 0.5),
+                "p99": percentile(sorted(values), 0.99),
+                "mean": statistics.mean(values) if values else 0,
+            }
+            for kind, values in latencies.items()
+        },
+        "dropped": dropped,
+        "send_queue": queued,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "tracemalloc_peak_mb": peak / 1024 / 1024 if peak is not None else None,
+    }
+    if errors:
+        result["first_error"] = repr(errors[0])
+    return result
+
+def report(result, args):
+    print(f"Обновлений: {result['updates']} за {result['elapsed']:.2f} сек, ошибок: {result['errors']}")
+    if result.get("first_error"):
+        print(f"Первая ошибка: {result['first_error']}")
+    print(f"Пропускная способность: {result['throughput']:.0f} обновлений/сек (параллельно {args.concurrency})")
+    print(
+        f"Время обработки: p50 {result['p50'] * 1000:.1f} мс, p90 {result['p90'] * 1000:.1f} мс, "
+        f"p99 {result['p99'] * 1000:.1f} мс, max {result['max'] * 1000:.1f} мс"
+    )
+    for kind, stats in result["by_kind"].items():
+        print(
+            f"  {kind:8} {stats['count']:6}  p50 {stats['p50'] * 1000:7.1f} мс  "
+            f"p99 {stats['p99'] * 1000:7.1f} мс  среднее {stats['mean'] * 1000:7.1f} мс"
+        )
+    if result.get("dropped"):
+        print(f"Отброшено планировщиком: {result['dropped']}")
+    print(f"Очередь отправки в конце: {result['send_queue']}")
+    memory = f"Память: max RSS {result['max_rss_mb']:.1f} МБ"
+    if result["tracemalloc_peak_mb"] is not None:
+        memory += f", пик Python-объектов {result['tracemalloc_peak_mb']:.1f} МБ"
+    print(memory)
+
+def compare(result, baseline, max_regression):
+    """Список ухудшений относительно baseline больше чем на max_regression"""
+    problems = []
+    if result["throughput"] < baseline["throughput"] * (1 - max_regression):
+        problems.append(f"пропускная способность {result['throughput']:.0f} < {baseline['throughput']:.0f}")
+    for key in ("p50", "p99"):
+        if result[key] > baseline[key] * (1 + max_regression):
+            problems.append(f"{key} {result[key] * 1000:.1f} мс > {baseline[key] * 1000:.1f} мс")
+    if result["errors"] > baseline.get("errors", 0):
+        problems.append(f"ошибок {result['errors']}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест диспетчера бота")
+    parser.add_argument("--updates", type=int, default=5000, help="число обновлений в замере")
+    parser.add_argument("--warmup", type=int, default=200, help="обновлений на прогрев (не учитываются)")
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременно обрабатываемых обновлений")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="доли типов: start,contact,menu,admin")
+    parser.add_argument("--users", type=int, default=2000, help="пользователей в фейковой базе")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="задержка ответа Supabase (сек)")
+    parser.add_argument("--tg-latency", type=float, default=0.0, help="задержка ответа Bot API (сек)")
+    parser.add_argument("--seed", type=int, default=42, help="seed генератора обновлений")
+    parser.add_argument("--tracemalloc", action="store_true", help="замерять пик памяти Python (медленнее)")
+    parser.add_argument("--save", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON с прошлым результатом для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимое ухудшение (доля)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    users = seed_users(args.users)
+    tg_port, db_port = free_port(), free_port()
+
+    ready = multiprocessing.Event()
+    fakes = multiprocessing.Process(
+        target=run_fakes,
+        args=(tg_port, db_port, args.tg_latency, args.db_latency, users, ready),
+        daemon=True
+    )
+    fakes.start()
+    if not ready.wait(timeout=30):
+        raise SystemExit("Фейковые серверы не запустились")
+
+    # Бот читает настройки из окружения при импорте
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "ADMIN_IDS": str(ADMIN_ID),
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{tg_port}",
+        "SUPABASE_URL": f"http://127.0.0.1:{db_port}",
+        "SUPABASE_KEY": "fake.fake.fake",
+        "FSM_STORAGE": "memory",
+        "LOCAL_REPLICA": "0",
+    })
+    # Очередь отправки не должна ограничивать замер самого диспетчера
+    os.environ.setdefault("SEND_RATE", "100000")
+    os.environ.setdefault("SEND_CHAT_INTERVAL", "0")
+    # Все действия админа идут от одного пользователя: лимит его очереди
+    # в планировщике отбрасывал бы их и занижал время обработки
+    os.environ.setdefault("UPDATE_USER_QUEUE", "100000")
+
+    logging.disable(logging.WARNING)
+    import main as bot_main
+
+    try:
+        result = asyncio.run(run(args, bot_main, users))
+    finally:
+        fakes.terminate()
+
+    report(result, args)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(result, json.load(f), args.max_regression)
+        if problems:
+            print("❌ Регрессия: " + "; ".join(problems))
+            sys.exit(1)
+        print("✅ Без регрессий относительно baseline")
+
+if __name__ == "__main__":
+    main()
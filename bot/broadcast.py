@@ -0,0 +1,331 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.exceptions import (
+    BotBlocked, UserDeactivated, ChatNotFound, CantInitiateConversation, TelegramAPIError
+)
+
+from sender import MessageSender, PRIORITY_LOW
+from database import SchemaError
+
+logger = logging.getLogger(__name__)
+
+# Файл SQLite с рассылками и точками продолжения
+BROADCAST_DB_PATH = os.getenv("BROADCAST_DB_PATH", "broadcasts.sqlite3")
+# Получателей в одной странице (один запрос к базе и одна точка продолжения)
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "200"))
+# Как часто обновлять сообщение с прогрессом (сек)
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+# Пауза перед повтором, если база не ответила (сек)
+BROADCAST_RETRY_DELAY = 10
+
+# Ошибки, после которых писать пользователю бессмысленно
+UNREACHABLE_ERRORS = (BotBlocked, UserDeactivated, ChatNotFound, CantInitiateConversation)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    from_chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    progress_chat_id INTEGER NOT NULL,
+    progress_message_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    total INTEGER NOT NULL DEFAULT 0,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    blocked INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS broadcasts_status ON broadcasts (status);
+"""
+
+SQL_CHECKPOINT = (
+    "UPDATE broadcasts SET status = :status, last_id = :last_id, sent = :sent, "
+    "failed = :failed, blocked = :blocked, finished_at = :finished_at WHERE id = :id"
+)
+
+class BroadcastStore:
+    """Рассылки и их прогресс в SQLite; операции выполняются в одном потоке"""
+
+    def __init__(self, path: str = BROADCAST_DB_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broadcast-store")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _create(self, broadcast: dict):
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO broadcasts (from_chat_id, message_id, progress_chat_id, "
+                "progress_message_id, total, started_at) VALUES (:from_chat_id, :message_id, "
+                ":progress_chat_id, :progress_message_id, :total, :started_at)",
+                broadcast
+            )
+        return self._get(cursor.lastrowid)
+
+    def _get(self, broadcast_id: int):
+        row = self._conn.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _running(self):
+        return [dict(row) for row in self._conn.execute(
+            "SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id"
+        )]
+
+    def _save(self, broadcast: dict):
+        with self._conn:
+            self._conn.execute(SQL_CHECKPOINT, broadcast)
+
+    async def create(self, **fields):
+        return await self._run(self._create, {"total": 0, "started_at": time.time(), **fields})
+
+    async def running(self):
+        """Незавершённые рассылки (например, прерванные перезапуском)"""
+        return await self._run(self._running)
+
+    async def save(self, broadcast: dict):
+        await self._run(self._save, broadcast)
+
+    async def close(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+class Broadcaster:
+    """
+    Рассылка сообщения всем одобренным пользователям.
+
+    Получатели читаются из базы страницами по ID (в памяти не больше двух
+    страниц), сообщение копируется каждому через очередь отправки с низким
+    приоритетом, так что лимиты Telegram соблюдаются и ответы пользователям
+    не ждут рассылку. Пока одна страница отправляется, читается следующая.
+
+    После каждой отправленной страницы прогресс сохраняется: после перезапуска
+    resume() продолжает с последнего обработанного ID. Заблокировавшие бота
+    отмечаются в базе и в следующие рассылки не попадают. Прогресс виден
+    в одном сообщении у админа, которое периодически редактируется.
+    """
+
+    def __init__(self, bot: Bot, db, sender: MessageSender, store: BroadcastStore = None,
+                 progress_keyboard=None, page_size: int = BROADCAST_PAGE_SIZE,
+                 progress_interval: float = BROADCAST_PROGRESS_INTERVAL):
+        self.bot = bot
+        self.db = db
+        self.sender = sender
+        self.store = store
+        # progress_keyboard(broadcast_id) -> клавиатура под прогрессом идущей рассылки
+        self.progress_keyboard = progress_keyboard
+        self.page_size = page_size
+        self.progress_interval = progress_interval
+        self.active = None
+        self._task = None
+        self._starting = False
+
+    async def _store(self):
+        if self.store is None:
+            self.store = BroadcastStore()
+        return self.store
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self, from_chat_id: int, message_id: int, progress_message):
+        """Запустить рассылку копии сообщения. Возвращает её запись или None, если уже идёт другая"""
+        if self.running or self._starting:
+            return None
+        self._starting = True
+        try:
+            counts = await self.db.get_status_counts()
+            store = await self._store()
+            broadcast = await store.create(
+                from_chat_id=from_chat_id,
+                message_id=message_id,
+                progress_chat_id=progress_message.chat.id,
+                progress_message_id=progress_message.message_id,
+                total=counts["approved"] if counts else 0,
+            )
+        finally:
+            self._starting = False
+        logger.info(f"📣 Рассылка #{broadcast['id']} запущена")
+        self._spawn(broadcast)
+        return broadcast
+
+    async def resume(self):
+        """Продолжить рассылку, прерванную перезапуском (вызывается из on_startup)"""
+        store = await self._store()
+        running = await store.running()
+        if not running:
+            return
+        broadcast = running[-1]
+        # Более старые незавершённые рассылки уже не актуальны
+        for stale in running[:-1]:
+            stale["status"] = "stopped"
+            await store.save(stale)
+        logger.info(f"📣 Продолжение рассылки #{broadcast['id']} после ID {broadcast['last_id']}")
+        self._spawn(broadcast)
+
+    async def stop(self, broadcast_id: int):
+        """Остановить рассылку по просьбе админа. False — такой рассылки сейчас нет"""
+        if not self.running or self.active["id"] != broadcast_id:
+            return False
+        self.active["status"] = "stopped"
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return True
+
+    async def close(self):
+        """Прервать рассылку при завершении бота; она продолжится после запуска"""
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.store is not None:
+            await self.store.close()
+
+    def _spawn(self, broadcast: dict):
+        self.active = broadcast
+        self._task = asyncio.create_task(self._run(broadcast))
+
+    async def _next_page(self, after_id: int):
+        """Страница ID; при ошибке базы повторяем, пока рассылку не остановят.
+        SchemaError (нет миграции) не повторяется — рассылка завершается с ошибкой"""
+        while True:
+            ids = await self.db.get_ids_page("approved", after_id, self.page_size)
+            if ids is not None:
+                return ids
+            logger.warning(f"Рассылка: база не ответила, повтор через {BROADCAST_RETRY_DELAY} сек")
+            await asyncio.sleep(BROADCAST_RETRY_DELAY)
+
+    async def _run(self, broadcast: dict):
+        # Отправляемые страницы: (ids, futures) в порядке ID
+        inflight = deque()
+        last_progress = 0
+        interrupted = False
+        try:
+            ids = await self._next_page(broadcast["last_id"])
+            while ids or inflight:
+                if ids:
+                    inflight.append((ids, [
+                        self.sender.submit(
+                            "copy_message", user_id, PRIORITY_LOW,
+                            from_chat_id=broadcast["from_chat_id"],
+                            message_id=broadcast["message_id"]
+                        )
+                        for user_id in ids
+                    ]))
+                    # Следующая страница читается, пока отправляется текущая
+                    ids = await self._next_page(ids[-1]) if len(ids) == self.page_size else []
+                # Ждём старшую страницу, когда в очереди их уже две или читать больше нечего
+                if len(inflight) >= 2 or not ids:
+                    await self._finish_page(broadcast, *inflight[0])
+                    inflight.popleft()
+                    if time.monotonic() - last_progress >= self.progress_interval:
+                        last_progress = time.monotonic()
+                        await self._show_progress(broadcast)
+            broadcast["status"] = "done"
+        except SchemaError as e:
+            logger.error(f"❌ Рассылка #{broadcast['id']} остановлена: {e}")
+            broadcast["status"] = "failed"
+            broadcast["error"] = str(e)
+            blocked = self._checkpoint_partial(broadcast, inflight)
+            if blocked:
+                await self.db.set_bot_blocked(blocked)
+        except asyncio.CancelledError:
+            # Сохраняем то, что успело уйти, остальное из очереди отправки убираем
+            blocked = self._checkpoint_partial(broadcast, inflight)
+            interrupted = True
+            if blocked:
+                await self.db.set_bot_blocked(blocked)
+            raise
+        finally:
+            if broadcast["status"] != "running":
+                broadcast["finished_at"] = time.time()
+                logger.info(
+                    f"📣 Рассылка #{broadcast['id']}: {broadcast['status']}, "
+                    f"доставлено {broadcast['sent']}, заблокировали бота {broadcast['blocked']}"
+                )
+            await self.store.save(broadcast)
+            await self._show_progress(broadcast, interrupted)
+
+    async def _finish_page(self, broadcast: dict, ids: list, futures: list):
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        blocked = [user_id for user_id, result in zip(ids, results) if isinstance(result, UNREACHABLE_ERRORS)]
+        failed = sum(isinstance(result, BaseException) for result in results) - len(blocked)
+        if blocked:
+            await self.db.set_bot_blocked(blocked)
+        # Счётчики и точка продолжения меняются вместе, когда страница обработана целиком
+        broadcast["sent"] += len(ids) - len(blocked) - failed
+        broadcast["blocked"] += len(blocked)
+        broadcast["failed"] += failed
+        broadcast["last_id"] = ids[-1]
+        await self.store.save(broadcast)
+
+    @staticmethod
+    def _checkpoint_partial(broadcast: dict, inflight):
+        """Сдвинуть точку продолжения по непрерывному началу завершённых отправок.
+        Возвращает ID учтённых в нём заблокировавших бота — их нужно отметить в базе"""
+        blocked = []
+        complete = True
+        for ids, futures in inflight:
+            for user_id, future in zip(ids, futures):
+                if complete and future.done() and not future.cancelled():
+                    if future.exception() is None:
+                        broadcast["sent"] += 1
+                    elif isinstance(future.exception(), UNREACHABLE_ERRORS):
+                        broadcast["blocked"] += 1
+                        blocked.append(user_id)
+                    else:
+                        broadcast["failed"] += 1
+                    broadcast["last_id"] = user_id
+                else:
+                    complete = False
+                    future.cancel()
+        return blocked
+
+    async def _show_progress(self, broadcast: dict, interrupted: bool = False):
+        if interrupted and broadcast["status"] == "running":
+            status = "⏸ Прервана, продолжится после перезапуска"
+        else:
+            status = {
+                "running": "⏳ Идёт отправка...",
+                "done": "✅ Рассылка завершена",
+                "stopped": "⏹ Рассылка остановлена",
+                "failed": f"❌ Рассылка остановлена: {broadcast.get('error')}",
+            }[broadcast["status"]]
+        processed = broadcast["sent"] + broadcast["failed"] + broadcast["blocked"]
+        total = max(broadcast["total"], processed)
+        text = (
+            f"📣 Рассылка #{broadcast['id']}\n\n"
+            f"📬 Обработано: {processed} из ~{total}\n"
+            f"✅ Доставлено: {broadcast['sent']}\n"
+            f"🚫 Заблокировали бота: {broadcast['blocked']}\n"
+            f"⚠️ Ошибок: {broadcast['failed']}\n\n"
+            f"{status}"
+        )
+        keyboard = None
+        if self.progress_keyboard and broadcast["status"] == "running" and not interrupted:
+            keyboard = self.progress_keyboard(broadcast["id"])
+        try:
+            await self.bot.edit_message_text(
+                text,
+                chat_id=broadcast["progress_chat_id"],
+                message_id=broadcast["progress_message_id"],
+                reply_markup=keyboard or InlineKeyboardMarkup()
+            )
+        except TelegramAPIError as e:
+            # В том числе MessageNotModified, если с прошлого раза ничего не изменилось
+            logger.debug(f"Прогресс рассылки не обновлён: {e}")
@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+
+# Маркер отсутствия записи в кэше (None — это закэшированный «пользователь не найден»)
+MISSING = object()
+
+class TTLCache:
+    """Ограниченный LRU-кэш с временем жизни записей"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60, negative_ttl: float = 10):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Вернуть значение или MISSING, если его нет или оно устарело"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Сохранить значение; None кэшируется на negative_ttl"""
+        ttl = self.negative_ttl if value is None else self.ttl
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def update(self, key, changes: dict):
+        """Обновить поля закэшированной записи, не продлевая её жизнь"""
+        item = self._data.get(key)
+        if item is None or item[0] is None:
+            return False
+        item[0].update(changes)
+        return True
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._data)
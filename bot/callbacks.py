@@ -0,0 +1,130 @@
+import inspect
+import logging
+
+from aiogram import types
+from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.handler import SkipHandler
+
+from metrics import current_handler_name
+
+logger = logging.getLogger(__name__)
+
+# Версия формата callback_data: кнопки из старых сообщений с другой версией не исполняются
+CALLBACK_VERSION = "1"
+SEPARATOR = ":"
+# Ограничение Telegram на длину callback_data
+MAX_CALLBACK_BYTES = 64
+
+class Route:
+    """Маршрут: обработчик, типы аргументов и требования к вызывающему"""
+
+    __slots__ = ("handler", "arg_types", "admin", "any_state", "throttle", "wants_user")
+
+    def __init__(self, handler, arg_types, admin, any_state, throttle):
+        self.handler = handler
+        self.arg_types = arg_types
+        self.admin = admin
+        self.any_state = any_state
+        # Группа лимитов ThrottlingMiddleware; None — общая группа "callback"
+        self.throttle = throttle
+        # Запись пользователя (UserContextMiddleware) передаётся, если обработчик её ждёт
+        self.wants_user = "user" in inspect.signature(handler).parameters
+
+class CallbackRouter:
+    """
+    Маршрутизация нажатий инлайн-кнопок по таблице.
+
+    callback_data имеет вид "<версия>:<код>:<арг1>:<арг2>...", код действия — короткая
+    строка. Данные разбираются один раз, обработчик находится поиском в словаре и
+    получает уже приведённые к типам аргументы: handler(callback_query, *args).
+    Если у обработчика есть параметр user, туда придёт запись пользователя из базы.
+
+        @router.route("ap", int, admin=True)
+        async def approve_user(callback_query, user_id): ...
+
+        InlineKeyboardButton("✅", callback_data=router.pack("ap", user_id))
+    """
+
+    def __init__(self, admin_ids):
+        self.admin_ids = admin_ids
+        self.routes = {}
+
+    def route(self, code: str, *arg_types, admin: bool = False, any_state: bool = False,
+              throttle: str = None):
+        """Зарегистрировать обработчик для кода действия.
+
+        throttle — группа лимитов THROTTLE_RULES для этой кнопки; по умолчанию
+        берётся из декоратора @throttle(...) на обработчике, если он есть.
+        """
+        if SEPARATOR in code:
+            raise ValueError(f"Недопустимый код действия: {code!r}")
+
+        def decorator(handler):
+            if code in self.routes:
+                raise ValueError(f"Код действия {code!r} уже занят")
+            group = throttle or getattr(handler, "throttle_group", None)
+            self.routes[code] = Route(handler, arg_types, admin, any_state, group)
+            return handler
+        return decorator
+
+    @staticmethod
+    def pack(code: str, *args) -> str:
+        """Собрать callback_data для кнопки"""
+        parts = [CALLBACK_VERSION, code, *(str(arg) for arg in args)]
+        if any(SEPARATOR in part for part in parts[2:]):
+            raise ValueError(f"Аргумент callback_data содержит '{SEPARATOR}': {args!r}")
+        data = SEPARATOR.join(parts)
+        if len(data.encode()) > MAX_CALLBACK_BYTES:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_BYTES} байт: {data!r}")
+        return data
+
+    def parse(self, data: str):
+        """callback_data -> (Route, аргументы) или None, если разобрать нельзя"""
+        parts = (data or "").split(SEPARATOR)
+        if len(parts) < 2 or parts[0] != CALLBACK_VERSION:
+            return None
+        route = self.routes.get(parts[1])
+        if route is None or len(parts) - 2 != len(route.arg_types):
+            return None
+        try:
+            args = [convert(raw) for convert, raw in zip(route.arg_types, parts[2:])]
+        except (ValueError, TypeError):
+            return None
+        return route, args
+
+    def wants_user(self, callback_query: types.CallbackQuery):
+        """Нужна ли маршруту нажатой кнопки запись пользователя (см. UserContextMiddleware)"""
+        parsed = self.parse(callback_query.data)
+        return parsed is not None and parsed[0].wants_user
+
+    def throttle_group(self, callback_query: types.CallbackQuery):
+        """Группа лимитов маршрута нажатой кнопки или None (см. ThrottlingMiddleware)"""
+        parsed = self.parse(callback_query.data)
+        return parsed[0].throttle if parsed is not None else None
+
+    async def dispatch(self, callback_query: types.CallbackQuery, state: FSMContext, user: dict = None):
+        parsed = self.parse(callback_query.data)
+        if parsed is None:
+            logger.warning(f"Неизвестная кнопка: {callback_query.data!r}")
+            await callback_query.answer("⚠️ Кнопка устарела, откройте меню заново")
+            return
+        route, args = parsed
+
+        # Как у обычных обработчиков aiogram: без any_state маршрут работает только вне диалога
+        if not route.any_state and await state.get_state() is not None:
+            raise SkipHandler()
+
+        # В метриках время нажатия учитывается по имени обработчика маршрута
+        current_handler_name.set(route.handler.__name__)
+        if route.admin and callback_query.from_user.id not in self.admin_ids:
+            await callback_query.answer("❌ Нет прав!")
+            return
+
+        if route.wants_user:
+            await route.handler(callback_query, *args, user=user)
+        else:
+            await route.handler(callback_query, *args)
+
+    def register(self, dp):
+        """Подключить маршрутизатор к диспетчеру одним обработчиком"""
+        dp.register_callback_query_handler(self.dispatch, state="*")
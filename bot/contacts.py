@@ -0,0 +1,97 @@
+import os
+import re
+
+from search_index import normalize_digits
+
+# Код страны для номеров без него: 8 999 ... и 999 ... считаются российскими
+CONTACTS_DEFAULT_COUNTRY = os.getenv("CONTACTS_DEFAULT_COUNTRY", "7")
+# Номеров за один импорт и размер файла телефонной книги (байт)
+CONTACTS_IMPORT_LIMIT = int(os.getenv("CONTACTS_IMPORT_LIMIT", "1000"))
+CONTACTS_FILE_MAX_BYTES = int(os.getenv("CONTACTS_FILE_MAX_BYTES", str(1024 * 1024)))
+
+# Похожее на номер: цифры с пробелами, скобками, точками и дефисами
+_PHONE = re.compile(r"\+?\d[\d\s().\-]{5,}\d")
+_DAY = r"(?:0?[1-9]|[12]\d|3[01])"
+_MONTH = r"(?:0?[1-9]|1[0-2])"
+# Дата с годом из четырёх цифр (2024-01-01, 01.02.2024): в тексте вырезается
+# до поиска номеров, иначе сливается с соседним номером или сама становится им
+_DATE = re.compile(rf"(?<![\d+])(?:\d{{4}}[-./]{_MONTH}[-./]{_DAY}|{_DAY}[-./]{_DAY}[-./]\d{{4}})(?!\d)")
+# Начало как у даты, в том числе с годом из двух цифр (1/2/24)
+_DATE_START = re.compile(rf"(?:\d{{4}}|{_DAY})[-./]{_DAY}[-./]\d{{2}}")
+# Без + и без префикса (00, 8) номер должен быть полным — с кодом страны
+BARE_MIN_DIGITS = 11
+_NAME_STRIP = " \t,;:-—|"
+
+def normalize_phone(phone: str, default_country: str = CONTACTS_DEFAULT_COUNTRY):
+    """Номер в формате E.164 (+79991234567) или None, если это не номер.
+
+    Номер без + принимается с международным (00) или российским (8) префиксом,
+    из 10 цифр (добавляется код страны по умолчанию) или из BARE_MIN_DIGITS цифр
+    и больше, но не в виде даты: 2024-01-01 — не +20240101.
+    """
+    raw = (phone or "").strip()
+    digits = normalize_digits(raw)
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        # Международный префикс: 00 49 ... -> +49 ...
+        digits = digits[2:]
+    elif _DATE_START.match(raw):
+        return None
+    elif default_country == "7" and len(digits) == 11 and digits.startswith("8"):
+        # Российский междугородний префикс: 8 999 ... -> +7 999 ...
+        digits = "7" + digits[1:]
+    elif len(digits) == 10 and default_country:
+        digits = default_country + digits
+    elif len(digits) < BARE_MIN_DIGITS:
+        return None
+    # E.164: до 15 цифр, код страны не начинается с нуля
+    if not 8 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return "+" + digits
+
+def parse_contacts(text: str):
+    """Разобрать список номеров (по одному на строке, можно с именем) или файл vCard.
+
+    Возвращает (контакты, число неразобранных номеров); контакт —
+    {"phone_number": E.164, "name": имя или None}, повторы номеров убраны.
+    """
+    contacts = {}
+    invalid = 0
+    in_card = False
+    card_name, card_phones = None, []
+
+    def add(phone, name):
+        nonlocal invalid
+        normalized = normalize_phone(phone)
+        if normalized is None:
+            invalid += 1
+        elif normalized not in contacts:
+            contacts[normalized] = {"phone_number": normalized, "name": name or None}
+
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        prop, _, value = line.partition(":")
+        # "item1.TEL;type=CELL" -> "TEL"
+        name = prop.split(";")[0].split(".")[-1].upper()
+        if name == "BEGIN" and value.strip().upper() == "VCARD":
+            in_card, card_name, card_phones = True, None, []
+        elif name == "END" and value.strip().upper() == "VCARD":
+            # FN может идти после TEL — номера добавляются в конце карточки
+            in_card = False
+            for phone in card_phones:
+                add(phone, card_name)
+        elif in_card:
+            if name == "FN":
+                card_name = value.strip()
+            elif name == "TEL":
+                card_phones.append(value)
+        else:
+            line = _DATE.sub(" ", line)
+            phones = _PHONE.findall(line)
+            rest = _PHONE.sub(" ", line).strip(_NAME_STRIP)
+            for phone in phones:
+                add(phone, " ".join(rest.split()))
+    return list(contacts.values()), invalid
@@ -1,138 +1,827 @@
 import os
+import time
 import logging
-from supabase import create_client, Client
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from cache import TTLCache, MISSING
+from local_store import LocalStore
+from search_index import parse_search_query
+from contacts import normalize_phone
+from metrics import timed_db, count_db_error, record_startup_phase, DB_UP
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Размер пула потоков для запросов к Supabase и таймаут одного запроса (сек)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))
+
+# Кэш пользователей: размер, время жизни записи и время жизни «не найден» (сек)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", "5"))
+
+# Локальное хранилище SQLite: запасной вариант без Supabase и реплика для чтения
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "users.sqlite3")
+LOCAL_REPLICA = os.getenv("LOCAL_REPLICA", "0") == "1"
+# Сколько секунд строка реплики отдаётся без запроса к Supabase: изменения,
+# сделанные другими экземплярами бота, видны не позже чем через это время
+REPLICA_MAX_AGE = float(os.getenv("REPLICA_MAX_AGE", "60"))
+
+# Период фоновой проверки связи с Supabase (сек)
+DB_HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "60"))
+
+# Номеров в одном запросе сопоставления к Supabase: список уходит в URL,
+# а прокси обычно не принимают строку запроса длиннее 8 КБ
+MATCH_BATCH = int(os.getenv("CONTACTS_MATCH_BATCH", "200"))
+
+USER_STATUSES = ("pending", "approved", "rejected", "banned")
+
+# Код ошибки PostgreSQL «колонки не существует»
+UNDEFINED_COLUMN = "42703"
+
+# Колонки, которые нужны спискам в админ-панели
+USER_LIST_COLUMNS = ("telegram_id", "full_name", "phone_number", "status", "created_at")
+# Колонки выгрузки пользователей (/export)
+USER_EXPORT_COLUMNS = ("telegram_id", "full_name", "username", "phone_number", "status", "created_at")
+
+class SchemaError(Exception):
+    """В базе нет колонки, нужной запросу: повтор не поможет, нужна миграция из README"""
+
 class Database:
+    """
+    Доступ к пользователям: Supabase и/или локальное хранилище SQLite.
+
+    Конструктор не ходит в сеть: клиент Supabase создаёт и связь проверяет
+    фоновая задача start() — бот принимает обновления сразу, а до готовности
+    клиента запросы к базе недоступны (get_user отвечает из реплики, если она есть).
+    """
+
     def __init__(self):
         url = os.getenv("SUPABASE_URL")
         key = os.getenv("SUPABASE_KEY")
         
-        logger.info(f"🔗 Подключение к Supabase...")
+        # Клиент Supabase синхронный, поэтому запросы выполняются в ограниченном
+        # пуле потоков. Все потоки делят один httpx-клиент с keep-alive соединениями.
+        self._executor = ThreadPoolExecutor(
+            max_workers=DB_POOL_SIZE,
+            thread_name_prefix="supabase"
+        )
+        self.user_cache = TTLCache(
+            maxsize=USER_CACHE_SIZE,
+            ttl=USER_CACHE_TTL,
+            negative_ttl=USER_CACHE_NEGATIVE_TTL
+        )
+        # Локальное хранилище: одно соединение SQLite в своём потоке
+        self.local = None
+        self._local_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="local-store"
+        )
+        
+        self._credentials = (url, key) if url and key else None
+        self._client = None
+        # None — связь ещё не проверялась
+        self.healthy = None
+        self._health_task = None
+        # Событие завершения первой попытки подключения (создаётся в start)
+        self._connected = None
+        # Колонка поиска по имени; full_name, если миграции full_name_search нет
+        self._name_search_column = "full_name_search"
+        # telegram_id -> задача чтения, которую делят одновременные get_user
+        self._inflight = {}
         
-        if not url or not key:
+        if not self._credentials:
             logger.error("❌ Отсутствуют переменные Supabase!")
-            self.supabase = None
-            self.local_users = {}
+            self._open_local()
+        elif LOCAL_REPLICA:
+            self._open_local()
+    
+    @property
+    def supabase(self):
+        """Клиент Supabase или None, пока он не создан в start() или если Supabase не используется"""
+        return self._client
+    
+    def _create_client(self):
+        """Создать клиент Supabase (в пуле потоков: импорт supabase занимает заметное время)"""
+        from supabase import create_client
+        from supabase.lib.client_options import ClientOptions
+        return create_client(
+            *self._credentials,
+            options=ClientOptions(postgrest_client_timeout=DB_TIMEOUT)
+        )
+    
+    def _use_local_only(self):
+        """Перейти на локальное хранилище (Supabase недоступен при запуске)"""
+        logger.info("📦 Используется локальное хранилище")
+        self._credentials = None
+        self._client = None
+        if self.local is None:
+            self._open_local()
+    
+    async def start(self):
+        """Запустить создание клиента и фоновую проверку связи; первая проверка заодно прогревает соединение"""
+        if self._health_task is None and self._credentials:
+            self._connected = asyncio.Event()
+            self._health_task = asyncio.create_task(self._health_loop())
+    
+    async def wait_connected(self):
+        """Дождаться первой попытки подключения к Supabase (для утилит и тестов)"""
+        if self._connected is not None:
+            await self._connected.wait()
+    
+    async def _health_loop(self):
+        started = time.perf_counter()
+        logger.info("🔗 Подключение к Supabase...")
+        # Создание клиента (импорт модулей) — в пуле, чтобы не задерживать event loop.
+        # До его готовности запросы идут через _offline и get_user отвечает из реплики
+        loop = asyncio.get_running_loop()
+        try:
+            self._client = await loop.run_in_executor(self._executor, self._create_client)
+            count = await self.check_health()
+        except Exception as e:
+            logger.error(f"❌ Ошибка Supabase: {e}")
+            count = None
+        record_startup_phase("database", time.perf_counter() - started)
+        if count is None:
+            self._use_local_only()
+            self._connected.set()
             return
+        self._connected.set()
+        logger.info(f"✅ Supabase подключен! Записей: {count}")
         
+        while True:
+            await asyncio.sleep(DB_HEALTH_INTERVAL)
+            was_healthy = self.healthy
+            await self.check_health()
+            if self.healthy != was_healthy:
+                logger.info("✅ Связь с Supabase восстановлена" if self.healthy else "⚠️ Supabase не отвечает")
+    
+    @timed_db
+    async def check_health(self):
+        """Проверочный запрос к Supabase. Возвращает число записей или None"""
+        client = self.supabase
+        if client is None:
+            return None
         try:
-            self.supabase: Client = create_client(url, key)
-            # Тестовый запрос
-            test = self.supabase.table("users").select("count", count="exact").execute()
-            logger.info(f"✅ Supabase подключен! Записей: {test.count}")
-            self.local_users = {}
+            response = await self._execute(
+                client.table("users").select("count", count="exact").limit(0)
+            )
+            self.healthy = True
+            DB_UP.set(1)
+            return response.count
         except Exception as e:
             logger.error(f"❌ Ошибка Supabase: {e}")
-            logger.info("📦 Используется временное хранилище")
-            self.supabase = None
-            self.local_users = {}
+            self.healthy = False
+            DB_UP.set(0)
+            return None
+    
+    def _open_local(self):
+        self.local = LocalStore(LOCAL_DB_PATH)
+        logger.info(f"💾 Локальное хранилище: {LOCAL_DB_PATH}")
+    
+    async def _local(self, func, *args):
+        """Выполнить операцию локального хранилища в его потоке"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._local_executor, func, *args)
+        except Exception:
+            count_db_error()
+            raise
+    
+    async def _offline(self, name: str, *args):
+        """Запрос без Supabase: метод name локального хранилища.
+        
+        Пока клиент Supabase создаётся, база недоступна: реплика неполная,
+        а записи в неё разошлись бы с Supabase.
+        """
+        if self._credentials:
+            raise ConnectionError("Supabase ещё подключается")
+        return await self._local(getattr(self.local, name), *args)
     
+    async def _replicate(self, rows):
+        """Сохранить строки из Supabase в локальную реплику"""
+        if self.local and rows:
+            try:
+                await self._local(self.local.upsert_users, rows)
+            except Exception as e:
+                logger.error(f"Ошибка записи в локальную реплику: {e}")
+    
+    async def _execute(self, query):
+        """Выполнить запрос Supabase в пуле потоков, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, query.execute),
+                timeout=DB_TIMEOUT
+            )
+        except Exception:
+            count_db_error()
+            raise
+    
+    async def close(self):
+        """Дождаться завершения запросов и освободить пулы потоков"""
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        self._executor.shutdown(wait=True)
+        if self.local:
+            await self._local(self.local.close)
+        self._local_executor.shutdown(wait=True)
+    
+    @timed_db
     async def create_user(self, telegram_id: int, phone: str, full_name: str, username: str = None):
-        """Добавить нового пользователя"""
+        """Добавить нового пользователя одним запросом.
+        
+        Вставка с ignore-duplicates по уникальному telegram_id: повторный номер
+        (двойное нажатие, другой экземпляр бота) строку не трогает.
+        Возвращает True — строка новая, False — пользователь уже был, None — ошибка.
+        """
+        data = {
+            "telegram_id": telegram_id,
+            "phone_number": phone,
+            "full_name": full_name,
+            "username": username,
+            "status": "pending"
+        }
         try:
-            # Проверяем есть ли уже
-            existing = await self.get_user(telegram_id)
-            if existing:
-                return False, "Заявка уже отправлена"
-            
             if self.supabase:
-                data = {
-                    "telegram_id": telegram_id,
-                    "phone_number": phone,
-                    "full_name": full_name,
-                    "username": username,
-                    "status": "pending"
-                }
-                response = self.supabase.table("users").insert(data).execute()
-                return True, "Заявка отправлена"
-            else:
-                # Временное хранилище
-                self.local_users[telegram_id] = {
-                    "telegram_id": telegram_id,
-                    "phone_number": phone,
-                    "full_name": full_name,
-                    "username": username,
-                    "status": "pending"
-                }
-                return True, "Заявка отправлена (временное хранилище)"
-                
-        except Exception as e:
-            return False, f"Ошибка: {str(e)}"
+                response = await self._execute(
+                    self.supabase.table("users").upsert(
+                        data, ignore_duplicates=True, on_conflict="telegram_id"
+                    )
+                )
+                # При конфликте сервер ничего не возвращает
+                created = bool(response.data)
+                if created:
+                    self._remember(telegram_id, response.data[0])
+                    await self._replicate(response.data)
+                else:
+                    self._forget(telegram_id)
+            else:
+                created = await self._offline("insert_user", data)
+                self._forget(telegram_id)
+            return created
+        except Exception as e:
+            logger.error(f"Ошибка добавления пользователя {telegram_id}: {e}")
+            self._forget(telegram_id)
+            return None
     
+    @timed_db
     async def get_user(self, telegram_id: int):
-        """Получить пользователя по ID"""
+        """Получить пользователя по ID.
+        
+        Одновременные запросы одного и того же ID ждут один общий запрос к базе.
+        """
+        cached = self.user_cache.get(telegram_id)
+        if cached is not MISSING:
+            return cached
+        
+        pending = self._inflight.get(telegram_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load_user(telegram_id))
+            self._inflight[telegram_id] = pending
+            pending.add_done_callback(functools.partial(self._loaded, telegram_id))
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(pending)
+    
+    async def _load_user(self, telegram_id: int):
+        if self.supabase and self.local:
+            # Свежая строка реплики — без запроса к Supabase и без кэша в памяти,
+            # чтобы срок устаревания оставался REPLICA_MAX_AGE
+            try:
+                user = await self._local(self.local.get_fresh_user, telegram_id, REPLICA_MAX_AGE)
+            except Exception as e:
+                logger.error(f"Ошибка чтения локальной реплики: {e}")
+                user = None
+            if user is not None:
+                return user
         try:
             if self.supabase:
-                response = self.supabase.table("users")\
-                    .select("*")\
-                    .eq("telegram_id", telegram_id)\
-                    .execute()
-                return response.data[0] if response.data else None
+                response = await self._execute(
+                    self.supabase.table("users")
+                        .select("*")
+                        .eq("telegram_id", telegram_id)
+                )
+                user = response.data[0] if response.data else None
+                await self._replicate(response.data)
             else:
-                return self.local_users.get(telegram_id)
+                user = await self._offline("get_user", telegram_id)
         except Exception as e:
             logger.error(f"Ошибка получения пользователя: {e}")
+            if self._credentials and self.local:
+                # Supabase недоступен или ещё подключается — отвечаем из реплики, но не кэшируем
+                return await self._local(self.local.get_user, telegram_id)
             return None
+        
+        # Если пока шёл запрос, строку изменили, прочитанное значение уже устарело
+        if self._inflight.get(telegram_id) is asyncio.current_task():
+            self.user_cache.set(telegram_id, user)
+        return user
     
+    def _loaded(self, telegram_id: int, future):
+        if self._inflight.get(telegram_id) is future:
+            del self._inflight[telegram_id]
+    
+    def _remember(self, telegram_id: int, user: dict):
+        """Записать в кэш строку, полученную после изменения"""
+        self._inflight.pop(telegram_id, None)
+        self.user_cache.set(telegram_id, user)
+    
+    def _forget(self, telegram_id: int):
+        """Сбросить кэш и свежесть строки реплики, если состояние строки неизвестно"""
+        self._inflight.pop(telegram_id, None)
+        self.user_cache.invalidate(telegram_id)
+        if self._credentials and self.local:
+            # Поток локального хранилища один, поэтому следующее чтение реплики
+            # выполнится уже после этой отметки
+            try:
+                self._local_executor.submit(self.local.mark_stale, telegram_id)
+            except RuntimeError:
+                # Пул уже остановлен (завершение работы)
+                pass
+    
+    @timed_db
     async def update_user_status(self, telegram_id: int, status: str):
-        """Обновить статус пользователя"""
+        """Обновить статус пользователя. Возвращает обновлённую строку или None"""
         try:
             if self.supabase:
-                response = self.supabase.table("users")\
-                    .update({"status": status})\
-                    .eq("telegram_id", telegram_id)\
-                    .execute()
-                return True
+                response = await self._execute(
+                    self.supabase.table("users")
+                        .update({"status": status})
+                        .eq("telegram_id", telegram_id)
+                )
+                user = response.data[0] if response.data else None
+                await self._replicate(response.data)
             else:
-                if telegram_id in self.local_users:
-                    self.local_users[telegram_id]["status"] = status
-                    return True
-                return False
+                user = await self._offline("update_status", telegram_id, status)
         except Exception as e:
             logger.error(f"Ошибка обновления статуса: {e}")
-            return False
+            # Состояние строки неизвестно — сбрасываем кэш
+            self._forget(telegram_id)
+            return None
+        
+        if user:
+            self._remember(telegram_id, user)
+        else:
+            self._forget(telegram_id)
+        return user
+    
+    @timed_db
+    async def get_pending_ids(self, limit: int, phone_prefix: str = None):
+        """ID самых старых заявок, необязательно только с номером на phone_prefix"""
+        try:
+            if self.supabase:
+                query = self.supabase.table("users")\
+                    .select("telegram_id")\
+                    .eq("status", "pending")
+                query.params = query.params.set("order", "created_at.asc,telegram_id.asc")
+                if phone_prefix:
+                    query.params = query.params.add(
+                        "or",
+                        f"(phone_number.like.{phone_prefix}*,phone_number.like.+{phone_prefix}*)"
+                    )
+                response = await self._execute(query.limit(limit))
+                return [row["telegram_id"] for row in response.data]
+            else:
+                return await self._offline("get_pending_ids", limit, phone_prefix)
+        except Exception as e:
+            logger.error(f"Ошибка получения заявок: {e}")
+            return []
+    
+    @timed_db
+    async def change_user_status(self, telegram_id: int, status: str):
+        """Сменить статус и узнать прежний. Возвращает (прежний статус, строка) или (None, None).
+        
+        На Supabase — один вызов функции change_user_status (см. README): UPDATE ... RETURNING
+        со старым значением из той же строки под блокировкой, без отдельного чтения.
+        """
+        try:
+            if self.supabase:
+                response = await self._execute(
+                    self.supabase.rpc("change_user_status", {"p_telegram_id": telegram_id, "p_status": status})
+                )
+                previous, user = None, None
+                if response.data:
+                    previous = response.data[0]["previous_status"]
+                    user = response.data[0]["user"]
+                    await self._replicate([user])
+            else:
+                previous, user = await self._offline("change_status", telegram_id, status)
+        except Exception as e:
+            logger.error(f"Ошибка обновления статуса: {e}")
+            self._forget(telegram_id)
+            return None, None
+        
+        if user:
+            self._remember(telegram_id, user)
+        else:
+            self._forget(telegram_id)
+        return previous, user
     
-    async def get_pending_users(self):
-        """Получить всех пользователей со статусом pending"""
+    @timed_db
+    async def bulk_update_status(self, telegram_ids: list, status: str, from_status: str = None):
+        """Обновить статус многим пользователям одним запросом.
+        from_status — менять только строки с этим статусом (прежний статус известен точно).
+        Возвращает список обновлённых строк."""
+        if not telegram_ids:
+            return []
         try:
             if self.supabase:
-                response = self.supabase.table("users")\
+                query = self.supabase.table("users")\
+                    .update({"status": status})\
+                    .in_("telegram_id", telegram_ids)
+                if from_status:
+                    query = query.eq("status", from_status)
+                response = await self._execute(query)
+                users = response.data
+                await self._replicate(users)
+            else:
+                users = await self._offline("bulk_update_status", telegram_ids, status, from_status)
+        except Exception as e:
+            logger.error(f"Ошибка массового обновления статуса: {e}")
+            for telegram_id in telegram_ids:
+                self._forget(telegram_id)
+            return []
+        
+        for user in users:
+            self._remember(user["telegram_id"], user)
+        return users
+    
+    @timed_db
+    async def get_pending_users(self, limit: int = None):
+        """Получить пользователей со статусом pending (не больше limit)"""
+        try:
+            if self.supabase:
+                query = self.supabase.table("users")\
                     .select("*")\
-                    .eq("status", "pending")\
-                    .execute()
+                    .eq("status", "pending")
+                if limit is not None:
+                    query = query.limit(limit)
+                response = await self._execute(query)
                 return response.data
             else:
-                return [u for u in self.local_users.values() if u.get("status") == "pending"]
+                return await self._offline("get_users", "pending", limit)
         except Exception as e:
             logger.error(f"Ошибка получения pending пользователей: {e}")
             return []
     
-    async def get_all_users(self):
-        """Получить всех пользователей"""
+    @timed_db
+    async def get_all_users(self, limit: int = None):
+        """Получить всех пользователей (не больше limit)"""
         try:
             if self.supabase:
-                response = self.supabase.table("users")\
+                query = self.supabase.table("users")\
                     .select("*")\
-                    .order("created_at", desc=True)\
-                    .execute()
+                    .order("created_at", desc=True)
+                if limit is not None:
+                    query = query.limit(limit)
+                response = await self._execute(query)
                 return response.data
             else:
-                return list(self.local_users.values())
+                return await self._offline("get_users", None, limit)
         except Exception as e:
             logger.error(f"Ошибка получения всех пользователей: {e}")
             return []
     
+    @timed_db
+    async def get_users_page(self, status: str = None, limit: int = 15,
+                             cursor: tuple = None, backward: bool = False):
+        """Страница пользователей от новых к старым (keyset-пагинация).
+        
+        cursor — (created_at, telegram_id) крайней строки предыдущей страницы.
+        backward=False — строки старше курсора, backward=True — новее.
+        Возвращает (rows, has_more), где has_more — есть ли строки дальше в том же направлении.
+        """
+        try:
+            if self.supabase:
+                # Для движения назад идём по возрастанию и затем разворачиваем
+                direction = "asc" if backward else "desc"
+                query = self.supabase.table("users").select(",".join(USER_LIST_COLUMNS))
+                query.params = query.params.set(
+                    "order", f"created_at.{direction},telegram_id.{direction}"
+                )
+                if status:
+                    query = query.eq("status", status)
+                if cursor:
+                    created_at, telegram_id = cursor
+                    op = "gt" if backward else "lt"
+                    query.params = query.params.add(
+                        "or",
+                        f'(created_at.{op}."{created_at}",'
+                        f'and(created_at.eq."{created_at}",telegram_id.{op}.{telegram_id}))'
+                    )
+                response = await self._execute(query.limit(limit + 1))
+                rows = response.data
+            else:
+                rows = await self._offline(
+                    "get_users_page",
+                    USER_LIST_COLUMNS, status, limit + 1, cursor, backward
+                )
+            
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if backward:
+                rows.reverse()
+            return rows, has_more
+        except Exception as e:
+            logger.error(f"Ошибка получения страницы пользователей: {e}")
+            return [], False
+    
+    @timed_db
+    async def get_ids_page(self, status: str, after_id: int = 0, limit: int = 500):
+        """ID пользователей со статусом status по возрастанию, начиная после after_id.
+
+        Keyset-пагинация по первичному ключу: страницы можно читать по одной,
+        а последний ID страницы служит точкой продолжения. Заблокировавшие бота
+        пропускаются. Возвращает список ID или None при ошибке базы;
+        если в users нет колонки bot_blocked (миграция не выполнена) — SchemaError.
+        """
+        try:
+            if self.supabase:
+                response = await self._execute(
+                    self.supabase.table("users")
+                        .select("telegram_id")
+                        .eq("status", status)
+                        .gt("telegram_id", after_id)
+                        .not_.is_("bot_blocked", "true")
+                        .order("telegram_id")
+                        .limit(limit)
+                )
+                return [row["telegram_id"] for row in response.data]
+            else:
+                return await self._offline("get_ids_page", status, after_id, limit)
+        except Exception as e:
+            if getattr(e, "code", None) == UNDEFINED_COLUMN:
+                raise SchemaError(
+                    f"в таблице users нет колонки bot_blocked, выполните миграцию из README "
+                    f"({getattr(e, 'message', e)})"
+                ) from e
+            logger.error(f"Ошибка получения страницы ID: {e}")
+            return None
+
+    @timed_db
+    async def get_users_after(self, after_id: int = 0, limit: int = 1000, status: str = None,
+                              columns=USER_EXPORT_COLUMNS):
+        """Строки пользователей по возрастанию telegram_id, начиная после after_id.
+
+        Как get_ids_page, но с колонками columns и по всем статусам, если status не задан.
+        Возвращает список строк или None при ошибке базы.
+        """
+        try:
+            if self.supabase:
+                query = self.supabase.table("users")\
+                    .select(",".join(columns))\
+                    .gt("telegram_id", after_id)
+                if status:
+                    query = query.eq("status", status)
+                response = await self._execute(query.order("telegram_id").limit(limit))
+                return response.data
+            else:
+                return await self._offline("get_users_after", columns, after_id, limit, status)
+        except Exception as e:
+            logger.error(f"Ошибка получения страницы пользователей: {e}")
+            return None
+
+    @timed_db
+    async def search_users(self, query: str, after_id: int = 0, limit: int = 5):
+        """Поиск для админ-панели: "@ник" — по началу username, цифры — по началу
+        номера, иначе — по подстроке имени. Результаты по возрастанию telegram_id
+        после after_id. Возвращает (rows, has_more); при ошибке — ([], False).
+        """
+        kind, value = parse_search_query(query)
+        if not value:
+            return [], False
+        try:
+            if self.supabase:
+                rows = await self._search_supabase(kind, value, after_id, limit + 1)
+            else:
+                rows = await self._offline("search_users", kind, value, after_id, limit + 1)
+        except Exception as e:
+            logger.error(f"Ошибка поиска пользователей: {e}")
+            return [], False
+        return rows[:limit], len(rows) > limit
+
+    async def _search_supabase(self, kind: str, value: str, after_id: int, limit: int):
+        # Индексы на стороне Postgres — см. README (text_pattern_ops и pg_trgm)
+        query = self.supabase.table("users").select("*").gt("telegram_id", after_id)
+        pattern = value.replace("*", "").replace("%", "").replace("_", "\\_")
+        if kind == "phone":
+            query.params = query.params.add(
+                "or", f"(phone_number.like.{pattern}*,phone_number.like.+{pattern}*)"
+            )
+        elif kind == "username":
+            query = query.ilike("username", f"{pattern}*")
+        else:
+            # Имя с «е» вместо «ё» (генерируемая колонка, см. README):
+            # запрос уже нормализован, иначе «Алена» не находит «Алёна»
+            query = query.ilike(self._name_search_column, f"*{pattern}*")
+        try:
+            response = await self._execute(query.order("telegram_id").limit(limit))
+        except Exception as e:
+            if kind != "name" or self._name_search_column == "full_name" \
+                    or getattr(e, "code", None) != UNDEFINED_COLUMN:
+                raise
+            logger.warning(
+                "⚠️ В users нет колонки full_name_search (миграция из README): "
+                "поиск по имени различает «е» и «ё»"
+            )
+            self._name_search_column = "full_name"
+            return await self._search_supabase(kind, value, after_id, limit)
+        return response.data
+
+    @timed_db
+    async def set_bot_blocked(self, telegram_ids: list, blocked: bool = True):
+        """Отметить пользователей, заблокировавших бота (blocked=False — снять отметку).
+        Возвращает число обновлённых строк."""
+        if not telegram_ids:
+            return 0
+        try:
+            if self.supabase:
+                response = await self._execute(
+                    self.supabase.table("users")
+                        .update({"bot_blocked": blocked})
+                        .in_("telegram_id", telegram_ids)
+                )
+                users = response.data
+                await self._replicate(users)
+            else:
+                users = await self._offline("set_bot_blocked", telegram_ids, blocked)
+        except Exception as e:
+            logger.error(f"Ошибка отметки заблокировавших бота: {e}")
+            for telegram_id in telegram_ids:
+                self._forget(telegram_id)
+            return 0
+
+        for user in users:
+            self._remember(user["telegram_id"], user)
+        return len(users)
+
+    @timed_db
+    async def match_phones(self, phones: list):
+        """Зарегистрированные пользователи по номерам в формате E.164: {номер: строка}.
+        
+        Номера сверяются пачками через in_ по индексу на phone_number,
+        а не запросом на каждый номер. При ошибке — None.
+        """
+        phones = list(dict.fromkeys(phones))
+        if not phones:
+            return {}
+        try:
+            if self.supabase:
+                # Старые строки хранят номер без «+», ищем обе записи
+                chunks = [phones[i:i + MATCH_BATCH] for i in range(0, len(phones), MATCH_BATCH)]
+                responses = await asyncio.gather(*(
+                    self._execute(
+                        self.supabase.table("users")
+                            .select("*")
+                            .in_("phone_number", [*chunk, *(phone.lstrip("+") for phone in chunk)])
+                    )
+                    for chunk in chunks
+                ))
+                users = [user for response in responses for user in response.data]
+            else:
+                users = await self._offline("match_phones", phones)
+        except Exception as e:
+            logger.error(f"Ошибка сопоставления номеров: {e}")
+            return None
+        return {normalize_phone(user.get("phone_number")): user for user in users}
+
+    @timed_db
+    async def add_contacts(self, owner_id: int, contacts: list):
+        """Добавить контакты пользователя одним запросом, уже сохранённые номера пропускаются.
+        Возвращает число новых контактов или None при ошибке."""
+        if not contacts:
+            return 0
+        try:
+            if self.supabase:
+                rows = [
+                    {"owner_id": owner_id, "phone_number": c["phone_number"], "name": c.get("name")}
+                    for c in contacts
+                ]
+                response = await self._execute(
+                    self.supabase.table("contacts").upsert(
+                        rows, ignore_duplicates=True, on_conflict="owner_id,phone_number"
+                    )
+                )
+                return len(response.data)
+            return await self._offline("insert_contacts", owner_id, contacts)
+        except Exception as e:
+            logger.error(f"Ошибка добавления контактов {owner_id}: {e}")
+            return None
+
+    @timed_db
+    async def get_contacts_page(self, owner_id: int, after_phone: str = "", limit: int = 10):
+        """Контакты пользователя по возрастанию номера.
+        
+        after_phone — номер последнего контакта предыдущей страницы.
+        Возвращает (rows, has_more); при ошибке — ([], False).
+        """
+        try:
+            if self.supabase:
+                query = self.supabase.table("contacts")\
+                    .select("*")\
+                    .eq("owner_id", owner_id)
+                if after_phone:
+                    query = query.gt("phone_number", after_phone)
+                response = await self._execute(query.order("phone_number").limit(limit + 1))
+                rows = response.data
+            else:
+                rows = await self._offline("get_contacts_page", owner_id, after_phone or "", limit + 1)
+        except Exception as e:
+            logger.error(f"Ошибка получения контактов {owner_id}: {e}")
+            return [], False
+        return rows[:limit], len(rows) > limit
+
+    @timed_db
+    async def delete_contact(self, owner_id: int, phone: str):
+        """Удалить контакт. Возвращает True, если он был"""
+        try:
+            if self.supabase:
+                response = await self._execute(
+                    self.supabase.table("contacts")
+                        .delete()
+                        .eq("owner_id", owner_id)
+                        .eq("phone_number", phone)
+                )
+                return bool(response.data)
+            return await self._offline("delete_contact", owner_id, phone)
+        except Exception as e:
+            logger.error(f"Ошибка удаления контакта {owner_id}: {e}")
+            return False
+
+    @timed_db
+    async def insert_audit_entries(self, entries: list):
+        """Добавить пачку записей журнала модерации одним запросом. Возвращает успех"""
+        if not entries:
+            return True
+        try:
+            if self.supabase:
+                await self._execute(
+                    self.supabase.table("moderation_log").insert(entries, returning="minimal")
+                )
+            else:
+                await self._offline("insert_audit", entries)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка записи журнала модерации: {e}")
+            return False
+
+    @timed_db
+    async def get_audit_page(self, telegram_id: int, limit: int = 10, before_id: int = None):
+        """История модерации пользователя от новых записей к старым.
+        
+        before_id — id последней записи предыдущей страницы.
+        Возвращает (rows, has_more); при ошибке — ([], False).
+        """
+        try:
+            if self.supabase:
+                query = self.supabase.table("moderation_log")\
+                    .select("*")\
+                    .eq("telegram_id", telegram_id)
+                if before_id:
+                    query = query.lt("id", before_id)
+                response = await self._execute(query.order("id", desc=True).limit(limit + 1))
+                rows = response.data
+            else:
+                rows = await self._offline("get_audit_page", telegram_id, limit + 1, before_id)
+        except Exception as e:
+            logger.error(f"Ошибка получения журнала модерации: {e}")
+            return [], False
+        return rows[:limit], len(rows) > limit
+
+    @timed_db
+    async def get_status_counts(self):
+        """Количество пользователей по статусам: {"total": N, "pending": N, ...}"""
+        try:
+            if self.supabase:
+                # Один запрос: функция user_status_counts (см. README) считает
+                # GROUP BY status на сервере, строк пользователей в ответе нет
+                response = await self._execute(self.supabase.rpc("user_status_counts", {}))
+                by_status = {row["status"]: row["total"] for row in response.data}
+                counts = {status: by_status.get(status, 0) for status in USER_STATUSES}
+                counts["total"] = sum(by_status.values())
+            else:
+                local_counts = await self._offline("status_counts")
+                counts = {status: local_counts.get(status, 0) for status in USER_STATUSES}
+                counts["total"] = sum(local_counts.values())
+            return counts
+        except Exception as e:
+            logger.error(f"Ошибка подсчёта пользователей: {e}")
+            return None
+    
+    @timed_db
     async def ban_user(self, telegram_id: int):
-        """Забанить пользователя"""
+        """Забанить пользователя. Возвращает обновлённую строку или None"""
         return await self.update_user_status(telegram_id, "banned")
     
+    @timed_db
     async def unban_user(self, telegram_id: int):
-        """Разбанить пользователя"""
+        """Разбанить пользователя. Возвращает обновлённую строку или None"""
         return await self.update_user_status(telegram_id, "approved")
 
 db = Database()
@@ -0,0 +1,84 @@
+import os
+import csv
+import gzip
+import json
+import time
+import asyncio
+import logging
+
+from database import USER_EXPORT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Строк в одной странице выгрузки (Supabase по умолчанию отдаёт не больше 1000)
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+EXPORT_FORMATS = ("csv", "jsonl")
+
+class UserExport:
+    """
+    Выгрузка пользователей в сжатый gzip файл CSV или JSONL.
+
+    Строки читаются из базы страницами по telegram_id и сразу дописываются
+    в файл: в памяти не больше двух страниц (пока пишется одна, читается
+    следующая), поэтому расход памяти не зависит от размера таблицы.
+    Сжатие и запись идут в пуле потоков, не блокируя event loop.
+    """
+
+    def __init__(self, db, path: str, fmt: str = "csv", status: str = None,
+                 page_size: int = EXPORT_PAGE_SIZE, columns=USER_EXPORT_COLUMNS):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат выгрузки: {fmt!r}")
+        self.db = db
+        self.path = path
+        self.fmt = fmt
+        self.status = status
+        self.page_size = page_size
+        self.columns = columns
+        self.rows = 0
+
+    def _open(self):
+        # BOM в CSV нужен Excel, чтобы прочитать кириллицу
+        encoding = "utf-8-sig" if self.fmt == "csv" else "utf-8"
+        file = gzip.open(self.path, "wt", encoding=encoding, newline="", compresslevel=6)
+        writer = csv.writer(file) if self.fmt == "csv" else None
+        if writer:
+            writer.writerow(self.columns)
+        return file, writer
+
+    def _write(self, file, writer, rows):
+        if writer:
+            writer.writerows([row.get(column) for column in self.columns] for row in rows)
+        else:
+            file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    async def run(self, on_progress=None, progress_interval: float = 3):
+        """Записать файл. Возвращает число строк или None, если база не ответила.
+
+        on_progress(rows) вызывается не чаще раза в progress_interval секунд.
+        """
+        loop = asyncio.get_running_loop()
+        file, writer = await loop.run_in_executor(None, self._open)
+        next_page = None
+        last_progress = time.monotonic()
+        try:
+            page = await self.db.get_users_after(0, self.page_size, self.status, self.columns)
+            while page:
+                if len(page) == self.page_size:
+                    next_page = asyncio.ensure_future(self.db.get_users_after(
+                        page[-1]["telegram_id"], self.page_size, self.status, self.columns
+                    ))
+                await loop.run_in_executor(None, self._write, file, writer, page)
+                self.rows += len(page)
+                if on_progress and time.monotonic() - last_progress >= progress_interval:
+                    last_progress = time.monotonic()
+                    await on_progress(self.rows)
+                page = await next_page if next_page else []
+                next_page = None
+            if page is None:
+                logger.error(f"Выгрузка прервана: база не ответила после {self.rows} строк")
+                return None
+            return self.rows
+        finally:
+            if next_page:
+                next_page.cancel()
+            await loop.run_in_executor(None, file.close)
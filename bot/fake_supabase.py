@@ -0,0 +1,329 @@
+"""
+Локальная замена Supabase (PostgREST) для работы без сети.
+
+Поддерживает подмножество REST API, которым пользуется database.py:
+select/insert/update по таблицам, фильтры eq/neq/gt/gte/lt/lte/in/like/ilike/is
+и логические or/and, order, limit, offset и подсчёт через Prefer: count=exact,
+а также функции из README (POST /rpc/<имя>), повторённые на Python.
+
+Запуск:
+    python fake_supabase.py --port 54321 [--latency 0.02]
+
+Затем в .env:
+    SUPABASE_URL=http://127.0.0.1:54321
+    SUPABASE_KEY=fake.fake.fake
+"""
+import asyncio
+import argparse
+import fnmatch
+import json
+import logging
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+# Генерируемые колонки (GENERATED ALWAYS AS ... STORED из README): таблица -> {колонка: функция строки}
+GENERATED = {
+    "users": {
+        "full_name_search": lambda row: " ".join((row.get("full_name") or "").translate(
+            str.maketrans("ёЁ", "еЕ")).split()) if row.get("full_name") is not None else None,
+    },
+}
+
+# Уникальные ограничения из README: on_conflict работает только по ним, как в PostgreSQL
+UNIQUE = {
+    "users": [{"telegram_id"}],
+    "contacts": [{"owner_id", "phone_number"}],
+}
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+def _coerce(value, sample):
+    """Привести строковый аргумент фильтра к типу значения в строке таблицы"""
+    if value == "null":
+        return None
+    if isinstance(sample, bool):
+        return value == "true"
+    if isinstance(sample, int):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    if isinstance(sample, float):
+        return float(value)
+    return value
+
+def _like(pattern, value, case_insensitive):
+    # PostgREST принимает и %, и * в качестве подстановочного знака
+    pattern = pattern.replace("%", "*")
+    if case_insensitive:
+        return fnmatch.fnmatchcase(str(value).lower(), pattern.lower())
+    return fnmatch.fnmatchcase(str(value), pattern)
+
+def _match(row, column, expression):
+    negate = False
+    if expression.startswith("not."):
+        negate = True
+        expression = expression[4:]
+    op, _, arg = expression.partition(".")
+    value = row.get(column)
+
+    if op == "in":
+        items = [i.strip().strip('"') for i in arg.strip("()").split(",") if i.strip()]
+        result = value in [_coerce(i, value) for i in items]
+    elif op == "is":
+        result = value is None if arg == "null" else value == (arg == "true")
+    elif op in ("like", "ilike"):
+        result = value is not None and _like(arg, value, op == "ilike")
+    else:
+        target = _coerce(arg, value)
+        if value is None or target is None:
+            result = op == "eq" and value is target
+        elif op == "eq":
+            result = value == target
+        elif op == "neq":
+            result = value != target
+        elif op == "gt":
+            result = value > target
+        elif op == "gte":
+            result = value >= target
+        elif op == "lt":
+            result = value < target
+        elif op == "lte":
+            result = value <= target
+        else:
+            raise ValueError(f"Неподдерживаемый оператор: {op}")
+    return not result if negate else result
+
+def _split_top(text):
+    """Разбить "a,b(c,d),e" по запятым верхнего уровня с учётом кавычек"""
+    parts, depth, quoted, current = [], 0, False, ""
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+def _match_logic(row, op, expression):
+    """Условия вида or=(a.eq.1,and(b.lt.2,c.gt.3))"""
+    results = []
+    for part in _split_top(expression[1:-1]):
+        if part.startswith(("and(", "or(")):
+            inner_op, _, inner = part.partition("(")
+            results.append(_match_logic(row, inner_op, "(" + inner))
+        else:
+            column, _, condition = part.partition(".")
+            op_name, _, arg = condition.partition(".")
+            results.append(_match(row, column, f"{op_name}.{arg.strip(chr(34))}"))
+    return any(results) if op == "or" else all(results)
+
+def _matches(row, column, expression):
+    if column in ("or", "and"):
+        return _match_logic(row, column, expression)
+    return _match(row, column, expression)
+
+class FakeSupabase:
+    """Хранилище таблиц в памяти и aiohttp-приложение поверх него"""
+
+    def __init__(self, latency: float = 0):
+        # Искусственная задержка ответа (сек), как у удалённой базы
+        self.latency = latency
+        self.tables = {}
+        self._ids = {}
+        self.requests = 0
+
+    def _filter(self, table, query):
+        rows = self.tables.setdefault(table, [])
+        # Строки могли положить в tables напрямую (тесты, benchmark.py)
+        for row in rows:
+            self._generate(table, row)
+        filters = [(k, v) for k, v in query.items() if k not in RESERVED_PARAMS]
+        return [row for row in rows if all(_matches(row, k, v) for k, v in filters)]
+
+    @staticmethod
+    def _generate(table, row):
+        for column, compute in GENERATED.get(table, {}).items():
+            row[column] = compute(row)
+
+    @staticmethod
+    def _order(rows, order):
+        for part in reversed(order.split(",")):
+            column, *modifiers = part.split(".")
+            desc = "desc" in modifiers
+            rows = sorted(
+                rows,
+                key=lambda r: (r.get(column) is None, r.get(column)),
+                reverse=desc,
+            )
+        return rows
+
+    @staticmethod
+    def _project(rows, select):
+        if not select or select == "*":
+            return rows
+        columns = [c.strip() for c in select.split(",")]
+        return [{c: r.get(c) for c in columns if c in r} for r in rows]
+
+    def _response(self, request, rows, total=None, status=200):
+        headers = {}
+        prefer = request.headers.get("Prefer", "")
+        if "count=" in prefer:
+            total = len(rows) if total is None else total
+            end = max(len(rows) - 1, 0)
+            headers["Content-Range"] = f"0-{end}/{total}"
+        if "return=minimal" in prefer:
+            return web.Response(status=status, headers=headers)
+        return web.json_response(rows, status=status, headers=headers)
+
+    async def handle_select(self, request):
+        self.requests += 1
+        table = request.match_info["table"]
+        rows = self._filter(table, request.query)
+        total = len(rows)
+        if "order" in request.query:
+            rows = self._order(rows, request.query["order"])
+        offset = int(request.query.get("offset", 0))
+        if "limit" in request.query:
+            rows = rows[offset:offset + int(request.query["limit"])]
+        elif offset:
+            rows = rows[offset:]
+        return self._response(request, self._project(rows, request.query.get("select")), total)
+
+    async def handle_insert(self, request):
+        self.requests += 1
+        table = request.match_info["table"]
+        payload = await request.json()
+        records = payload if isinstance(payload, list) else [payload]
+        prefer = request.headers.get("Prefer", "")
+        conflict = request.query.get("on_conflict")
+        rows = self.tables.setdefault(table, [])
+        if conflict and set(conflict.split(",")) not in UNIQUE.get(table, []):
+            return web.json_response(
+                {"code": "42P10",
+                 "message": "there is no unique or exclusion constraint matching the ON CONFLICT specification"},
+                status=400,
+            )
+
+        result = []
+        for record in records:
+            existing = None
+            if conflict:
+                existing = next(
+                    (r for r in rows if all(r.get(c) == record.get(c) for c in conflict.split(","))),
+                    None,
+                )
+            if existing is not None:
+                if "resolution=ignore-duplicates" in prefer:
+                    continue
+                if "resolution=merge-duplicates" in prefer:
+                    existing.update(record)
+                    self._generate(table, existing)
+                    result.append(dict(existing))
+                    continue
+                return web.json_response(
+                    {"code": "23505", "message": "duplicate key value violates unique constraint"},
+                    status=409,
+                )
+            self._ids[table] = self._ids.get(table, 0) + 1
+            row = {"id": self._ids[table], "created_at": _now()}
+            row.update(record)
+            self._generate(table, row)
+            rows.append(row)
+            result.append(dict(row))
+        return self._response(request, result, status=201)
+
+    async def handle_update(self, request):
+        self.requests += 1
+        table = request.match_info["table"]
+        changes = await request.json()
+        rows = self._filter(table, request.query)
+        for row in rows:
+            row.update(changes)
+            self._generate(table, row)
+        return self._response(request, [dict(r) for r in rows])
+
+    async def handle_delete(self, request):
+        self.requests += 1
+        table = request.match_info["table"]
+        rows = self._filter(table, request.query)
+        ids = {id(r) for r in rows}
+        self.tables[table] = [r for r in self.tables[table] if id(r) not in ids]
+        return self._response(request, rows)
+
+    async def handle_rpc(self, request):
+        self.requests += 1
+        function = getattr(self, f"_rpc_{request.match_info['function']}", None)
+        if function is None:
+            return web.json_response(
+                {"code": "PGRST202", "message": "Could not find the function in the schema cache"},
+                status=404,
+            )
+        params = await request.json() if request.can_read_body else {}
+        return self._response(request, function(**(params or {})))
+
+    def _rpc_change_user_status(self, p_telegram_id, p_status):
+        """UPDATE users ... RETURNING прежний статус и новую строку"""
+        result = []
+        for row in self.tables.setdefault("users", []):
+            if row.get("telegram_id") == p_telegram_id:
+                previous, row["status"] = row.get("status"), p_status
+                self._generate("users", row)
+                result.append({"previous_status": previous, "user": dict(row)})
+        return result
+
+    def _rpc_user_status_counts(self):
+        """SELECT status, count(*) FROM users GROUP BY status"""
+        totals = {}
+        for row in self.tables.setdefault("users", []):
+            totals[row.get("status")] = totals.get(row.get("status"), 0) + 1
+        return [{"status": status, "total": total} for status, total in totals.items()]
+
+    @web.middleware
+    async def _delay(self, request, handler):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def make_app(self):
+        app = web.Application(middlewares=[self._delay])
+        app.router.add_post("/rest/v1/rpc/{function}", self.handle_rpc)
+        app.router.add_get("/rest/v1/{table}", self.handle_select)
+        app.router.add_post("/rest/v1/{table}", self.handle_insert)
+        app.router.add_patch("/rest/v1/{table}", self.handle_update)
+        app.router.add_delete("/rest/v1/{table}", self.handle_delete)
+        return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Supabase")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency", type=float, default=0, help="задержка ответа в секундах")
+    parser.add_argument("--seed", help="JSON-файл вида {\"users\": [...]} с начальными данными")
+    args = parser.parse_args()
+
+    fake = FakeSupabase(args.latency)
+    if args.seed:
+        with open(args.seed, encoding="utf-8") as f:
+            for table, rows in json.load(f).items():
+                fake.tables[table] = rows
+                fake._ids[table] = len(rows)
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(fake.make_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
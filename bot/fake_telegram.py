@@ -0,0 +1,134 @@
+"""
+Локальная замена Telegram Bot API для проверки бота без сети.
+
+Отвечает на вызовы методов Bot API правдоподобными ответами и запоминает их,
+а также умеет отправлять обновления боту на вебхук.
+
+Запуск:
+    python fake_telegram.py --port 8081
+
+Затем в .env:
+    TELEGRAM_API_URL=http://127.0.0.1:8081
+"""
+import time
+import argparse
+import asyncio
+import itertools
+import logging
+
+from aiohttp import web, ClientSession
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Lap Video Chat", "username": "lap_test_bot"}
+
+class FakeTelegram:
+    """Фейковый Bot API: хранит вызовы в self.calls"""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.calls = []
+        # Чаты, где пользователь «заблокировал бота»: на отправку в них — 403
+        self.blocked_chats = set()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+
+    def _message(self, params):
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text") or params.get("caption") or "",
+        }
+
+    def _result(self, method, params):
+        if method == "getme":
+            return BOT_USER
+        if method in ("sendmessage", "editmessagetext", "senddocument", "editmessagereplymarkup"):
+            return self._message(params)
+        if method == "copymessage":
+            return {"message_id": next(self._message_ids)}
+        if method == "getupdates":
+            return []
+        return True
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"].lower()
+        # aiogram шлёт параметры формой (multipart, если есть файлы)
+        params = dict(request.query)
+        params.update(await request.post())
+        self.calls.append((method, params))
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method.startswith(("send", "copy")) and int(params.get("chat_id", 0)) in self.blocked_chats:
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                status=403
+            )
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def make_app(self):
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    def calls_of(self, method: str):
+        return [params for name, params in self.calls if name == method.lower()]
+
+    # ---------- генерация обновлений ----------
+
+    def message_update(self, user_id: int, text: str = None, contact: dict = None):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"},
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if contact is not None:
+            message["contact"] = contact
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback_update(self, user_id: int, data: str):
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "chat_instance": "1",
+                "data": data,
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "menu",
+                },
+            },
+        }
+
+    @staticmethod
+    async def post_update(session: ClientSession, webhook_url: str, update: dict, secret: str = None):
+        """Отправить обновление на вебхук бота, как это делает Telegram"""
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        async with session.post(webhook_url, json=update, headers=headers) as response:
+            return response.status
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0, help="задержка ответа в секундах")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(FakeTelegram(args.latency).make_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import os
+import time
+import json
+import sqlite3
+import asyncio
+import logging
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+# Хранилище состояний FSM: memory, sqlite или redis
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+# Время жизни состояния без изменений (сек): брошенный диалог не висит вечно
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", "fsm.sqlite3")
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в SQLite (WAL), общее для нескольких процессов на одной машине.
+
+    Запись сквозная: set_* возвращается после коммита, поэтому новое состояние
+    сразу видно другим процессам и не теряется при падении. Записи, пришедшие,
+    пока идёт предыдущая транзакция, коммитятся следующей одной пачкой.
+    Каждая запись продлевает жизнь ключа на ttl секунд, устаревшие ключи удаляются.
+
+    При завершении нужно закрыть хранилище:
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+    """
+
+    FIELDS = ("state", "data", "bucket")
+
+    def __init__(self, path: str = FSM_SQLITE_PATH, ttl: int = FSM_TTL):
+        self.ttl = ttl
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            " chat TEXT NOT NULL,"
+            " user TEXT NOT NULL,"
+            " state TEXT,"
+            " data TEXT,"
+            " bucket TEXT,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (chat, user))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fsm_expires_at ON fsm (expires_at)")
+
+        # Одно соединение и один поток: SQLite всё равно допускает одного писателя
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        # Записи, ждущие следующей транзакции, и future её завершения
+        self._pending = {}
+        self._committed = None
+        self._writer = None
+        self._last_purge = time.time()
+
+    # ---------- низкоуровневые операции ----------
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _select(self, chat, user, field):
+        row = self._conn.execute(
+            f"SELECT {field} FROM fsm WHERE chat = ? AND user = ? AND expires_at > ?",
+            (chat, user, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _write_batch(self, batch):
+        expires_at = time.time() + self.ttl
+        self._conn.execute("BEGIN")
+        try:
+            for field in self.FIELDS:
+                rows = [(chat, user, value, expires_at) for (chat, user, f), value in batch.items() if f == field]
+                if rows:
+                    self._conn.executemany(
+                        f"INSERT INTO fsm (chat, user, {field}, expires_at) VALUES (?, ?, ?, ?) "
+                        f"ON CONFLICT (chat, user) DO UPDATE SET "
+                        f"{field} = excluded.{field}, expires_at = excluded.expires_at",
+                        rows
+                    )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _purge(self):
+        self._conn.execute("DELETE FROM fsm WHERE expires_at <= ?", (time.time(),))
+
+    async def _get(self, chat, user, field):
+        key = (chat, user, field)
+        if key in self._pending:
+            return self._pending[key]
+        return await self._run(self._select, chat, user, field)
+
+    async def _set(self, chat, user, field, value):
+        self._pending[(chat, user, field)] = value
+        if self._committed is None:
+            self._committed = asyncio.get_running_loop().create_future()
+        committed = self._committed
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+        await asyncio.shield(committed)
+
+    async def _write_loop(self):
+        """Коммитить накопленные записи, пока они есть"""
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            committed, self._committed = self._committed, None
+            try:
+                await self._run(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"Ошибка записи состояний FSM: {e}")
+                # Пачка не сохранена: ошибка уходит ожидающим set_*, более
+                # свежие записи из self._pending пойдут следующей транзакцией
+                committed.set_exception(e)
+                # Ожидающий мог быть отменён — не оставляем ошибку без обработчика
+                committed.exception()
+            else:
+                committed.set_result(None)
+            if time.time() - self._last_purge > 60:
+                self._last_purge = time.time()
+                try:
+                    await self._run(self._purge)
+                except Exception as e:
+                    logger.error(f"Ошибка очистки состояний FSM: {e}")
+
+    async def flush(self):
+        """Дождаться коммита всех начатых записей"""
+        if self._writer is not None:
+            await self._writer
+
+    async def close(self):
+        await self.flush()
+
+    async def wait_closed(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+    # ---------- интерфейс BaseStorage ----------
+
+    async def get_state(self, *, chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        chat, user = self.check_address(chat=chat, user=user)
+        return await self._get(str(chat), str(user), "state") or self.resolve_state(default)
+
+    async def get_data(self, *, chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        chat, user = self.check_address(chat=chat, user=user)
+        raw = await self._get(str(chat), str(user), "data")
+        return json.loads(raw) if raw else (default or {})
+
+    async def set_state(self, *, chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.Optional[typing.AnyStr] = None):
+        chat, user = self.check_address(chat=chat, user=user)
+        await self._set(str(chat), str(user), "state", self.resolve_state(state))
+
+    async def set_data(self, *, chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        chat, user = self.check_address(chat=chat, user=user)
+        await self._set(str(chat), str(user), "data", json.dumps(data or {}))
+
+    async def update_data(self, *, chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        if data is None:
+            data = {}
+        current = await self.get_data(chat=chat, user=user)
+        current.update(data, **kwargs)
+        await self.set_data(chat=chat, user=user, data=current)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        chat, user = self.check_address(chat=chat, user=user)
+        raw = await self._get(str(chat), str(user), "bucket")
+        return json.loads(raw) if raw else (default or {})
+
+    async def set_bucket(self, *, chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        chat, user = self.check_address(chat=chat, user=user)
+        await self._set(str(chat), str(user), "bucket", json.dumps(bucket or {}))
+
+    async def update_bucket(self, *, chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        if bucket is None:
+            bucket = {}
+        current = await self.get_bucket(chat=chat, user=user)
+        current.update(bucket, **kwargs)
+        await self.set_bucket(chat=chat, user=user, bucket=current)
+
+def create_storage() -> BaseStorage:
+    """Создать хранилище FSM по переменной FSM_STORAGE"""
+    if FSM_STORAGE == "sqlite":
+        logger.info(f"💾 FSM: SQLite ({FSM_SQLITE_PATH})")
+        return SQLiteStorage()
+    if FSM_STORAGE == "redis":
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2
+        logger.info(f"💾 FSM: Redis ({REDIS_HOST}:{REDIS_PORT}/{REDIS_DB})")
+        return RedisStorage2(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD,
+            state_ttl=FSM_TTL,
+            data_ttl=FSM_TTL,
+            bucket_ttl=FSM_TTL
+        )
+    return MemoryStorage()
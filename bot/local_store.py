@@ -0,0 +1,382 @@
+import time
+import sqlite3
+import logging
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+from search_index import UserSearchIndex
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    telegram_id INTEGER PRIMARY KEY,
+    phone_number TEXT,
+    full_name TEXT,
+    username TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at TEXT NOT NULL,
+    bot_blocked INTEGER
+);
+CREATE INDEX IF NOT EXISTS users_created_at ON users (created_at, telegram_id);
+CREATE INDEX IF NOT EXISTS users_status_created_at ON users (status, created_at, telegram_id);
+
+-- Счётчики статусов ведутся триггерами, подсчёт не сканирует таблицу
+CREATE TABLE IF NOT EXISTS user_status_counts (
+    status TEXT PRIMARY KEY,
+    total INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS users_count_insert AFTER INSERT ON users BEGIN
+    INSERT INTO user_status_counts (status, total) VALUES (new.status, 1)
+        ON CONFLICT (status) DO UPDATE SET total = total + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS users_count_delete AFTER DELETE ON users BEGIN
+    UPDATE user_status_counts SET total = total - 1 WHERE status = old.status;
+END;
+CREATE TRIGGER IF NOT EXISTS users_count_update AFTER UPDATE OF status ON users
+WHEN old.status IS NOT new.status BEGIN
+    UPDATE user_status_counts SET total = total - 1 WHERE status = old.status;
+    INSERT INTO user_status_counts (status, total) VALUES (new.status, 1)
+        ON CONFLICT (status) DO UPDATE SET total = total + 1;
+END;
+
+-- Журнал модерации: только добавление
+CREATE TABLE IF NOT EXISTS moderation_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id INTEGER NOT NULL,
+    actor_id INTEGER,
+    old_status TEXT,
+    new_status TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS moderation_log_user ON moderation_log (telegram_id, id);
+
+-- Контакты пользователя: номер в формате E.164
+CREATE TABLE IF NOT EXISTS contacts (
+    owner_id INTEGER NOT NULL,
+    phone_number TEXT NOT NULL,
+    name TEXT,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (owner_id, phone_number)
+);
+"""
+
+# Колонки, добавленные после первой версии схемы: (имя, определение)
+MIGRATIONS = (
+    ("bot_blocked", "INTEGER"),
+    # Время (unix) копирования строки из Supabase; NULL — строка не из Supabase или устарела
+    ("synced_at", "REAL"),
+)
+# Индексы по добавленным колонкам создаются после миграций
+INDEXES = """
+CREATE INDEX IF NOT EXISTS users_status_id ON users (status, telegram_id);
+CREATE INDEX IF NOT EXISTS users_phone ON users (phone_number);
+"""
+# Номеров в одном запросе сопоставления: у каждого два варианта записи,
+# а старые SQLite ограничивают запрос 999 параметрами
+MATCH_CHUNK = 400
+
+USER_COLUMNS = ("telegram_id", "phone_number", "full_name", "username", "status", "created_at", "bot_blocked")
+
+# Запросы — константы: sqlite3 кэширует подготовленные выражения по тексту SQL
+SQL_GET_USER = "SELECT * FROM users WHERE telegram_id = ?"
+SQL_INSERT_USER = (
+    "INSERT INTO users (telegram_id, phone_number, full_name, username, status, created_at, bot_blocked) "
+    "VALUES (:telegram_id, :phone_number, :full_name, :username, :status, :created_at, :bot_blocked) "
+    "ON CONFLICT (telegram_id) DO NOTHING"
+)
+SQL_UPSERT_USER = (
+    "INSERT INTO users (telegram_id, phone_number, full_name, username, status, created_at, bot_blocked, synced_at) "
+    "VALUES (:telegram_id, :phone_number, :full_name, :username, :status, :created_at, :bot_blocked, :synced_at) "
+    "ON CONFLICT (telegram_id) DO UPDATE SET "
+    "phone_number = excluded.phone_number, full_name = excluded.full_name, "
+    "username = excluded.username, status = excluded.status, created_at = excluded.created_at, "
+    "bot_blocked = excluded.bot_blocked, synced_at = excluded.synced_at"
+)
+SQL_GET_FRESH_USER = "SELECT * FROM users WHERE telegram_id = ? AND synced_at >= ?"
+SQL_MARK_STALE = "UPDATE users SET synced_at = NULL WHERE telegram_id = ?"
+SQL_UPDATE_STATUS = "UPDATE users SET status = ? WHERE telegram_id = ?"
+SQL_IDS_PAGE = (
+    "SELECT telegram_id FROM users "
+    "WHERE status = ? AND telegram_id > ? AND bot_blocked IS NOT 1 "
+    "ORDER BY telegram_id LIMIT ?"
+)
+SQL_SET_BOT_BLOCKED = "UPDATE users SET bot_blocked = ? WHERE telegram_id = ?"
+SQL_INSERT_AUDIT = (
+    "INSERT INTO moderation_log (telegram_id, actor_id, old_status, new_status, created_at) "
+    "VALUES (:telegram_id, :actor_id, :old_status, :new_status, :created_at)"
+)
+SQL_INSERT_CONTACT = (
+    "INSERT INTO contacts (owner_id, phone_number, name, created_at) "
+    "VALUES (:owner_id, :phone_number, :name, :created_at) "
+    "ON CONFLICT (owner_id, phone_number) DO NOTHING"
+)
+SQL_DELETE_CONTACT = "DELETE FROM contacts WHERE owner_id = ? AND phone_number = ?"
+SQL_CONTACTS_PAGE = (
+    "SELECT * FROM contacts WHERE owner_id = ? AND phone_number > ? "
+    "ORDER BY phone_number LIMIT ?"
+)
+SQL_SEARCH_FIELDS = "SELECT telegram_id, phone_number, full_name, username FROM users"
+SQL_STATUS_COUNTS = "SELECT status, total FROM user_status_counts"
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+class LocalStore:
+    """
+    Локальное хранилище пользователей в SQLite (режим WAL).
+
+    Методы синхронные и рассчитаны на вызов из одного потока:
+    Database выполняет их в отдельном однопоточном пуле, поэтому
+    у хранилища ровно одно соединение-писатель.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executescript(INDEXES)
+        self._conn.commit()
+        # Индекс поиска строится при первом поиске и дальше ведётся при записи
+        self._search_index = None
+
+    def _migrate(self):
+        """Добавить колонки, которых нет в файле, созданном старой версией"""
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(users)")}
+        for column, definition in MIGRATIONS:
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE users ADD COLUMN {column} {definition}")
+
+    def close(self):
+        self._conn.close()
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+        user = dict(row)
+        user.pop("synced_at", None)
+        return user
+
+    def get_user(self, telegram_id: int):
+        return self._row(self._conn.execute(SQL_GET_USER, (telegram_id,)).fetchone())
+
+    def get_fresh_user(self, telegram_id: int, max_age: float):
+        """Строка реплики, скопированная из Supabase не раньше max_age секунд назад, или None"""
+        return self._row(self._conn.execute(SQL_GET_FRESH_USER, (telegram_id, time.time() - max_age)).fetchone())
+
+    def mark_stale(self, telegram_id: int):
+        """Не отдавать строку реплики как свежую, пока её не перечитают из Supabase"""
+        with self._conn:
+            self._conn.execute(SQL_MARK_STALE, (telegram_id,))
+
+    def insert_user(self, user: dict):
+        """Добавить пользователя, если его ещё нет. Возвращает True, если строка новая"""
+        row = {column: user.get(column) for column in USER_COLUMNS}
+        row["status"] = row["status"] or "pending"
+        row["created_at"] = row["created_at"] or now_iso()
+        with self._conn:
+            cursor = self._conn.execute(SQL_INSERT_USER, row)
+        if cursor.rowcount == 1 and self._search_index is not None:
+            self._search_index.add(row)
+        return cursor.rowcount == 1
+
+    def upsert_users(self, users: list):
+        """Записать строки, полученные из Supabase (режим реплики)"""
+        rows = []
+        synced_at = time.time()
+        for user in users:
+            if user.get("telegram_id") is None:
+                continue
+            row = {column: user.get(column) for column in USER_COLUMNS}
+            row["status"] = row["status"] or "pending"
+            row["created_at"] = row["created_at"] or now_iso()
+            row["synced_at"] = synced_at
+            rows.append(row)
+        if rows:
+            with self._conn:
+                self._conn.executemany(SQL_UPSERT_USER, rows)
+            if self._search_index is not None:
+                for row in rows:
+                    self._search_index.add(row)
+
+    def update_status(self, telegram_id: int, status: str):
+        """Обновить статус. Возвращает обновлённую строку или None, если её нет"""
+        with self._conn:
+            cursor = self._conn.execute(SQL_UPDATE_STATUS, (status, telegram_id))
+        if cursor.rowcount == 0:
+            return None
+        return self.get_user(telegram_id)
+
+    def get_pending_ids(self, limit: int, phone_prefix: str = None):
+        """ID самых старых заявок (необязательно — с номером на phone_prefix)"""
+        sql = "SELECT telegram_id FROM users WHERE status = 'pending'"
+        params = []
+        if phone_prefix:
+            sql += " AND (phone_number LIKE ? OR phone_number LIKE ?)"
+            params.extend([f"{phone_prefix}%", f"+{phone_prefix}%"])
+        sql += " ORDER BY created_at, telegram_id LIMIT ?"
+        params.append(limit)
+        return [row[0] for row in self._conn.execute(sql, params)]
+
+    def change_status(self, telegram_id: int, status: str):
+        """Сменить статус одной транзакцией: (прежний статус, обновлённая строка) или (None, None)"""
+        with self._conn:
+            row = self._conn.execute(SQL_GET_USER, (telegram_id,)).fetchone()
+            if row is None:
+                return None, None
+            self._conn.execute(SQL_UPDATE_STATUS, (status, telegram_id))
+        return row["status"], self.get_user(telegram_id)
+
+    def bulk_update_status(self, ids: list, status: str, from_status: str = None):
+        """Обновить статус многим пользователям одной транзакцией, вернуть обновлённые строки.
+        from_status — менять только строки с этим статусом."""
+        if not ids:
+            return []
+        placeholders = ", ".join("?" for _ in ids)
+        with self._conn:
+            if from_status:
+                ids = [
+                    row[0] for row in self._conn.execute(
+                        f"SELECT telegram_id FROM users WHERE telegram_id IN ({placeholders}) AND status = ?",
+                        [*ids, from_status]
+                    )
+                ]
+                if not ids:
+                    return []
+                placeholders = ", ".join("?" for _ in ids)
+            self._conn.executemany(SQL_UPDATE_STATUS, [(status, telegram_id) for telegram_id in ids])
+        return [
+            self._row(r) for r in self._conn.execute(
+                f"SELECT * FROM users WHERE telegram_id IN ({placeholders}) AND status = ?",
+                [*ids, status]
+            )
+        ]
+
+    def get_ids_page(self, status: str, after_id: int, limit: int):
+        """ID по возрастанию после after_id, без заблокировавших бота; см. Database.get_ids_page"""
+        return [row[0] for row in self._conn.execute(SQL_IDS_PAGE, (status, after_id, limit))]
+
+    def get_users_after(self, columns, after_id: int, limit: int, status: str = None):
+        """Строки по возрастанию telegram_id после after_id; см. Database.get_users_after"""
+        sql = f"SELECT {', '.join(columns)} FROM users WHERE telegram_id > ?"
+        params = [after_id]
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        sql += " ORDER BY telegram_id LIMIT ?"
+        params.append(limit)
+        return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def search_users(self, kind: str, value: str, after_id: int, limit: int):
+        """Поиск по индексу в памяти; см. Database.search_users"""
+        if self._search_index is None:
+            self._search_index = UserSearchIndex.build(dict(row) for row in self._conn.execute(SQL_SEARCH_FIELDS))
+        ids = self._search_index.search(kind, value)
+        start = bisect_right(ids, after_id)
+        page = ids[start:start + limit]
+        if not page:
+            return []
+        placeholders = ", ".join("?" for _ in page)
+        return [
+            self._row(r) for r in self._conn.execute(
+                f"SELECT * FROM users WHERE telegram_id IN ({placeholders}) ORDER BY telegram_id", page
+            )
+        ]
+
+    def set_bot_blocked(self, ids: list, blocked: bool):
+        """Отметить, что пользователи заблокировали бота (или разблокировали), вернуть строки"""
+        if not ids:
+            return []
+        with self._conn:
+            self._conn.executemany(SQL_SET_BOT_BLOCKED, [(int(blocked), telegram_id) for telegram_id in ids])
+        placeholders = ", ".join("?" for _ in ids)
+        return [
+            self._row(r) for r in self._conn.execute(f"SELECT * FROM users WHERE telegram_id IN ({placeholders})", ids)
+        ]
+
+    def get_users(self, status: str = None, limit: int = None):
+        """Пользователи от новых к старым"""
+        sql = "SELECT * FROM users"
+        params = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC, telegram_id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._row(r) for r in self._conn.execute(sql, params)]
+
+    def get_users_page(self, columns, status=None, limit=15, cursor=None, backward=False):
+        """Страница по индексу (status, created_at, telegram_id); см. Database.get_users_page"""
+        sql = f"SELECT {', '.join(columns)} FROM users WHERE 1 = 1"
+        params = []
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        if cursor:
+            sql += " AND (created_at, telegram_id) > (?, ?)" if backward else " AND (created_at, telegram_id) < (?, ?)"
+            params.extend(cursor)
+        direction = "ASC" if backward else "DESC"
+        sql += f" ORDER BY created_at {direction}, telegram_id {direction} LIMIT ?"
+        params.append(limit)
+        return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def insert_audit(self, entries: list):
+        """Добавить записи журнала модерации одной транзакцией"""
+        with self._conn:
+            self._conn.executemany(SQL_INSERT_AUDIT, entries)
+
+    def get_audit_page(self, telegram_id: int, limit: int, before_id: int = None):
+        """Записи журнала пользователя от новых к старым; см. Database.get_audit_page"""
+        sql = "SELECT * FROM moderation_log WHERE telegram_id = ?"
+        params = [telegram_id]
+        if before_id:
+            sql += " AND id < ?"
+            params.append(before_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def match_phones(self, phones: list):
+        """Пользователи с этими номерами; номер ищется и в E.164, и старой записью без «+»"""
+        rows = []
+        for start in range(0, len(phones), MATCH_CHUNK):
+            chunk = phones[start:start + MATCH_CHUNK]
+            variants = [*chunk, *(phone.lstrip("+") for phone in chunk)]
+            placeholders = ", ".join("?" for _ in variants)
+            rows.extend(
+                self._row(r) for r in self._conn.execute(
+                    f"SELECT * FROM users WHERE phone_number IN ({placeholders})", variants
+                )
+            )
+        return rows
+
+    def insert_contacts(self, owner_id: int, contacts: list):
+        """Добавить контакты одной транзакцией, вернуть число новых"""
+        created_at = now_iso()
+        rows = [
+            {"owner_id": owner_id, "phone_number": c["phone_number"], "name": c.get("name"), "created_at": created_at}
+            for c in contacts
+        ]
+        with self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(SQL_INSERT_CONTACT, rows)
+            return self._conn.total_changes - before
+
+    def get_contacts_page(self, owner_id: int, after_phone: str, limit: int):
+        """Контакты по возрастанию номера после after_phone; см. Database.get_contacts_page"""
+        return [dict(r) for r in self._conn.execute(SQL_CONTACTS_PAGE, (owner_id, after_phone, limit))]
+
+    def delete_contact(self, owner_id: int, phone: str):
+        with self._conn:
+            return self._conn.execute(SQL_DELETE_CONTACT, (owner_id, phone)).rowcount > 0
+
+    def status_counts(self):
+        return {row["status"]: row["total"] for row in self._conn.execute(SQL_STATUS_COUNTS)}
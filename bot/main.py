@@ -1,15 +1,39 @@
+import time
+# Отсчёт времени запуска — до импорта тяжёлых модулей
+BOOT_STARTED = time.perf_counter()
+
+import io
 import os
+import re
+import tempfile
 import logging
 import asyncio
-from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from datetime import datetime, timezone
+from aiohttp import web
+from aiogram import Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, InputFile, WebAppInfo
 from aiogram.utils import executor
 from dotenv import load_dotenv
 
-from database import db
+from database import db, USER_STATUSES
+from cache import TTLCache, MISSING
+from callbacks import CallbackRouter
+from middlewares import ThrottlingMiddleware, UserContextMiddleware, throttle
+from metrics import MeteredBot, MetricsMiddleware, StartupTimer, REGISTRY, Gauge, setup_metrics
+from scheduler import UpdateScheduler
+from broadcast import Broadcaster
+from export import UserExport, EXPORT_FORMATS
+from audit import AuditLog
+from contacts import normalize_phone, parse_contacts, CONTACTS_IMPORT_LIMIT, CONTACTS_FILE_MAX_BYTES
+from sender import MessageSender, PRIORITY_HIGH, PRIORITY_LOW
+from webhook import setup_webhook
+from signaling import SignalingServer, setup_signaling
+from presence import PresenceRegistry, setup_presence
+from static_server import StaticServer, setup_static
+from fsm_storage import create_storage
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -20,19 +44,123 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
+startup_timer = StartupTimer(BOOT_STARTED)
+startup_timer.mark("import")
 
 # Инициализация бота
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_IDS = [int(id.strip()) for id in os.getenv("ADMIN_IDS", "").split(",") if id.strip()]
 
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+# Публичный адрес мини-приложения (встроенный сервер на $PORT): в него уходят ссылки на звонки
+MINIAPP_URL = os.getenv("MINIAPP_URL", "")
+# Адрес Bot API (можно указать fake_telegram.py для локальной проверки)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+if TELEGRAM_API_URL:
+    bot = MeteredBot(token=BOT_TOKEN, server=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+else:
+    bot = MeteredBot(token=BOT_TOKEN)
+storage = create_storage()
 dp = Dispatcher(bot, storage=storage)
+sender = MessageSender(bot)
+router = CallbackRouter(ADMIN_IDS)
+router.register(dp)
+MetricsMiddleware().register(dp)
+# Антифлуд раньше загрузки пользователя: лишние обновления не доходят до базы
+dp.middleware.setup(ThrottlingMiddleware(exempt_ids=ADMIN_IDS))
+dp.middleware.setup(UserContextMiddleware(db))
+# Журнал модерации пишется в базу пачками в фоне
+audit = AuditLog(db)
+# Обновления одного пользователя — строго по очереди, разных — параллельно
+scheduler = UpdateScheduler(dp).install()
+
+async def is_call_allowed(user_id: int):
+    """Звонить из мини-приложения могут админы и одобренные пользователи"""
+    if user_id in ADMIN_IDS:
+        return True
+    user = await db.get_user(user_id)
+    return bool(user) and user.get("status") == "approved"
+
+signaling = SignalingServer(BOT_TOKEN, is_call_allowed)
+# Кто сейчас в мини-приложении: по пульсу раз в 20 секунд
+presence = PresenceRegistry()
+
+# Состояние очередей и кэша снимается в момент запроса /metrics
+SEND_QUEUE_SIZE = REGISTRY.register(Gauge("bot_send_queue_size", "Сообщения в очереди отправки"))
+USER_CACHE_SIZE = REGISTRY.register(Gauge("bot_user_cache_size", "Записей в кэше пользователей"))
+SIGNALING_PEERS = REGISTRY.register(Gauge("bot_signaling_peers", "Участников звонков на сигнальном сервере"))
+PRESENCE_ONLINE = REGISTRY.register(Gauge("bot_presence_online", "Пользователей в мини-приложении"))
+
+def collect_metrics():
+    SEND_QUEUE_SIZE.set(sender.qsize())
+    USER_CACHE_SIZE.set(len(db.user_cache))
+    SIGNALING_PEERS.set(signaling.peers_count)
+    PRESENCE_ONLINE.set(len(presence))
+
+REGISTRY.add_collector(collect_metrics)
 
 # ==================== СОСТОЯНИЯ ====================
 class AdminStates(StatesGroup):
     waiting_ban_id = State()
     waiting_unban_id = State()
+    waiting_bulk_prefix = State()
+    waiting_broadcast = State()
+    waiting_search = State()
+
+class ContactStates(StatesGroup):
+    waiting_contacts = State()
+
+# ==================== ТЕКСТЫ УВЕДОМЛЕНИЙ ====================
+APPROVED_TEXT = (
+    "🎉 ВАША ЗАЯВКА ОДОБРЕНА!\n\n"
+    "Добро пожаловать в Lap Video Chat Bot!\n"
+    "Теперь вам доступны все функции."
+)
+REJECTED_TEXT = "❌ Ваша заявка отклонена администратором."
+
+# ==================== КОДЫ КНОПОК ====================
+# callback_data собирается через router.pack(код, *аргументы), см. callbacks.py
+CB_APPROVE = "ap"
+CB_REJECT = "rj"
+CB_ADMIN_PANEL = "ad"
+CB_REQUESTS = "rq"
+CB_REQUESTS_PAGE = "rqp"
+CB_USERS = "us"
+CB_USERS_PAGE = "usp"
+CB_BULK_MENU = "bm"
+CB_BULK_PREFIX = "bp"
+CB_BULK = "bk"
+CB_BAN = "bn"
+CB_UNBAN = "ub"
+CB_STATS = "st"
+CB_SEARCH = "sr"
+CB_SEARCH_PAGE = "srp"
+CB_SEARCH_APPROVE = "sa"
+CB_SEARCH_BAN = "sb"
+CB_SEARCH_UNBAN = "su"
+CB_HISTORY = "hs"
+CB_HISTORY_PAGE = "hsp"
+CB_BROADCAST = "bc"
+CB_BROADCAST_SEND = "bcs"
+CB_BROADCAST_STOP = "bcx"
+CB_CANCEL = "cx"
+CB_MAIN_MENU = "mm"
+CB_CHATS = "ch"
+CB_CALL = "cl"
+CB_CONTACTS = "co"
+CB_CONTACTS_ADD = "coa"
+CB_CONTACTS_LIST = "col"
+CB_CONTACTS_PAGE = "cop"
+CB_CONTACT_DELETE = "cod"
+CB_SETTINGS = "se"
+CB_HELP = "hp"
 
 # ==================== КЛАВИАТУРЫ ====================
 def get_phone_keyboard():
@@ -44,31 +172,37 @@ def get_phone_keyboard():
         one_time_keyboard=True
     )
 
-def get_admin_keyboard():
-    return InlineKeyboardMarkup(row_width=2).add(
-        InlineKeyboardButton("📋 Заявки", callback_data="admin_requests"),
-        InlineKeyboardButton("👥 Все пользователи", callback_data="admin_all_users"),
-        InlineKeyboardButton("🚫 Забанить", callback_data="admin_ban"),
-        InlineKeyboardButton("✅ Разбанить", callback_data="admin_unban"),
-        InlineKeyboardButton("📊 Статистика", callback_data="admin_stats"),
-        InlineKeyboardButton("🏠 Главное меню", callback_data="user_main_menu")
+def get_admin_keyboard(nav_buttons=None):
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    if nav_buttons:
+        keyboard.row(*nav_buttons)
+    return keyboard.add(
+        InlineKeyboardButton("📋 Заявки", callback_data=router.pack(CB_REQUESTS)),
+        InlineKeyboardButton("👥 Все пользователи", callback_data=router.pack(CB_USERS)),
+        InlineKeyboardButton("🚫 Забанить", callback_data=router.pack(CB_BAN)),
+        InlineKeyboardButton("✅ Разбанить", callback_data=router.pack(CB_UNBAN)),
+        InlineKeyboardButton("🔍 Поиск", callback_data=router.pack(CB_SEARCH)),
+        InlineKeyboardButton("📊 Статистика", callback_data=router.pack(CB_STATS)),
+        InlineKeyboardButton("📣 Рассылка", callback_data=router.pack(CB_BROADCAST)),
+        InlineKeyboardButton("🏠 Главное меню", callback_data=router.pack(CB_MAIN_MENU))
     )
 
 def get_user_menu(user_is_admin=False):
     keyboard = InlineKeyboardMarkup(row_width=2)
     keyboard.add(
-        InlineKeyboardButton("📞 Чаты", callback_data="user_chats"),
-        InlineKeyboardButton("👥 Контакты", callback_data="user_contacts"),
-        InlineKeyboardButton("⚙️ Настройки", callback_data="user_settings"),
-        InlineKeyboardButton("🆘 Помощь", callback_data="user_help")
+        InlineKeyboardButton("📞 Чаты", callback_data=router.pack(CB_CHATS)),
+        InlineKeyboardButton("👥 Контакты", callback_data=router.pack(CB_CONTACTS)),
+        InlineKeyboardButton("⚙️ Настройки", callback_data=router.pack(CB_SETTINGS)),
+        InlineKeyboardButton("🆘 Помощь", callback_data=router.pack(CB_HELP))
     )
     if user_is_admin:
-        keyboard.add(InlineKeyboardButton("👨‍💻 Админ панель", callback_data="admin_panel"))
+        keyboard.add(InlineKeyboardButton("👨‍💻 Админ панель", callback_data=router.pack(CB_ADMIN_PANEL)))
     return keyboard
 
 # ==================== КОМАНДЫ ====================
 @dp.message_handler(commands=['start'])
-async def cmd_start(message: types.Message):
+@throttle("start")
+async def cmd_start(message: types.Message, user: dict):
     user_id = message.from_user.id
     is_admin = user_id in ADMIN_IDS
     
@@ -81,10 +215,11 @@ async def cmd_start(message: types.Message):
         )
         return
     
-    # Проверяем есть ли пользователь
-    user = await db.get_user(user_id)
-    
     if user:
+        if user.get("bot_blocked"):
+            # Пользователь снова пишет боту — значит, разблокировал его
+            await db.set_bot_blocked([user_id], False)
+        
         status = user.get("status")
         if status == "approved":
             await message.answer(
@@ -119,9 +254,47 @@ async def cmd_admin(message: types.Message):
         reply_markup=get_admin_keyboard()
     )
 
+@dp.message_handler(commands=['export'], user_id=ADMIN_IDS)
+async def cmd_export(message: types.Message):
+    """/export [csv|jsonl] [статус] — выгрузка пользователей файлом"""
+    args = message.get_args().lower().split()
+    fmt = next((arg for arg in args if arg in EXPORT_FORMATS), "csv")
+    status = next((arg for arg in args if arg in USER_STATUSES), None)
+    unknown = [arg for arg in args if arg not in EXPORT_FORMATS and arg not in USER_STATUSES]
+    if unknown:
+        await message.answer(
+            f"❌ Не понял: {' '.join(unknown)}\n"
+            f"Формат: /export [{'|'.join(EXPORT_FORMATS)}] [{'|'.join(USER_STATUSES)}]"
+        )
+        return
+    
+    progress = await message.answer("⏳ Выгрузка пользователей...")
+    
+    async def show_progress(rows):
+        await progress.edit_text(f"⏳ Выгружено строк: {rows}...")
+    
+    filename = f"users{'-' + status if status else ''}-{datetime.now(timezone.utc):%Y%m%d-%H%M}.{fmt}.gz"
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}.gz")
+    os.close(fd)
+    try:
+        rows = await UserExport(db, path, fmt, status).run(on_progress=show_progress)
+        if rows is None:
+            await progress.edit_text("❌ Ошибка базы данных, выгрузка прервана.")
+            return
+        await message.answer_document(
+            InputFile(path, filename=filename),
+            caption=f"📦 Пользователей: {rows}"
+        )
+        await progress.delete()
+    finally:
+        os.remove(path)
+
 # ==================== ОБРАБОТКА НОМЕРА ТЕЛЕФОНА ====================
 @dp.message_handler(content_types=['contact'])
+@throttle("contact")
 async def process_contact(message: types.Message):
+    # Параметра user нет: запись пользователя заранее не читается, регистрация —
+    # один запрос к базе (вставка, которая пропускает уже существующую строку)
     user_id = message.from_user.id
     
     if user_id in ADMIN_IDS:
@@ -131,94 +304,80 @@ async def process_contact(message: types.Message):
         )
         return
     
-    # Проверяем есть ли уже заявка
-    existing_user = await db.get_user(user_id)
-    if existing_user:
-        status = existing_user.get("status")
-        if status == "pending":
-            await message.answer(
-                "⏳ Ваша заявка уже отправлена и ожидает рассмотрения.",
-                reply_markup=get_user_menu(user_is_admin=False)
-            )
-            return
-        elif status == "approved":
-            await message.answer(
-                "✅ Вы уже одобрены! Используйте меню ниже.",
-                reply_markup=get_user_menu(user_is_admin=False)
-            )
-            return
-    
     contact = message.contact
-    phone_number = contact.phone_number
+    # Номер хранится в E.164: по нему пользователей находят в контактах
+    phone_number = normalize_phone(contact.phone_number) or contact.phone_number
     full_name = f"{contact.first_name or ''} {contact.last_name or ''}".strip()
     
-    # Сохраняем в базу
-    success, result = await db.create_user(
+    # Сохраняем в базу: повторный номер не создаёт вторую заявку
+    created = await db.create_user(
         telegram_id=user_id,
         phone=phone_number,
         full_name=full_name or message.from_user.full_name,
         username=message.from_user.username
     )
     
-    if success:
-        # Уведомляем админов
+    if created:
+        # Уведомляем админов через очередь отправки, не дожидаясь доставки
         for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(
-                    admin_id,
-                    f"📨 НОВАЯ ЗАЯВКА!\n\n"
-                    f"👤 Имя: {full_name}\n"
-                    f"📱 Телефон: +{phone_number}\n"
-                    f"🆔 ID: {user_id}\n"
-                    f"📛 @{message.from_user.username or 'нет'}",
-                    reply_markup=InlineKeyboardMarkup().add(
-                        InlineKeyboardButton("✅ Одобрить", callback_data=f"approve_{user_id}"),
-                        InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_{user_id}")
-                    )
+            sender.send_message(
+                admin_id,
+                f"📨 НОВАЯ ЗАЯВКА!\n\n"
+                f"👤 Имя: {full_name}\n"
+                f"📱 Телефон: {phone_number}\n"
+                f"🆔 ID: {user_id}\n"
+                f"📛 @{message.from_user.username or 'нет'}",
+                priority=PRIORITY_HIGH,
+                reply_markup=InlineKeyboardMarkup().add(
+                    InlineKeyboardButton("✅ Одобрить", callback_data=router.pack(CB_APPROVE, user_id)),
+                    InlineKeyboardButton("❌ Отклонить", callback_data=router.pack(CB_REJECT, user_id))
                 )
-            except Exception as e:
-                logger.error(f"Ошибка уведомления админа {admin_id}: {e}")
+            )
         
         await message.answer(
             "✅ Спасибо! Номер получен.\n"
             "⏳ Ожидайте одобрения администратора.",
             reply_markup=get_user_menu(user_is_admin=False)
         )
+    elif created is False:
+        # Заявка уже есть (например, номер отправлен дважды подряд) — админов не беспокоим.
+        # Статус нужен только на этом пути, чтобы ответить по существу
+        user = await db.get_user(user_id)
+        if user and user.get("status") == "approved":
+            text = "✅ Вы уже одобрены! Используйте меню ниже."
+        elif user and user.get("status") == "pending":
+            text = "⏳ Ваша заявка уже отправлена и ожидает рассмотрения."
+        else:
+            text = "⏳ Ваша заявка уже отправлена."
+        await message.answer(text, reply_markup=get_user_menu(user_is_admin=False))
     else:
         await message.answer(
-            f"❌ Ошибка: {result}",
+            "❌ Ошибка: не удалось сохранить заявку, попробуйте позже.",
             reply_markup=get_user_menu(user_is_admin=False)
         )
 
 # ==================== ОБРАБОТКА КНОПОК АДМИНА ====================
-@dp.callback_query_handler(lambda c: c.data.startswith('approve_'))
-async def approve_user(callback_query: types.CallbackQuery):
-    user_id = int(callback_query.data.split('_')[1])
-    admin_id = callback_query.from_user.id
-    
-    if admin_id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
-        return
-    
-    # Обновляем статус в базе
-    success = await db.update_user_status(user_id, "approved")
+async def change_status(user_id: int, status: str, actor_id: int):
+    """Сменить статус и записать переход (с прежним статусом из базы) в журнал модерации"""
+    previous, user = await db.change_user_status(user_id, status)
+    if user:
+        audit.record(user_id, actor_id, previous, status)
+    return user
+
+@router.route(CB_APPROVE, int, admin=True)
+async def approve_user(callback_query: types.CallbackQuery, user_id: int):
+    # Обновляем статус в базе; в ответ приходит обновлённая строка
+    user = await change_status(user_id, "approved", callback_query.from_user.id)
     
-    if success:
+    if user:
         # Уведомляем пользователя
-        try:
-            await bot.send_message(
-                user_id,
-                "🎉 ВАША ЗАЯВКА ОДОБРЕНА!\n\n"
-                "Добро пожаловать в Lap Video Chat Bot!\n"
-                "Теперь вам доступны все функции.",
-                reply_markup=get_user_menu(user_is_admin=False)
-            )
-        except Exception as e:
-            logger.error(f"Не удалось уведомить пользователя {user_id}: {e}")
+        sender.send_message(
+            user_id,
+            APPROVED_TEXT,
+            reply_markup=get_user_menu(user_is_admin=False)
+        )
         
-        # Получаем информацию о пользователе
-        user = await db.get_user(user_id)
-        user_name = user.get("full_name", "Пользователь") if user else "Пользователь"
+        user_name = user.get("full_name") or "Пользователь"
         
         await callback_query.message.edit_text(
             f"✅ Пользователь одобрен!\n"
@@ -230,30 +389,16 @@ async def approve_user(callback_query: types.CallbackQuery):
     else:
         await callback_query.answer("❌ Ошибка базы данных!")
 
-@dp.callback_query_handler(lambda c: c.data.startswith('reject_'))
-async def reject_user(callback_query: types.CallbackQuery):
-    user_id = int(callback_query.data.split('_')[1])
-    admin_id = callback_query.from_user.id
+@router.route(CB_REJECT, int, admin=True)
+async def reject_user(callback_query: types.CallbackQuery, user_id: int):
+    # Обновляем статус в базе; в ответ приходит обновлённая строка
+    user = await change_status(user_id, "rejected", callback_query.from_user.id)
     
-    if admin_id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
-        return
-    
-    # Обновляем статус в базе
-    success = await db.update_user_status(user_id, "rejected")
-    
-    if success:
+    if user:
         # Уведомляем пользователя
-        try:
-            await bot.send_message(
-                user_id,
-                "❌ Ваша заявка отклонена администратором."
-            )
-        except:
-            pass
+        sender.send_message(user_id, REJECTED_TEXT)
         
-        user = await db.get_user(user_id)
-        user_name = user.get("full_name", "Пользователь") if user else "Пользователь"
+        user_name = user.get("full_name") or "Пользователь"
         
         await callback_query.message.edit_text(
             f"❌ Заявка отклонена!\n"
@@ -266,96 +411,252 @@ async def reject_user(callback_query: types.CallbackQuery):
         await callback_query.answer("❌ Ошибка!")
 
 # ==================== АДМИН ПАНЕЛЬ ====================
-@dp.callback_query_handler(lambda c: c.data == 'admin_panel')
+@router.route(CB_ADMIN_PANEL, admin=True)
 async def admin_panel(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
-        return
-    
     await callback_query.message.edit_text(
         "👨‍💻 Панель администратора Lap Video Chat",
         reply_markup=get_admin_keyboard()
     )
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'admin_requests')
-async def show_requests(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
-        return
-    
-    pending_users = await db.get_pending_users()
+# Списки в админ-панели листаются курсором (created_at, telegram_id),
+# поэтому каждая страница — один небольшой запрос независимо от размера таблицы
+REQUESTS_PAGE_SIZE = 10
+USERS_PAGE_SIZE = 15
+
+def encode_cursor(user):
+    """Компактный курсор для callback_data: микросекунды и ID в base36"""
+    created_at = user.get("created_at") or "1970-01-01T00:00:00+00:00"
+    created_at = created_at.replace("Z", "+00:00")
+    # Дробная часть секунд может прийти не из 6 цифр
+    match = re.match(r"^([^.+]+)(?:\.(\d+))?(.*)$", created_at)
+    fraction = (match.group(2) or "").ljust(6, "0")[:6]
+    dt = datetime.fromisoformat(f"{match.group(1)}.{fraction}{match.group(3) or '+00:00'}")
+    micros = int(dt.timestamp()) * 1_000_000 + dt.microsecond
+    return f"{base36(micros)}_{base36(user['telegram_id'])}"
+
+def decode_cursor(token):
+    micros, telegram_id = (int(part, 36) for part in token.split("_"))
+    dt = datetime.fromtimestamp(micros // 1_000_000, tz=timezone.utc).replace(microsecond=micros % 1_000_000)
+    return dt.isoformat(timespec="microseconds"), telegram_id
+
+def base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        number, rest = divmod(number, 36)
+        result = digits[rest] + result
+        if not number:
+            return result
+
+def get_page_buttons(code, rows, has_prev, has_next):
+    """Кнопки листания: направление (p — назад, n — вперёд) и курсор крайней строки"""
+    buttons = []
+    if rows and has_prev:
+        buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=router.pack(code, "p", encode_cursor(rows[0]))))
+    if rows and has_next:
+        buttons.append(InlineKeyboardButton("Далее ➡️", callback_data=router.pack(code, "n", encode_cursor(rows[-1]))))
+    return buttons
+
+async def render_requests_page(callback_query, cursor=None, backward=False):
+    pending_users, has_more = await db.get_users_page(
+        status="pending", limit=REQUESTS_PAGE_SIZE, cursor=cursor, backward=backward
+    )
     
     if not pending_users:
         text = "📋 Список заявок пуст."
     else:
         text = "📋 Ожидающие заявки:\n\n"
-        for user in pending_users[:10]:
+        for user in pending_users:
             text += (
                 f"👤 {user.get('full_name', 'Без имени')}\n"
-                f"📱 +{user.get('phone_number', 'Нет номера')}\n"
+                f"📱 +{(user.get('phone_number') or 'Нет номера').lstrip('+')}\n"
                 f"🆔 {user.get('telegram_id', 'Нет ID')}\n"
                 f"━━━━━━━━━━━━━━━━\n"
             )
     
-    await callback_query.message.edit_text(
-        text,
-        reply_markup=get_admin_keyboard()
+    has_prev = has_more if backward else cursor is not None
+    has_next = cursor is not None if backward else has_more
+    keyboard = get_admin_keyboard(
+        get_page_buttons(CB_REQUESTS_PAGE, pending_users, has_prev, has_next)
     )
-    await callback_query.answer(f"Заявок: {len(pending_users)}")
+    if pending_users:
+        keyboard.row(InlineKeyboardButton("📦 Массовая модерация", callback_data=router.pack(CB_BULK_MENU)))
+    await callback_query.message.edit_text(text, reply_markup=keyboard)
 
-@dp.callback_query_handler(lambda c: c.data == 'admin_all_users')
-async def show_all_users(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
-        return
-    
-    all_users = await db.get_all_users()
+async def render_users_page(callback_query, cursor=None, backward=False):
+    all_users, has_more = await db.get_users_page(
+        limit=USERS_PAGE_SIZE, cursor=cursor, backward=backward
+    )
     
     if not all_users:
         text = "👥 Пользователей пока нет."
     else:
         text = "👥 Все пользователи:\n\n"
-        for user in all_users[:15]:
+        for user in all_users:
             status_icon = "✅" if user.get("status") == "approved" else "⏳" if user.get("status") == "pending" else "🚫"
             text += (
                 f"{status_icon} {user.get('full_name', 'Без имени')}\n"
-                f"📱 +{user.get('phone_number', 'Нет')} | 🆔 {user.get('telegram_id', 'Нет')}\n"
+                f"📱 +{(user.get('phone_number') or 'Нет').lstrip('+')} | 🆔 {user.get('telegram_id', 'Нет')}\n"
                 f"━━━━━━━━━━━━━━━━\n"
             )
     
+    has_prev = has_more if backward else cursor is not None
+    has_next = cursor is not None if backward else has_more
     await callback_query.message.edit_text(
         text[:4000],
+        reply_markup=get_admin_keyboard(
+            get_page_buttons(CB_USERS_PAGE, all_users, has_prev, has_next)
+        )
+    )
+
+@router.route(CB_REQUESTS, admin=True)
+async def show_requests(callback_query: types.CallbackQuery):
+    _, counts = await asyncio.gather(
+        render_requests_page(callback_query),
+        db.get_status_counts()
+    )
+    await callback_query.answer(f"Заявок: {counts['pending']}" if counts else None)
+
+@router.route(CB_REQUESTS_PAGE, str, decode_cursor, admin=True)
+async def page_requests(callback_query: types.CallbackQuery, direction: str, cursor):
+    await render_requests_page(callback_query, cursor, backward=direction == "p")
+    await callback_query.answer()
+
+@router.route(CB_USERS, admin=True)
+async def show_all_users(callback_query: types.CallbackQuery):
+    _, counts = await asyncio.gather(
+        render_users_page(callback_query),
+        db.get_status_counts()
+    )
+    await callback_query.answer(f"Всего: {counts['total']}" if counts else None)
+
+@router.route(CB_USERS_PAGE, str, decode_cursor, admin=True)
+async def page_all_users(callback_query: types.CallbackQuery, direction: str, cursor):
+    await render_users_page(callback_query, cursor, backward=direction == "p")
+    await callback_query.answer()
+
+# ==================== МАССОВАЯ МОДЕРАЦИЯ ====================
+# Заявки обрабатываются пачками: одна выборка ID и один update ... in (...) на пачку
+BULK_BATCH_SIZE = 100
+
+def get_bulk_keyboard(scope_suffix=""):
+    """Кнопки массовой модерации; scope_suffix задаёт фильтр (например, префикс номера)"""
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    if scope_suffix:
+        keyboard.add(
+            InlineKeyboardButton("✅ Одобрить", callback_data=router.pack(CB_BULK, "a", scope_suffix)),
+            InlineKeyboardButton("❌ Отклонить", callback_data=router.pack(CB_BULK, "r", scope_suffix))
+        )
+    else:
+        keyboard.add(
+            InlineKeyboardButton("✅ Одобрить все", callback_data=router.pack(CB_BULK, "a", "all")),
+            InlineKeyboardButton("❌ Отклонить все", callback_data=router.pack(CB_BULK, "r", "all")),
+            InlineKeyboardButton("✅ 10 старейших", callback_data=router.pack(CB_BULK, "a", "old10")),
+            InlineKeyboardButton("✅ 50 старейших", callback_data=router.pack(CB_BULK, "a", "old50")),
+            InlineKeyboardButton("🔎 По префиксу номера", callback_data=router.pack(CB_BULK_PREFIX))
+        )
+    keyboard.add(InlineKeyboardButton("❌ Отмена", callback_data=router.pack(CB_CANCEL)))
+    return keyboard
+
+async def run_bulk_moderation(message: types.Message, status: str, actor_id: int,
+                              limit: int = None, phone_prefix: str = None):
+    """Обработать заявки пачками, редактируя одно сообщение с прогрессом"""
+    text = APPROVED_TEXT if status == "approved" else REJECTED_TEXT
+    reply_markup = get_user_menu(user_is_admin=False) if status == "approved" else None
+    action = "Одобрено" if status == "approved" else "Отклонено"
+    processed = 0
+    
+    await message.edit_text("⏳ Массовая модерация запущена...")
+    while limit is None or processed < limit:
+        batch_size = BULK_BATCH_SIZE if limit is None else min(BULK_BATCH_SIZE, limit - processed)
+        ids = await db.get_pending_ids(batch_size, phone_prefix)
+        if not ids:
+            break
+        users = await db.bulk_update_status(ids, status, from_status="pending")
+        if not users:
+            # Ошибка базы: не крутимся на тех же заявках
+            break
+        for user in users:
+            audit.record(user["telegram_id"], actor_id, "pending", status)
+        
+        # Уведомления уходят через общую очередь с низким приоритетом
+        sender.send_many(
+            [user["telegram_id"] for user in users],
+            text,
+            priority=PRIORITY_LOW,
+            reply_markup=reply_markup
+        )
+        processed += len(users)
+        await message.edit_text(f"⏳ {action}: {processed}...")
+    
+    await message.edit_text(
+        f"✅ Массовая модерация завершена\n"
+        f"{action}: {processed}\n"
+        f"📤 Уведомления в очереди: {sender.qsize()}",
         reply_markup=get_admin_keyboard()
     )
-    await callback_query.answer(f"Всего: {len(all_users)}")
 
-@dp.callback_query_handler(lambda c: c.data == 'admin_ban')
-async def start_ban_user(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
+@router.route(CB_BULK_MENU, admin=True)
+async def bulk_menu(callback_query: types.CallbackQuery):
+    await callback_query.message.edit_text(
+        "📦 Массовая модерация заявок\n\n"
+        "Выберите, какие заявки обработать:",
+        reply_markup=get_bulk_keyboard()
+    )
+    await callback_query.answer()
+
+@router.route(CB_BULK_PREFIX, admin=True)
+async def bulk_prefix(callback_query: types.CallbackQuery):
+    await AdminStates.waiting_bulk_prefix.set()
+    await callback_query.message.edit_text(
+        "🔎 Введите начало номера телефона (например, 7999):",
+        reply_markup=InlineKeyboardMarkup().add(
+            InlineKeyboardButton("❌ Отмена", callback_data=router.pack(CB_CANCEL))
+        )
+    )
+    await callback_query.answer()
+
+@dp.message_handler(state=AdminStates.waiting_bulk_prefix)
+async def process_bulk_prefix(message: types.Message, state: FSMContext):
+    prefix = (message.text or "").strip().lstrip("+")
+    if not prefix.isdigit() or len(prefix) > 15:
+        await message.answer("❌ Неверный формат. Введите цифры номера.")
         return
     
+    await state.finish()
+    await message.answer(
+        f"📦 Заявки с номером +{prefix}…",
+        reply_markup=get_bulk_keyboard(f"p{prefix}")
+    )
+
+@router.route(CB_BULK, str, str, admin=True)
+async def bulk_moderate(callback_query: types.CallbackQuery, action: str, scope: str):
+    status = "approved" if action == "a" else "rejected"
+    limit = int(scope[3:]) if scope.startswith("old") else None
+    phone_prefix = scope[1:] if scope.startswith("p") else None
+    
+    await callback_query.answer("⏳ Запущено")
+    await run_bulk_moderation(callback_query.message, status, callback_query.from_user.id, limit, phone_prefix)
+
+@router.route(CB_BAN, admin=True)
+async def start_ban_user(callback_query: types.CallbackQuery):
     await AdminStates.waiting_ban_id.set()
     await callback_query.message.edit_text(
         "🚫 Введите ID пользователя для блокировки:",
         reply_markup=InlineKeyboardMarkup().add(
-            InlineKeyboardButton("❌ Отмена", callback_data="cancel_action")
+            InlineKeyboardButton("❌ Отмена", callback_data=router.pack(CB_CANCEL))
         )
     )
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'admin_unban')
+@router.route(CB_UNBAN, admin=True)
 async def start_unban_user(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
-        return
-    
     await AdminStates.waiting_unban_id.set()
     await callback_query.message.edit_text(
         "✅ Введите ID пользователя для разблокировки:",
         reply_markup=InlineKeyboardMarkup().add(
-            InlineKeyboardButton("❌ Отмена", callback_data="cancel_action")
+            InlineKeyboardButton("❌ Отмена", callback_data=router.pack(CB_CANCEL))
         )
     )
     await callback_query.answer()
@@ -364,16 +665,13 @@ async def start_unban_user(callback_query: types.CallbackQuery):
 async def process_ban_id(message: types.Message, state: FSMContext):
     try:
         user_id = int(message.text)
-        success = await db.ban_user(user_id)
+        success = await change_status(user_id, "banned", message.from_user.id)
         
         if success:
             await message.answer(f"✅ Пользователь {user_id} заблокирован!")
             
             # Уведомляем пользователя если возможно
-            try:
-                await bot.send_message(user_id, "🚫 Вы были заблокированы администратором.")
-            except:
-                pass
+            sender.send_message(user_id, "🚫 Вы были заблокированы администратором.")
         else:
             await message.answer(f"❌ Не удалось заблокировать пользователя {user_id}")
     except ValueError:
@@ -385,16 +683,13 @@ async def process_ban_id(message: types.Message, state: FSMContext):
 async def process_unban_id(message: types.Message, state: FSMContext):
     try:
         user_id = int(message.text)
-        success = await db.unban_user(user_id)
+        success = await change_status(user_id, "approved", message.from_user.id)
         
         if success:
             await message.answer(f"✅ Пользователь {user_id} разблокирован!")
             
             # Уведомляем пользователя если возможно
-            try:
-                await bot.send_message(user_id, "✅ Вы были разблокированы администратором.")
-            except:
-                pass
+            sender.send_message(user_id, "✅ Вы были разблокированы администратором.")
         else:
             await message.answer(f"❌ Не удалось разблокировать пользователя {user_id}")
     except ValueError:
@@ -402,23 +697,26 @@ async def process_unban_id(message: types.Message, state: FSMContext):
     finally:
         await state.finish()
 
-@dp.callback_query_handler(lambda c: c.data == 'admin_stats', state="*")
+@router.route(CB_STATS, admin=True, any_state=True)
 async def admin_stats(callback_query: types.CallbackQuery):
-    if callback_query.from_user.id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
+    counts = await db.get_status_counts()
+    if counts is None:
+        await callback_query.answer("❌ Ошибка базы данных!")
         return
     
-    users = await db.get_all_users()
-    pending = len([u for u in users if u.get("status") == "pending"])
-    approved = len([u for u in users if u.get("status") == "approved"])
-    banned = len([u for u in users if u.get("status") == "banned"])
-    
     stats_text = (
         "📊 Статистика бота:\n"
-        f"👤 Всего пользователей: {len(users)}\n"
-        f"⏳ Ожидают: {pending}\n"
-        f"✅ Одобрено: {approved}\n"
-        f"🚫 Забанено: {banned}"
+        f"👤 Всего пользователей: {counts['total']}\n"
+        f"⏳ Ожидают: {counts['pending']}\n"
+        f"✅ Одобрено: {counts['approved']}\n"
+        f"❌ Отклонено: {counts['rejected']}\n"
+        f"🚫 Забанено: {counts['banned']}"
+    )
+    
+    cache = db.user_cache.stats()
+    stats_text += (
+        f"\n\n🗃 Кэш пользователей: {cache['size']}/{cache['maxsize']}\n"
+        f"Попадания: {cache['hits']} | Промахи: {cache['misses']} | Вытеснения: {cache['evictions']}"
     )
     
     await callback_query.message.edit_text(
@@ -427,20 +725,260 @@ async def admin_stats(callback_query: types.CallbackQuery):
     )
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'cancel_action', state="*")
-async def cancel_action(callback_query: types.CallbackQuery, state: FSMContext):
-    if callback_query.from_user.id not in ADMIN_IDS:
-        await callback_query.answer("❌ Нет прав!")
+# ==================== ПОИСК ПОЛЬЗОВАТЕЛЕЙ ====================
+# Запрос и текущая страница хранятся в данных FSM админа: в callback_data они не помещаются
+SEARCH_PAGE_SIZE = 5
+STATUS_ICONS = {"approved": "✅", "pending": "⏳", "rejected": "❌", "banned": "🚫"}
+
+def get_search_keyboard(rows, after_id, has_more):
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    for user in rows:
+        user_id = user["telegram_id"]
+        name = (user.get("full_name") or str(user_id))[:20]
+        status = user.get("status")
+        history = InlineKeyboardButton("📜", callback_data=router.pack(CB_HISTORY, user_id))
+        if status == "banned":
+            keyboard.row(
+                InlineKeyboardButton(f"✅ Разбанить {name}", callback_data=router.pack(CB_SEARCH_UNBAN, user_id)),
+                history
+            )
+        elif status == "approved":
+            keyboard.row(
+                InlineKeyboardButton(f"🚫 Забанить {name}", callback_data=router.pack(CB_SEARCH_BAN, user_id)),
+                history
+            )
+        else:
+            keyboard.row(
+                InlineKeyboardButton(f"✅ Одобрить {name}", callback_data=router.pack(CB_SEARCH_APPROVE, user_id)),
+                InlineKeyboardButton("🚫 Забанить", callback_data=router.pack(CB_SEARCH_BAN, user_id)),
+                history
+            )
+    nav = []
+    if after_id:
+        nav.append(InlineKeyboardButton("⏮ В начало", callback_data=router.pack(CB_SEARCH_PAGE, 0)))
+    if has_more:
+        nav.append(InlineKeyboardButton("Далее ➡️", callback_data=router.pack(CB_SEARCH_PAGE, rows[-1]["telegram_id"])))
+    if nav:
+        keyboard.row(*nav)
+    keyboard.row(
+        InlineKeyboardButton("🔍 Новый поиск", callback_data=router.pack(CB_SEARCH)),
+        InlineKeyboardButton("👨‍💻 Админ панель", callback_data=router.pack(CB_ADMIN_PANEL))
+    )
+    return keyboard
+
+async def render_search(message: types.Message, query: str, after_id: int = 0, edit: bool = True):
+    """Страница результатов поиска; edit=False — новым сообщением"""
+    rows, has_more = await db.search_users(query, after_id, SEARCH_PAGE_SIZE)
+    await dp.current_state().update_data(search_query=query, search_after=after_id)
+    
+    if not rows:
+        text = f"🔍 По запросу «{query}» никого не найдено."
+    else:
+        text = f"🔍 Результаты по запросу «{query}»:\n\n"
+        for user in rows:
+            text += (
+                f"{STATUS_ICONS.get(user.get('status'), '❓')} {user.get('full_name') or 'Без имени'}"
+                f"{' | @' + user['username'] if user.get('username') else ''}\n"
+                f"📱 +{(user.get('phone_number') or 'Нет').lstrip('+')} | 🆔 {user['telegram_id']}\n"
+                f"━━━━━━━━━━━━━━━━\n"
+            )
+    keyboard = get_search_keyboard(rows, after_id, has_more)
+    if edit:
+        await message.edit_text(text[:4000], reply_markup=keyboard)
+    else:
+        await message.answer(text[:4000], reply_markup=keyboard)
+
+async def refresh_search(callback_query: types.CallbackQuery):
+    """Перерисовать текущую страницу поиска после действия над пользователем"""
+    data = await dp.current_state().get_data()
+    if data.get("search_query"):
+        await render_search(callback_query.message, data["search_query"], data.get("search_after", 0))
+
+@router.route(CB_SEARCH, admin=True, any_state=True)
+async def start_search(callback_query: types.CallbackQuery):
+    await AdminStates.waiting_search.set()
+    await callback_query.message.edit_text(
+        "🔍 Поиск пользователя. Отправьте:\n"
+        "• начало номера телефона — 7999123\n"
+        "• @username или его начало\n"
+        "• часть имени — иван",
+        reply_markup=InlineKeyboardMarkup().add(
+            InlineKeyboardButton("❌ Отмена", callback_data=router.pack(CB_CANCEL))
+        )
+    )
+    await callback_query.answer()
+
+@dp.message_handler(commands=['search'], user_id=ADMIN_IDS, state="*")
+async def cmd_search(message: types.Message, state: FSMContext):
+    query = message.get_args().strip()
+    if not query:
+        await message.answer("Использование: /search <номер | @username | имя>")
+        return
+    await state.finish()
+    await render_search(message, query, edit=False)
+
+@dp.message_handler(state=AdminStates.waiting_search)
+async def process_search_query(message: types.Message, state: FSMContext):
+    query = (message.text or "").strip()
+    if not query:
+        await message.answer("❌ Отправьте текст запроса.")
+        return
+    await state.finish()
+    await render_search(message, query, edit=False)
+
+@router.route(CB_SEARCH_PAGE, int, admin=True)
+async def page_search(callback_query: types.CallbackQuery, after_id: int):
+    data = await dp.current_state().get_data()
+    if not data.get("search_query"):
+        await callback_query.answer("⚠️ Поиск устарел, начните заново")
+        return
+    await render_search(callback_query.message, data["search_query"], after_id)
+    await callback_query.answer()
+
+@router.route(CB_SEARCH_APPROVE, int, admin=True)
+async def search_approve(callback_query: types.CallbackQuery, user_id: int):
+    if not await change_status(user_id, "approved", callback_query.from_user.id):
+        await callback_query.answer("❌ Ошибка базы данных!")
+        return
+    sender.send_message(user_id, APPROVED_TEXT, reply_markup=get_user_menu(user_is_admin=False))
+    await refresh_search(callback_query)
+    await callback_query.answer("✅ Одобрено!")
+
+@router.route(CB_SEARCH_BAN, int, admin=True)
+async def search_ban(callback_query: types.CallbackQuery, user_id: int):
+    if not await change_status(user_id, "banned", callback_query.from_user.id):
+        await callback_query.answer("❌ Ошибка базы данных!")
+        return
+    sender.send_message(user_id, "🚫 Вы были заблокированы администратором.")
+    await refresh_search(callback_query)
+    await callback_query.answer("🚫 Заблокирован")
+
+@router.route(CB_SEARCH_UNBAN, int, admin=True)
+async def search_unban(callback_query: types.CallbackQuery, user_id: int):
+    if not await change_status(user_id, "approved", callback_query.from_user.id):
+        await callback_query.answer("❌ Ошибка базы данных!")
+        return
+    sender.send_message(user_id, "✅ Вы были разблокированы администратором.")
+    await refresh_search(callback_query)
+    await callback_query.answer("✅ Разблокирован")
+
+# ==================== ЖУРНАЛ МОДЕРАЦИИ ====================
+HISTORY_PAGE_SIZE = 10
+
+async def render_history(message: types.Message, user_id: int, before_id: int = 0, edit: bool = True):
+    # Записи из буфера сначала попадают в базу, иначе свежих действий не будет видно
+    await audit.flush()
+    rows, has_more = await db.get_audit_page(user_id, HISTORY_PAGE_SIZE, before_id or None)
+    
+    if not rows:
+        text = f"📜 История модерации 🆔 {user_id} пуста."
+    else:
+        text = f"📜 История модерации 🆔 {user_id}:\n\n"
+        for entry in rows:
+            old_icon = STATUS_ICONS.get(entry.get("old_status"), "❓")
+            new_icon = STATUS_ICONS.get(entry.get("new_status"), "❓")
+            when = (entry.get("created_at") or "")[:16].replace("T", " ")
+            text += f"{when} — {old_icon} → {new_icon} {entry.get('new_status')} (админ {entry.get('actor_id')})\n"
+    
+    keyboard = InlineKeyboardMarkup()
+    nav = []
+    if before_id:
+        nav.append(InlineKeyboardButton("⏮ В начало", callback_data=router.pack(CB_HISTORY_PAGE, user_id, 0)))
+    if has_more:
+        nav.append(InlineKeyboardButton("Далее ➡️", callback_data=router.pack(CB_HISTORY_PAGE, user_id, rows[-1]["id"])))
+    if nav:
+        keyboard.row(*nav)
+    keyboard.row(InlineKeyboardButton("👨‍💻 Админ панель", callback_data=router.pack(CB_ADMIN_PANEL)))
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard)
+    else:
+        await message.answer(text, reply_markup=keyboard)
+
+@dp.message_handler(commands=['history'], user_id=ADMIN_IDS)
+async def cmd_history(message: types.Message):
+    try:
+        user_id = int(message.get_args().strip())
+    except ValueError:
+        await message.answer("Использование: /history <ID пользователя>")
+        return
+    await render_history(message, user_id, edit=False)
+
+@router.route(CB_HISTORY, int, admin=True)
+async def show_history(callback_query: types.CallbackQuery, user_id: int):
+    await render_history(callback_query.message, user_id)
+    await callback_query.answer()
+
+@router.route(CB_HISTORY_PAGE, int, int, admin=True)
+async def page_history(callback_query: types.CallbackQuery, user_id: int, before_id: int):
+    await render_history(callback_query.message, user_id, before_id)
+    await callback_query.answer()
+
+# ==================== РАССЫЛКА ====================
+def get_broadcast_progress_keyboard(broadcast_id):
+    return InlineKeyboardMarkup().add(
+        InlineKeyboardButton("⏹ Остановить", callback_data=router.pack(CB_BROADCAST_STOP, broadcast_id))
+    )
+
+broadcaster = Broadcaster(bot, db, sender, progress_keyboard=get_broadcast_progress_keyboard)
+
+@router.route(CB_BROADCAST, admin=True)
+async def start_broadcast(callback_query: types.CallbackQuery):
+    if broadcaster.running:
+        await callback_query.answer("⏳ Предыдущая рассылка ещё идёт")
         return
     
+    await AdminStates.waiting_broadcast.set()
+    await callback_query.message.edit_text(
+        "📣 Отправьте сообщение для рассылки всем одобренным пользователям.\n"
+        "Можно текст с форматированием, фото, видео или файл — оно будет скопировано как есть.",
+        reply_markup=InlineKeyboardMarkup().add(
+            InlineKeyboardButton("❌ Отмена", callback_data=router.pack(CB_CANCEL))
+        )
+    )
+    await callback_query.answer()
+
+@dp.message_handler(state=AdminStates.waiting_broadcast, content_types=types.ContentTypes.ANY)
+async def process_broadcast_message(message: types.Message, state: FSMContext):
     await state.finish()
+    await message.reply(
+        "📣 Разослать это сообщение всем одобренным пользователям?",
+        reply_markup=InlineKeyboardMarkup().add(
+            InlineKeyboardButton("✅ Отправить", callback_data=router.pack(CB_BROADCAST_SEND, message.message_id)),
+            InlineKeyboardButton("❌ Отмена", callback_data=router.pack(CB_CANCEL))
+        )
+    )
+
+@router.route(CB_BROADCAST_SEND, int, admin=True)
+async def send_broadcast(callback_query: types.CallbackQuery, message_id: int):
+    progress = callback_query.message
+    broadcast = await broadcaster.start(progress.chat.id, message_id, progress)
+    if broadcast is None:
+        await callback_query.answer("⏳ Предыдущая рассылка ещё идёт")
+        return
+    
+    await progress.edit_text(
+        f"📣 Рассылка #{broadcast['id']} запущена...",
+        reply_markup=get_broadcast_progress_keyboard(broadcast["id"])
+    )
+    await callback_query.answer("📣 Запущено")
+
+@router.route(CB_BROADCAST_STOP, int, admin=True, any_state=True)
+async def stop_broadcast(callback_query: types.CallbackQuery, broadcast_id: int):
+    if await broadcaster.stop(broadcast_id):
+        await callback_query.answer("⏹ Остановлено")
+    else:
+        await callback_query.answer("Рассылка уже завершена")
+
+@router.route(CB_CANCEL, admin=True, any_state=True)
+async def cancel_action(callback_query: types.CallbackQuery):
+    await dp.current_state().finish()
     await callback_query.message.edit_text(
         "👨‍💻 Панель администратора Lap Video Chat",
         reply_markup=get_admin_keyboard()
     )
     await callback_query.answer("❌ Отменено")
 
-@dp.callback_query_handler(lambda c: c.data == 'user_main_menu')
+@router.route(CB_MAIN_MENU)
 async def user_main_menu(callback_query: types.CallbackQuery):
     user_id = callback_query.from_user.id
     is_admin = user_id in ADMIN_IDS
@@ -452,49 +990,274 @@ async def user_main_menu(callback_query: types.CallbackQuery):
     await callback_query.answer()
 
 # ==================== МЕНЮ ПОЛЬЗОВАТЕЛЯ ====================
-@dp.callback_query_handler(lambda c: c.data == 'user_chats')
-async def user_chats(callback_query: types.CallbackQuery):
+CONTACTS_PAGE_SIZE = 10
+# Контактов, среди которых ищем тех, кто в сети
+CHATS_CONTACTS_LIMIT = 200
+# Сколько секунд помнить, чьё присутствие пользователь может запрашивать (/presence)
+PRESENCE_CONTACTS_TTL = float(os.getenv("PRESENCE_CONTACTS_TTL", "60"))
+presence_contacts = TTLCache(maxsize=10000, ttl=PRESENCE_CONTACTS_TTL)
+
+async def get_contact_users(owner_id: int):
+    """Одобренные пользователи из контактов owner_id: {telegram_id: имя из контакта}"""
+    # Контакты -> зарегистрированные пользователи: два запроса на весь список
+    contacts, _ = await db.get_contacts_page(owner_id, limit=CHATS_CONTACTS_LIMIT)
+    matched = await db.match_phones([c["phone_number"] for c in contacts]) or {}
+    names = {}
+    for contact in contacts:
+        found = matched.get(contact["phone_number"])
+        if found and found.get("status") == "approved" and found["telegram_id"] != owner_id:
+            names[found["telegram_id"]] = contact.get("name") or found.get("full_name") or contact["phone_number"]
+    return names
+
+async def presence_visible_ids(user_id: int):
+    """Чьё присутствие user_id может запрашивать: его контакты в приложении и участники его звонков"""
+    contacts = presence_contacts.get(user_id)
+    if contacts is MISSING:
+        contacts = frozenset(await get_contact_users(user_id))
+        presence_contacts.set(user_id, contacts)
+    return contacts | signaling.call_peers(user_id)
+
+def get_call_keyboard(call_id: str):
+    return InlineKeyboardMarkup().add(InlineKeyboardButton(
+        "📞 Открыть звонок", web_app=WebAppInfo(url=f"{MINIAPP_URL}?call={call_id}")
+    ))
+
+@router.route(CB_CHATS)
+async def user_chats(callback_query: types.CallbackQuery, user: dict):
     user_id = callback_query.from_user.id
-    user = await db.get_user(user_id)
     
     if not user or user.get("status") != "approved":
         await callback_query.answer("❌ Доступ запрещен!")
         return
     
-    await callback_query.message.edit_text(
-        "📞 Ваши чаты:\n\n"
-        "Эта функция будет доступна после настройки системы звонков.\n"
-        "Сейчас можно:\n"
-        "• Просматривать историю звонков\n"
-        "• Создавать новые чаты\n"
-        "• Приглашать контактов",
-        reply_markup=get_user_menu(user_is_admin=user_id in ADMIN_IDS)
+    names = await get_contact_users(user_id)
+    online = presence.online(list(names))
+    
+    keyboard = InlineKeyboardMarkup()
+    text = "📞 Ваши чаты:\n\n"
+    if online:
+        text += f"🟢 Сейчас в сети ({len(online)}):\n"
+        text += "".join(f"• {names[contact_id]}\n" for contact_id in online[:CONTACTS_PAGE_SIZE])
+        if len(online) > CONTACTS_PAGE_SIZE:
+            text += f"… и ещё {len(online) - CONTACTS_PAGE_SIZE}\n"
+        if MINIAPP_URL:
+            for contact_id in online[:CONTACTS_PAGE_SIZE]:
+                keyboard.row(InlineKeyboardButton(
+                    f"📞 {names[contact_id]}"[:40], callback_data=router.pack(CB_CALL, contact_id)
+                ))
+    elif names:
+        text += "Никого из ваших контактов сейчас нет в сети.\n"
+    else:
+        text += "Добавьте контакты, чтобы видеть, кто из них в сети.\n"
+    text += "\nЗвонок начинается в мини-приложении."
+    keyboard.row(InlineKeyboardButton("🏠 Главное меню", callback_data=router.pack(CB_MAIN_MENU)))
+    
+    await callback_query.message.edit_text(text, reply_markup=keyboard)
+    await callback_query.answer()
+
+# Звонок пишет другому пользователю — свой, более строгий лимит
+@router.route(CB_CALL, int, throttle="call")
+async def start_call(callback_query: types.CallbackQuery, contact_id: int, user: dict):
+    user_id = callback_query.from_user.id
+    if not user or user.get("status") != "approved":
+        await callback_query.answer("❌ Доступ запрещен!")
+        return
+    if not MINIAPP_URL:
+        await callback_query.answer("Звонки не настроены")
+        return
+    # Звонить можно только своим контактам
+    names = await get_contact_users(user_id)
+    if contact_id not in names:
+        await callback_query.answer("❌ Этого пользователя нет в ваших контактах")
+        return
+    
+    # ID звонка выдаёт сигнальный сервер: в комнату войдут только эти двое
+    call_id = signaling.create_call([user_id, contact_id])
+    caller_name = callback_query.from_user.full_name
+    sender.send_message(
+        contact_id,
+        f"📞 Вам звонит {caller_name}",
+        priority=PRIORITY_HIGH,
+        reply_markup=get_call_keyboard(call_id)
+    )
+    await callback_query.message.answer(
+        f"📞 Звонок {names[contact_id]}: откройте мини-приложение и нажмите «Начать звонок».",
+        reply_markup=get_call_keyboard(call_id)
     )
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'user_contacts')
-async def user_contacts(callback_query: types.CallbackQuery):
+def get_contacts_keyboard():
+    return InlineKeyboardMarkup(row_width=2).add(
+        InlineKeyboardButton("📋 Мои контакты", callback_data=router.pack(CB_CONTACTS_LIST)),
+        InlineKeyboardButton("➕ Добавить", callback_data=router.pack(CB_CONTACTS_ADD)),
+        InlineKeyboardButton("🏠 Главное меню", callback_data=router.pack(CB_MAIN_MENU))
+    )
+
+@router.route(CB_CONTACTS, any_state=True)
+async def user_contacts(callback_query: types.CallbackQuery, user: dict):
     user_id = callback_query.from_user.id
-    user = await db.get_user(user_id)
     
     if not user or user.get("status") != "approved":
         await callback_query.answer("❌ Доступ запрещен!")
         return
     
+    await dp.current_state().finish()
     await callback_query.message.edit_text(
         "👥 Управление контактами:\n\n"
         "1. Добавить контакт - отправьте номер телефона\n"
-        "2. Импортировать из телефонной книги\n"
-        "3. Поиск контактов\n\n"
-        "📱 Чтобы добавить контакт, просто отправьте номер телефона в формате +79991234567",
-        reply_markup=get_user_menu(user_is_admin=user_id in ADMIN_IDS)
+        "2. Импортировать из телефонной книги - пришлите файл .vcf\n"
+        "3. Мои контакты - кто из них уже в приложении\n\n"
+        "📱 Номера принимаются в любом виде: +79991234567, 8 (999) 123-45-67",
+        reply_markup=get_contacts_keyboard()
     )
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'user_settings')
-async def user_settings(callback_query: types.CallbackQuery):
+@router.route(CB_CONTACTS_ADD)
+async def start_add_contacts(callback_query: types.CallbackQuery, user: dict):
+    if not user or user.get("status") != "approved":
+        await callback_query.answer("❌ Доступ запрещен!")
+        return
+    
+    await ContactStates.waiting_contacts.set()
+    await callback_query.message.edit_text(
+        "➕ Отправьте контакты одним из способов:\n"
+        "• кнопкой «Контакт» в меню вложений\n"
+        "• текстом: номер и имя, по одному на строке\n"
+        "• файлом телефонной книги .vcf\n\n"
+        f"За раз — до {CONTACTS_IMPORT_LIMIT} номеров.",
+        reply_markup=InlineKeyboardMarkup().add(
+            InlineKeyboardButton("✅ Готово", callback_data=router.pack(CB_CONTACTS))
+        )
+    )
+    await callback_query.answer()
+
+async def read_contacts_file(message: types.Message):
+    """Текст присланного файла телефонной книги или None, если файл не подходит"""
+    document = message.document
+    if document.file_size and document.file_size > CONTACTS_FILE_MAX_BYTES:
+        await message.answer(f"❌ Файл больше {CONTACTS_FILE_MAX_BYTES // 1024} КБ.")
+        return None
+    buffer = await document.download(destination_file=io.BytesIO())
+    return buffer.getvalue().decode("utf-8", errors="replace")
+
+@dp.message_handler(content_types=['contact', 'text', 'document'], state=ContactStates.waiting_contacts)
+async def process_contacts_import(message: types.Message, user: dict):
+    owner_id = message.from_user.id
+    if not user or user.get("status") != "approved":
+        await dp.current_state().finish()
+        return
+    
+    if message.contact:
+        contact = message.contact
+        name = f"{contact.first_name or ''} {contact.last_name or ''}".strip()
+        phone = normalize_phone(contact.phone_number)
+        contacts, invalid = ([{"phone_number": phone, "name": name or None}], 0) if phone else ([], 1)
+    else:
+        text = await read_contacts_file(message) if message.document else message.text
+        if text is None:
+            return
+        contacts, invalid = parse_contacts(text)
+    
+    if not contacts:
+        await message.answer("❌ Не нашёл ни одного номера. Пример: +79991234567 Иван")
+        return
+    skipped = max(0, len(contacts) - CONTACTS_IMPORT_LIMIT)
+    contacts = contacts[:CONTACTS_IMPORT_LIMIT]
+    
+    added, matched = await asyncio.gather(
+        db.add_contacts(owner_id, contacts),
+        db.match_phones([c["phone_number"] for c in contacts])
+    )
+    presence_contacts.invalidate(owner_id)
+    if added is None or matched is None:
+        await message.answer("❌ Ошибка базы данных, попробуйте позже.")
+        return
+    
+    in_app = [
+        c for c in contacts
+        if (matched.get(c["phone_number"]) or {}).get("status") == "approved"
+        and matched[c["phone_number"]]["telegram_id"] != owner_id
+    ]
+    text = f"✅ Добавлено контактов: {added}"
+    if len(contacts) > added:
+        text += f"\n♻️ Уже были в списке: {len(contacts) - added}"
+    if invalid:
+        text += f"\n⚠️ Не похожи на номер: {invalid}"
+    if skipped:
+        text += f"\n✂️ Не вошли в лимит {CONTACTS_IMPORT_LIMIT}: {skipped}"
+    text += f"\n\n📞 В приложении: {len(in_app)}"
+    for contact in in_app[:CONTACTS_PAGE_SIZE]:
+        text += f"\n• {contact['name'] or matched[contact['phone_number']].get('full_name') or contact['phone_number']}"
+    if len(in_app) > CONTACTS_PAGE_SIZE:
+        text += f"\n… и ещё {len(in_app) - CONTACTS_PAGE_SIZE}"
+    
+    await message.answer(
+        text + "\n\nМожно отправить ещё номера или нажать «Готово».",
+        reply_markup=InlineKeyboardMarkup().add(
+            InlineKeyboardButton("✅ Готово", callback_data=router.pack(CB_CONTACTS))
+        )
+    )
+
+async def render_contacts(message: types.Message, owner_id: int, after_phone: str = ""):
+    rows, has_more = await db.get_contacts_page(owner_id, after_phone, CONTACTS_PAGE_SIZE)
+    # Кто из страницы зарегистрирован — один запрос на всю страницу
+    matched = await db.match_phones([row["phone_number"] for row in rows]) or {}
+    
+    keyboard = InlineKeyboardMarkup()
+    if not rows:
+        text = "📋 Список контактов пуст." if not after_phone else "📋 Больше контактов нет."
+    else:
+        text = "📋 Ваши контакты:\n\n"
+        for row in rows:
+            found = matched.get(row["phone_number"])
+            online = found and found.get("status") == "approved" and found["telegram_id"] != owner_id
+            name = row.get("name") or (found or {}).get("full_name") or ""
+            text += f"{'✅' if online else '▫️'} {row['phone_number']} {name}\n"
+            keyboard.row(InlineKeyboardButton(
+                f"🗑 {name or row['phone_number']}"[:40],
+                callback_data=router.pack(CB_CONTACT_DELETE, row["phone_number"])
+            ))
+        text += "\n✅ — уже в приложении"
+    
+    nav = []
+    if after_phone:
+        nav.append(InlineKeyboardButton("⏮ В начало", callback_data=router.pack(CB_CONTACTS_LIST)))
+    if has_more:
+        nav.append(InlineKeyboardButton("Далее ➡️", callback_data=router.pack(CB_CONTACTS_PAGE, rows[-1]["phone_number"])))
+    if nav:
+        keyboard.row(*nav)
+    keyboard.row(InlineKeyboardButton("👥 Контакты", callback_data=router.pack(CB_CONTACTS)))
+    await message.edit_text(text, reply_markup=keyboard)
+
+@router.route(CB_CONTACTS_LIST)
+async def list_contacts(callback_query: types.CallbackQuery, user: dict):
+    if not user or user.get("status") != "approved":
+        await callback_query.answer("❌ Доступ запрещен!")
+        return
+    await render_contacts(callback_query.message, callback_query.from_user.id)
+    await callback_query.answer()
+
+@router.route(CB_CONTACTS_PAGE, str)
+async def page_contacts(callback_query: types.CallbackQuery, after_phone: str, user: dict):
+    if not user or user.get("status") != "approved":
+        await callback_query.answer("❌ Доступ запрещен!")
+        return
+    await render_contacts(callback_query.message, callback_query.from_user.id, after_phone)
+    await callback_query.answer()
+
+@router.route(CB_CONTACT_DELETE, str)
+async def delete_contact(callback_query: types.CallbackQuery, phone: str, user: dict):
+    if not user or user.get("status") != "approved":
+        await callback_query.answer("❌ Доступ запрещен!")
+        return
+    deleted = await db.delete_contact(callback_query.from_user.id, phone)
+    presence_contacts.invalidate(callback_query.from_user.id)
+    await render_contacts(callback_query.message, callback_query.from_user.id)
+    await callback_query.answer("🗑 Удалено" if deleted else "Контакта уже нет")
+
+@router.route(CB_SETTINGS)
+async def user_settings(callback_query: types.CallbackQuery, user: dict):
     user_id = callback_query.from_user.id
-    user = await db.get_user(user_id)
     
     if not user or user.get("status") != "approved":
         await callback_query.answer("❌ Доступ запрещен!")
@@ -510,7 +1273,7 @@ async def user_settings(callback_query: types.CallbackQuery):
     )
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'user_help')
+@router.route(CB_HELP)
 async def user_help(callback_query: types.CallbackQuery):
     await callback_query.message.edit_text(
         "🆘 Помощь:\n\n"
@@ -524,23 +1287,99 @@ async def user_help(callback_query: types.CallbackQuery):
 
 # ==================== ЗАПУСК БОТА ====================
 async def on_startup(dp):
+    await sender.start()
+    await scheduler.start()
+    # Проверка связи с базой идёт в фоне, обновления принимаются сразу
+    await db.start()
+    # Рассылка, прерванная перезапуском, продолжается с сохранённого места
+    await broadcaster.resume()
     logger.info("✅ Lap Video Chat Bot запущен!")
     for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, "✅ Бот запущен и готов к работе!")
-        except Exception as e:
-            logger.error(f"Не удалось уведомить админа {admin_id}: {e}")
+        sender.send_message(admin_id, "✅ Бот запущен и готов к работе!", priority=PRIORITY_HIGH)
 
 async def on_shutdown(dp):
+    await scheduler.stop()
+    await broadcaster.close()
+    await sender.stop()
+    await audit.close()
+    await db.close()
     logger.info("Бот остановлен")
 
-if __name__ == '__main__':
-    from aiogram import executor
+def create_web_app():
+    """Встроенный HTTP-сервер: мини-приложение, сигналинг для него и метрики"""
+    app = web.Application()
+    setup_signaling(app, signaling)
+    setup_presence(app, presence, BOT_TOKEN, is_call_allowed, presence_visible_ids)
+    setup_metrics(app)
+    # Статика последней: её маршрут ловит все остальные GET-пути
+    setup_static(app, StaticServer())
+    return app
+
+def run_webhook():
+    """Принимать обновления по HTTP во встроенном aiohttp-сервере"""
+    app = create_web_app()
+    setup_webhook(app, dp, WEBHOOK_PATH, WEBHOOK_SECRET)
+    
+    async def set_webhook():
+        try:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                drop_pending_updates=True
+            )
+            logger.info("✅ Webhook установлен")
+        except Exception as e:
+            logger.error(f"❌ Не удалось установить webhook: {e}")
+    
+    async def startup(app):
+        # Сервер начинает слушать порт только после on_startup, поэтому
+        # регистрация вебхука в Telegram не задерживает запуск
+        app["set_webhook"] = asyncio.create_task(set_webhook())
+        await on_startup(dp)
+        startup_timer.mark("startup")
+        logger.info(f"🚀 Готов к работе за {startup_timer.total() * 1000:.0f} мс")
+    
+    async def shutdown(app):
+        app["set_webhook"].cancel()
+        await on_shutdown(dp)
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        session = await bot.get_session()
+        await session.close()
+    
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    logger.info(f"🌐 Webhook: {WEBHOOK_URL}{WEBHOOK_PATH}, сервер {WEBAPP_HOST}:{WEBAPP_PORT}")
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
+
+def run_polling():
+    """Long polling; HTTP-сервер для мини-приложения работает рядом в том же цикле"""
+    runner = web.AppRunner(create_web_app())
+    
+    async def startup(dp):
+        await runner.setup()
+        await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+        logger.info(f"🌐 HTTP-сервер: {WEBAPP_HOST}:{WEBAPP_PORT}")
+        startup_timer.mark("http")
+        await on_startup(dp)
+        startup_timer.mark("startup")
+        logger.info(f"🚀 Готов к работе за {startup_timer.total() * 1000:.0f} мс")
+    
+    async def shutdown(dp):
+        await runner.cleanup()
+        await on_shutdown(dp)
     
-    logger.info("🚀 Запуск Lap Video Chat Bot...")
     executor.start_polling(
         dp,
         skip_updates=True,
-        on_startup=on_startup,
-        on_shutdown=on_shutdown
+        on_startup=startup,
+        on_shutdown=shutdown
     )
+
+if __name__ == '__main__':
+    startup_timer.mark("init")
+    logger.info("🚀 Запуск Lap Video Chat Bot...")
+    if BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        run_polling()
@@ -0,0 +1,274 @@
+import os
+import time
+import hmac
+import logging
+import functools
+import contextvars
+from bisect import bisect_left
+
+from aiohttp import web
+from aiogram import Bot, types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+# /metrics требует заголовок "Authorization: Bearer <токен>"; без токена не подключается
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Монотонный счётчик; значения хранятся по кортежу меток"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def inc(self, labels=(), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+
+class Gauge(Counter):
+    """Текущее значение, может расти и уменьшаться"""
+
+    kind = "gauge"
+
+    def dec(self, labels=(), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels=()):
+        self.values[labels] = value
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными границами корзин"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики по корзинам (+ последняя для +Inf), сумма, количество]
+        self.values = {}
+
+    def observe(self, value: float, labels=()):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self):
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {count}"
+
+class Registry:
+    """Набор метрик и функций, обновляющих их перед выдачей"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        """func() вызывается перед каждой выдачей /metrics (например, чтобы выставить Gauge)"""
+        self.collectors.append(func)
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.error(f"Ошибка сборщика метрик: {e}")
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+UPDATES_TOTAL = REGISTRY.register(Counter(
+    "bot_updates_total", "Обработанные обновления по типу", ["type"]))
+UPDATES_IN_FLIGHT = REGISTRY.register(Gauge(
+    "bot_updates_in_flight", "Обновления в обработке"))
+UPDATE_SECONDS = REGISTRY.register(Histogram(
+    "bot_update_seconds", "Полное время обработки обновления", ["type"]))
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "bot_handler_seconds", "Время работы обработчика", ["handler"]))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ["handler"]))
+DB_SECONDS = REGISTRY.register(Histogram(
+    "bot_db_seconds", "Время вызова метода Database", ["method"]))
+DB_ERRORS = REGISTRY.register(Counter(
+    "bot_db_errors_total", "Ошибки запросов к базе по методу Database", ["method"]))
+DB_UP = REGISTRY.register(Gauge(
+    "bot_db_up", "Результат последней проверки связи с Supabase (1 — доступен)"))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "bot_startup_phase_seconds", "Длительность фаз запуска", ["phase"]))
+BOT_API_SECONDS = REGISTRY.register(Histogram(
+    "bot_api_seconds", "Время запроса к Bot API", ["method"]))
+BOT_API_ERRORS = REGISTRY.register(Counter(
+    "bot_api_errors_total", "Ошибки запросов к Bot API", ["method"]))
+
+def record_startup_phase(phase: str, seconds: float):
+    STARTUP_SECONDS.set(seconds, (phase,))
+    logger.info(f"⏱ Запуск, {phase}: {seconds * 1000:.0f} мс")
+
+class StartupTimer:
+    """Замер фаз запуска: mark(phase) записывает время с предыдущей отметки"""
+
+    def __init__(self, started: float = None):
+        self.started = self.last = started if started is not None else time.perf_counter()
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        record_startup_phase(phase, now - self.last)
+        self.last = now
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+# Метод Database, внутри которого выполняется запрос (для меток ошибок)
+current_db_method = contextvars.ContextVar("current_db_method", default="unknown")
+
+def timed_db(func):
+    """Декоратор для методов Database: время вызова в bot_db_seconds"""
+    labels = (func.__name__,)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_db_method.set(func.__name__)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - started, labels)
+            current_db_method.reset(token)
+    return wrapper
+
+def count_db_error():
+    """Учесть ошибку запроса в текущем методе Database"""
+    DB_ERRORS.inc((current_db_method.get(),))
+
+class MeteredBot(Bot):
+    """Bot, замеряющий каждый запрос к Bot API"""
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        labels = (method,)
+        started = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception:
+            BOT_API_ERRORS.inc(labels)
+            raise
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, labels)
+
+# Имя обработчика текущего обновления; CallbackRouter подменяет его именем маршрута
+current_handler_name = contextvars.ContextVar("current_handler_name", default="unknown")
+STARTED_KEY = "_metrics_started"
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Время обработки обновлений и отдельных обработчиков.
+
+    Исключения из обработчиков считает on_error — его нужно
+    зарегистрировать как errors_handler (это делает register()).
+    """
+
+    UPDATE_TYPES = ("message", "callback_query", "inline_query", "my_chat_member", "chat_member")
+
+    @staticmethod
+    def update_type(update: types.Update):
+        for name in MetricsMiddleware.UPDATE_TYPES:
+            if getattr(update, name, None) is not None:
+                return name
+        return "other"
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        UPDATES_IN_FLIGHT.inc()
+        data[STARTED_KEY] = time.perf_counter()
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        # aiogram вызывает post_process и при исключении в обработчике
+        UPDATES_IN_FLIGHT.dec()
+        labels = (self.update_type(update),)
+        UPDATES_TOTAL.inc(labels)
+        UPDATE_SECONDS.observe(time.perf_counter() - data[STARTED_KEY], labels)
+
+    async def _on_process(self, obj, data: dict):
+        handler = current_handler.get(None)
+        current_handler_name.set(getattr(handler, "__name__", "unknown"))
+        data[STARTED_KEY] = time.perf_counter()
+
+    async def _on_post_process(self, obj, results, data: dict):
+        started = data.get(STARTED_KEY)
+        if started is not None:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, (current_handler_name.get(),))
+
+    on_process_message = _on_process
+    on_process_callback_query = _on_process
+    on_post_process_message = _on_post_process
+    on_post_process_callback_query = _on_post_process
+
+    async def on_error(self, update: types.Update, exception: Exception):
+        HANDLER_ERRORS.inc((current_handler_name.get(),))
+        # None: ошибка обрабатывается дальше как обычно
+
+    def register(self, dp):
+        dp.middleware.setup(self)
+        dp.register_errors_handler(self.on_error)
+
+async def metrics_handler(request: web.Request):
+    auth = request.headers.get("Authorization", "")
+    if not METRICS_TOKEN or not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+        raise web.HTTPUnauthorized()
+    return web.Response(
+        text=REGISTRY.render(),
+        headers={
+            "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+            "Cache-Control": "no-store"
+        }
+    )
+
+def setup_metrics(app: web.Application, path: str = "/metrics"):
+    """Зарегистрировать /metrics в формате Prometheus.
+
+    Порт мини-приложения открыт наружу, поэтому без METRICS_TOKEN
+    метрики не публикуются. Возвращает True, если путь подключён.
+    """
+    if not METRICS_TOKEN:
+        logger.warning(f"⚠️ METRICS_TOKEN не задан: {path} отключён")
+        return False
+    app.router.add_get(path, metrics_handler)
+    return True
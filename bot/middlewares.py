@@ -0,0 +1,189 @@
+import os
+import time
+import inspect
+import logging
+import functools
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+# Лимиты по группам обработчиков: "группа=запросов_в_сек:запас,..."
+# Запас (burst) — сколько запросов подряд можно сделать после паузы
+THROTTLE_RULES = os.getenv("THROTTLE_RULES", "start=0.2:3,contact=0.05:2,call=0.1:2,callback=3:10,message=1:5")
+# Как часто выбрасывать записи простаивающих пользователей (сек)
+THROTTLE_EVICT_INTERVAL = float(os.getenv("THROTTLE_EVICT_INTERVAL", "60"))
+
+THROTTLED_TOTAL = REGISTRY.register(Counter(
+    "bot_throttled_total", "Обновления, отброшенные антифлудом", ["group"]))
+
+def parse_throttle_rules(text: str):
+    """'start=0.2:3,callback=3:10' -> {"start": (0.2, 3.0), "callback": (3.0, 10.0)}"""
+    rules = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        group, limits = part.split("=")
+        rate, burst = limits.split(":")
+        rules[group.strip()] = (float(rate), float(burst))
+    return rules
+
+def throttle(group: str):
+    """Отнести обработчик к группе лимитов THROTTLE_RULES"""
+    def decorator(handler):
+        handler.throttle_group = group
+        return handler
+    return decorator
+
+class UserBuckets:
+    """
+    Token bucket на каждого пользователя одной группы.
+
+    Запись — кортеж (токены, время обновления, предупреждён ли). Полный бакет
+    ничем не отличается от отсутствующего, поэтому такие записи периодически
+    удаляются: память занимают только те, кто недавно упирался в лимит.
+    """
+
+    __slots__ = ("rate", "burst", "buckets", "_next_evict")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self._next_evict = time.monotonic() + THROTTLE_EVICT_INTERVAL
+
+    def hit(self, user_id: int, now: float = None):
+        """Списать токен. Возвращает (разрешено, первый ли это отказ подряд)"""
+        now = time.monotonic() if now is None else now
+        if now >= self._next_evict:
+            self._evict(now)
+
+        entry = self.buckets.get(user_id)
+        if entry is None:
+            tokens, warned = self.burst, False
+        else:
+            tokens = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+            warned = entry[2]
+
+        if tokens >= 1:
+            self.buckets[user_id] = (tokens - 1, now, False)
+            return True, False
+        self.buckets[user_id] = (tokens, now, True)
+        return False, not warned
+
+    def _evict(self, now: float):
+        self._next_evict = now + THROTTLE_EVICT_INTERVAL
+        full = [
+            user_id for user_id, (tokens, updated, _) in self.buckets.items()
+            if tokens + (now - updated) * self.rate >= self.burst
+        ]
+        for user_id in full:
+            del self.buckets[user_id]
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Антифлуд: лишние обновления отбрасываются до обработчика и до запросов к базе.
+
+    Группа берётся из декоратора @throttle(...) на обработчике, иначе
+    "callback" для кнопок и "message" для сообщений. Все кнопки попадают в один
+    обработчик CallbackRouter, поэтому для них группу называет маршрут
+    (router.route(..., throttle=...)) через метод throttle_group(obj) владельца. На кнопку отвечаем
+    сразу (иначе у пользователя крутятся часики), на сообщения — одним
+    предупреждением за серию. Админы не ограничиваются.
+    """
+
+    def __init__(self, exempt_ids=(), rules: dict = None):
+        super().__init__()
+        self.exempt_ids = set(exempt_ids)
+        rules = parse_throttle_rules(THROTTLE_RULES) if rules is None else rules
+        self.groups = {group: UserBuckets(rate, burst) for group, (rate, burst) in rules.items()}
+
+    @staticmethod
+    def _group(obj, default_group: str):
+        handler = current_handler.get(None)
+        owner = getattr(handler, "__self__", None)
+        if owner is not None and hasattr(owner, "throttle_group"):
+            return owner.throttle_group(obj) or default_group
+        return getattr(handler, "throttle_group", default_group)
+
+    def _check(self, obj, default_group: str, data: dict):
+        """(разрешено, предупредить ли)"""
+        user_id = obj.from_user.id
+        # После SkipHandler aiogram снова вызывает on_process — токен списываем один раз
+        if user_id in self.exempt_ids or data.get("_throttle_checked"):
+            return True, False
+        data["_throttle_checked"] = True
+        group = self._group(obj, default_group)
+        buckets = self.groups.get(group)
+        if buckets is None:
+            return True, False
+        allowed, first = buckets.hit(user_id)
+        if not allowed:
+            THROTTLED_TOTAL.inc((group,))
+        return allowed, first
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        allowed, warn = self._check(message, "message", data)
+        if allowed:
+            return
+        if warn:
+            await message.answer("⏳ Слишком часто. Подождите немного.")
+        raise CancelHandler()
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        allowed, _ = self._check(callback_query, "callback", data)
+        if allowed:
+            return
+        await callback_query.answer("⏳ Не так быстро")
+        raise CancelHandler()
+
+@functools.lru_cache(maxsize=None)
+def handler_wants_user(handler):
+    """Объявлен ли у обработчика параметр user"""
+    try:
+        return "user" in inspect.signature(handler).parameters
+    except (TypeError, ValueError):
+        return False
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Запись пользователя из базы — один раз на обновление.
+
+    Обработчик получает её, если объявит параметр user:
+        async def cmd_start(message: types.Message, user: dict): ...
+    user — строка из таблицы users или None для незарегистрированных.
+    Запрос делается только для обновлений, нашедших обработчик, прошедших антифлуд
+    и только если обработчик объявил user: админским и справочным обработчикам
+    база не нужна. Если обработчик — метод объекта с wants_user(obj) (CallbackRouter),
+    решает он: так учитывается конкретный маршрут кнопки.
+    """
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+
+    @staticmethod
+    def _wants_user(obj):
+        handler = current_handler.get(None)
+        if handler is None:
+            return False
+        owner = getattr(handler, "__self__", None)
+        if owner is not None and hasattr(owner, "wants_user"):
+            return owner.wants_user(obj)
+        return handler_wants_user(handler)
+
+    async def _resolve(self, obj, data: dict):
+        if "user" in data or not self._wants_user(obj):
+            return
+        from_user = obj.from_user
+        data["user"] = await self.db.get_user(from_user.id) if from_user else None
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        await self._resolve(message, data)
+
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        await self._resolve(callback_query, data)
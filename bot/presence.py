@@ -0,0 +1,145 @@
+import os
+import math
+import time
+import logging
+
+from aiohttp import web
+
+from signaling import check_init_data
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд пользователь считается в сети после последнего пульса мини-приложения
+# (мини-приложение шлёт пульс раз в 20 секунд) и шаг колеса таймеров
+PRESENCE_TTL = float(os.getenv("PRESENCE_TTL", "45"))
+PRESENCE_TICK = float(os.getenv("PRESENCE_TICK", "1"))
+# Максимум ID в одном запросе «кто из них в сети»
+PRESENCE_QUERY_MAX = int(os.getenv("PRESENCE_QUERY_MAX", "500"))
+
+class PresenceRegistry:
+    """
+    Кто сейчас в мини-приложении: реестр в памяти с истечением по пульсу.
+
+    Истечение — хэшированное колесо таймеров: ttl/tick корзин, пользователь
+    лежит в корзине тика, на котором истечёт. Пульс переносит его между
+    корзинами, продвижение времени очищает пройденные корзины целиком —
+    всё за O(1) на пользователя, без сортировок и перебора всех сессий.
+    На пользователя в словаре хранится только номер корзины (маленькое
+    целое из кэша интерпретатора), поэтому запись почти ничего не весит.
+
+    Отдельной фоновой задачи нет: время продвигается при каждом обращении.
+    """
+
+    __slots__ = ("tick", "clock", "slots", "expired", "_buckets", "_current")
+
+    def __init__(self, ttl: float = PRESENCE_TTL, tick: float = PRESENCE_TICK, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        # Тиков до истечения; корзин на одну больше, чтобы текущая не совпадала с целевой
+        self._buckets = [set() for _ in range(max(1, math.ceil(ttl / tick)) + 1)]
+        self.slots = {}
+        self.expired = 0
+        self._current = int(clock() // tick)
+
+    def __len__(self):
+        self._advance()
+        return len(self.slots)
+
+    def __contains__(self, user_id: int):
+        return self.is_online(user_id)
+
+    def _advance(self):
+        """Очистить корзины тиков, прошедших с прошлого обращения"""
+        now = int(self.clock() // self.tick)
+        steps = now - self._current
+        if steps <= 0:
+            return
+        size = len(self._buckets)
+        if steps >= size:
+            # Простаивали дольше ttl: истекли все
+            self.expired += len(self.slots)
+            self.slots.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+        else:
+            for current in range(self._current + 1, now + 1):
+                bucket = self._buckets[current % size]
+                if bucket:
+                    self.expired += len(bucket)
+                    for user_id in bucket:
+                        del self.slots[user_id]
+                    bucket.clear()
+        self._current = now
+
+    def heartbeat(self, user_id: int):
+        """Отметить пульс. Возвращает True, если пользователь только что появился в сети"""
+        self._advance()
+        size = len(self._buckets)
+        slot = (self._current + size - 1) % size
+        old = self.slots.get(user_id)
+        if old == slot:
+            return False
+        if old is not None:
+            self._buckets[old].discard(user_id)
+        self._buckets[slot].add(user_id)
+        self.slots[user_id] = slot
+        return old is None
+
+    def leave(self, user_id: int):
+        """Пользователь закрыл мини-приложение. Возвращает True, если он был в сети"""
+        self._advance()
+        slot = self.slots.pop(user_id, None)
+        if slot is None:
+            return False
+        self._buckets[slot].discard(user_id)
+        return True
+
+    def is_online(self, user_id: int):
+        self._advance()
+        return user_id in self.slots
+
+    def online(self, user_ids):
+        """Кто из user_ids в сети, в том же порядке"""
+        self._advance()
+        slots = self.slots
+        return [user_id for user_id in user_ids if user_id in slots]
+
+def setup_presence(app: web.Application, registry: PresenceRegistry, bot_token: str, is_allowed,
+                   visible_ids, path: str = "/presence"):
+    """
+    Пульс мини-приложения и запрос «кто из них в сети» одним POST:
+        -> {"initData": "...", "ids": [id, ...]}   (ids необязательны)
+        -> {"initData": "...", "leave": true}       (при закрытии)
+        <- {"online": [id, ...]}
+    Отмечаются только те, кому можно звонить (async is_allowed(user_id)).
+    Узнать можно только о тех, кого пользователь видит (async visible_ids(user_id)
+    -> множество ID: его контакты и участники его звонков); остальные ID
+    в ответ не попадают, как если бы были не в сети.
+    """
+
+    async def handle(request: web.Request):
+        try:
+            data = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest()
+        if not isinstance(data, dict):
+            raise web.HTTPBadRequest()
+        user = check_init_data(str(data.get("initData", "")), bot_token)
+        if not user or not await is_allowed(user["id"]):
+            raise web.HTTPUnauthorized()
+
+        if data.get("leave"):
+            registry.leave(user["id"])
+            return web.json_response({"online": []})
+        registry.heartbeat(user["id"])
+
+        ids = data.get("ids") or []
+        if not isinstance(ids, list) or len(ids) > PRESENCE_QUERY_MAX:
+            raise web.HTTPBadRequest(text=f"ids: список до {PRESENCE_QUERY_MAX} чисел")
+        ids = [user_id for user_id in ids if isinstance(user_id, int)]
+        if ids:
+            visible = await visible_ids(user["id"])
+            ids = [user_id for user_id in ids if user_id in visible]
+        return web.json_response({"online": registry.online(ids)})
+
+    app.router.add_post(path, handle)
@@ -0,0 +1,94 @@
+"""
+Замер реестра присутствия (presence.py) без сети.
+
+Часы подменяются, поэтому сессии живут по расписанию, а не по таймеру:
+каждая шлёт пульс раз в --interval секунд. Печатает память на сессию,
+пульсов в секунду, запросов «кто в сети» в секунду и время истечения.
+
+Запуск:
+    python presence_benchmark.py --sessions 100000
+"""
+import time
+import random
+import argparse
+import tracemalloc
+
+from presence import PresenceRegistry
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер реестра присутствия")
+    parser.add_argument("--sessions", type=int, default=100_000, help="одновременных сессий")
+    parser.add_argument("--ttl", type=float, default=45, help="срок жизни без пульса (сек)")
+    parser.add_argument("--interval", type=float, default=20, help="период пульса (сек)")
+    parser.add_argument("--rounds", type=int, default=3, help="периодов пульса в замере")
+    parser.add_argument("--batch", type=int, default=100, help="ID в одном запросе «кто в сети»")
+    parser.add_argument("--queries", type=int, default=20_000, help="запросов «кто в сети»")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # ID как у Telegram: большие и разреженные
+    ids = random.sample(range(10**8, 8 * 10**9), args.sessions)
+    clock = FakeClock()
+    registry = PresenceRegistry(ttl=args.ttl, tick=1, clock=clock)
+
+    # Память: все сессии входят в сеть
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in ids:
+        registry.heartbeat(user_id)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # Сами ID принадлежат вызывающему коду, реестр хранит ссылки на них
+    print(f"Сессий: {len(registry)}, память реестра: {used / 2**20:.1f} МБ ({used / args.sessions:.0f} байт на сессию)")
+
+    # Пульсы размазаны по периоду: каждую секунду пульс шлёт своя доля сессий
+    per_second = max(1, round(args.sessions / args.interval))
+    beats = 0
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for offset in range(0, args.sessions, per_second):
+            clock.now += 1
+            for user_id in ids[offset:offset + per_second]:
+                registry.heartbeat(user_id)
+            beats += len(ids[offset:offset + per_second])
+    elapsed = time.perf_counter() - started
+    print(f"Пульсов: {beats} за {elapsed:.2f} сек — {beats / elapsed:,.0f}/сек, в сети {len(registry)}, истекло {registry.expired}")
+
+    # Запросы «кто из контактов в сети»: половина ID чужие
+    strangers = [user_id + 1 for user_id in ids[:args.batch]]
+    batches = [random.sample(ids, args.batch // 2) + random.sample(strangers, args.batch // 2) for _ in range(100)]
+    started = time.perf_counter()
+    found = 0
+    for i in range(args.queries):
+        found += len(registry.online(batches[i % len(batches)]))
+    elapsed = time.perf_counter() - started
+    print(
+        f"Запросов по {args.batch} ID: {args.queries} за {elapsed:.2f} сек — "
+        f"{args.queries / elapsed:,.0f}/сек ({args.queries * args.batch / elapsed:,.0f} ID/сек), в сети {found / args.queries:.0f} из {args.batch}"
+    )
+
+    # Истечение: пульсы прекращаются, время идёт по секунде
+    expired_before = registry.expired
+    started = time.perf_counter()
+    slowest = 0.0
+    while len(registry):
+        clock.now += 1
+        tick_started = time.perf_counter()
+        registry.is_online(0)
+        slowest = max(slowest, time.perf_counter() - tick_started)
+    elapsed = time.perf_counter() - started
+    print(
+        f"Истекло {registry.expired - expired_before} сессий за {elapsed:.2f} сек "
+        f"({(registry.expired - expired_before) / elapsed:,.0f}/сек), самый долгий тик {slowest * 1000:.1f} мс"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from aiogram import Bot, Dispatcher, types
+
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений обрабатывается одновременно (разных пользователей)
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "32"))
+# Очередь одного пользователя: сверх лимита новые обновления отбрасываются
+UPDATE_USER_QUEUE = int(os.getenv("UPDATE_USER_QUEUE", "20"))
+# Всего обновлений в очередях: сверх лимита приём ждёт освобождения места
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "10000"))
+
+SCHEDULER_QUEUED = REGISTRY.register(Gauge(
+    "bot_scheduler_queued", "Обновления в очередях планировщика, включая обрабатываемые"))
+SCHEDULER_ACTIVE = REGISTRY.register(Gauge(
+    "bot_scheduler_active_workers", "Воркеры, обрабатывающие обновление"))
+SCHEDULER_KEYS = REGISTRY.register(Gauge(
+    "bot_scheduler_keys", "Пользователи с обновлениями в очереди или в обработке"))
+SCHEDULER_DROPPED = REGISTRY.register(Counter(
+    "bot_scheduler_dropped_total", "Обновления, отброшенные из-за переполненной очереди пользователя"))
+SCHEDULER_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "bot_scheduler_wait_seconds", "Время ожидания обновления в очереди"))
+
+# Поля Update, у которых есть отправитель
+USER_FIELDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "my_chat_member", "chat_member", "chat_join_request"
+)
+CHAT_FIELDS = ("channel_post", "edited_channel_post")
+
+def update_key(update: types.Update):
+    """Ключ очереди: id отправителя, для постов каналов — id чата"""
+    for name in USER_FIELDS:
+        obj = getattr(update, name, None)
+        if obj is not None and obj.from_user is not None:
+            return obj.from_user.id
+    for name in CHAT_FIELDS:
+        obj = getattr(update, name, None)
+        if obj is not None:
+            return obj.chat.id
+    if update.poll_answer is not None:
+        return update.poll_answer.user.id
+    # Без отправителя порядок не важен — у каждого обновления своя очередь
+    return ("update", update.update_id)
+
+class UpdateScheduler:
+    """
+    Обработка обновлений ограниченным числом воркеров с порядком по пользователю.
+
+    У каждого пользователя своя очередь, и в работе в любой момент не больше
+    одного его обновления: сообщение с ID для бана не обгонит нажатие «Отмена».
+    Обновления разных пользователей обрабатываются параллельно, но не более
+    workers одновременно, поэтому медленный запрос к базе для одного
+    пользователя не задерживает остальных и не плодит неограниченно задач.
+
+    Подключается заменой dp.process_updates (install), так что через него идут
+    и long polling, и вебхук.
+    """
+
+    def __init__(self, dp: Dispatcher, workers: int = UPDATE_WORKERS,
+                 user_queue_limit: int = UPDATE_USER_QUEUE, max_pending: int = UPDATE_MAX_PENDING):
+        self.dp = dp
+        self.workers = workers
+        self.user_queue_limit = user_queue_limit
+        self.max_pending = max_pending
+        # Обработка одного обновления так же, как в Dispatcher.process_updates:
+        # через updates_handler, чтобы работали on_pre/post_process_update мидлварей
+        self._process_update = dp.updates_handler.notify
+        # Ключ -> deque[(update, future, время постановки)]; ключ есть, пока
+        # у пользователя что-то в очереди или в обработке
+        self._queues = {}
+        # Ключи, у которых можно взять следующее обновление
+        self._ready = None
+        self._slots = None
+        self._tasks = []
+        self.pending = 0
+
+    def install(self):
+        """Пропускать обновления диспетчера через планировщик"""
+        self.dp.process_updates = self.process_updates
+        REGISTRY.add_collector(self.collect_metrics)
+        return self
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"🧵 Планировщик обновлений запущен ({self.workers} воркеров)")
+
+    async def stop(self, timeout: float = 10):
+        """Дождаться обработки очередей (не дольше timeout) и остановить воркеры"""
+        if not self._tasks:
+            return
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.pending:
+            logger.warning(f"Не обработано обновлений: {self.pending}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queue in self._queues.values():
+            for _, future, _ in queue:
+                future.cancel()
+        self._queues.clear()
+        self.pending = 0
+
+    async def submit(self, update: types.Update) -> asyncio.Future:
+        """Поставить обновление в очередь; future завершится результатом обработки"""
+        if not self._tasks:
+            await self.start()
+        key = update_key(update)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        queue = self._queues.get(key)
+        if queue is not None and len(queue) >= self.user_queue_limit:
+            SCHEDULER_DROPPED.inc()
+            logger.warning(f"Очередь пользователя {key} переполнена, обновление {update.update_id} отброшено")
+            future.set_result([])
+            return future
+
+        await self._slots.acquire()
+        self.pending += 1
+        # Пока ждали места, воркер мог разобрать очередь и удалить ключ
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((update, future, time.perf_counter()))
+        return future
+
+    async def process_updates(self, updates, fast: bool = True):
+        """Замена Dispatcher.process_updates: результаты в порядке updates"""
+        futures = [await self.submit(update) for update in updates]
+        return await asyncio.gather(*futures)
+
+    async def _worker(self):
+        # Задачи воркеров создаются до прихода обновлений — контекст задаём явно
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            update, future, queued_at = queue.popleft()
+            SCHEDULER_WAIT_SECONDS.observe(time.perf_counter() - queued_at)
+            SCHEDULER_ACTIVE.inc()
+            try:
+                result = await self._process_update(update)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                logger.exception(f"Ошибка обработки обновления {update.update_id}: {e}")
+                result = []
+            finally:
+                SCHEDULER_ACTIVE.dec()
+                self.pending -= 1
+                self._slots.release()
+
+            if not future.done():
+                future.set_result(result)
+            # Следующее обновление пользователя — в конец общей очереди,
+            # чтобы активный пользователь не занимал воркер целиком
+            if queue:
+                self._ready.put_nowait(key)
+            else:
+                del self._queues[key]
+
+    def collect_metrics(self):
+        SCHEDULER_QUEUED.set(self.pending)
+        SCHEDULER_KEYS.set(len(self._queues))
@@ -0,0 +1,143 @@
+import re
+from bisect import bisect_left, insort
+
+# Минимальная длина запроса по имени, с которой работает триграммный индекс;
+# более короткие запросы проверяются перебором
+NGRAM = 3
+
+_SPACES = re.compile(r"\s+")
+
+def normalize_name(name: str) -> str:
+    """Имя для поиска: без регистра, ё = е, пробелы схлопнуты"""
+    return _SPACES.sub(" ", (name or "").casefold().replace("ё", "е")).strip()
+
+def normalize_digits(phone: str) -> str:
+    """Только цифры номера: +7 (999) 123-45-67 -> 79991234567"""
+    return "".join(ch for ch in (phone or "") if ch.isdigit())
+
+def parse_search_query(query: str):
+    """Вид поиска по запросу админа: ("username", ...), ("phone", ...) или ("name", ...)"""
+    query = (query or "").strip()
+    if query.startswith("@"):
+        return "username", query[1:].casefold()
+    digits = normalize_digits(query)
+    if digits and not re.sub(r"[\d\s()+\-]", "", query):
+        return "phone", digits
+    return "name", normalize_name(query)
+
+def ngrams(text: str):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+class PrefixIndex:
+    """Отсортированный список (ключ, id): поиск по префиксу двоичным поиском"""
+
+    __slots__ = ("items", "keys")
+
+    def __init__(self):
+        self.items = []
+        self.keys = {}
+
+    def set(self, telegram_id: int, key: str):
+        self.remove(telegram_id)
+        if key:
+            insort(self.items, (key, telegram_id))
+            self.keys[telegram_id] = key
+
+    def load(self, pairs):
+        """Заполнить пустой индекс парами (id, ключ): одна сортировка вместо вставок"""
+        self.keys = {telegram_id: key for telegram_id, key in pairs if key}
+        self.items = sorted((key, telegram_id) for telegram_id, key in self.keys.items())
+
+    def remove(self, telegram_id: int):
+        key = self.keys.pop(telegram_id, None)
+        if key is not None:
+            index = bisect_left(self.items, (key, telegram_id))
+            del self.items[index]
+
+    def prefix(self, prefix: str):
+        index = bisect_left(self.items, (prefix,))
+        while index < len(self.items) and self.items[index][0].startswith(prefix):
+            yield self.items[index][1]
+            index += 1
+
+class UserSearchIndex:
+    """
+    Индекс пользователей в памяти для поиска из админ-панели.
+
+    Номер и @username ищутся по префиксу в отсортированных списках,
+    имя — по подстроке через триграммы: кандидаты — пересечение списков
+    триграмм запроса, затем точная проверка подстроки.
+    """
+
+    def __init__(self):
+        self.phones = PrefixIndex()
+        self.usernames = PrefixIndex()
+        self.names = {}
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def build(cls, users):
+        """Индекс по всем пользователям сразу (при первом поиске)"""
+        index = cls()
+        users = list(users)
+        index.phones.load((u["telegram_id"], normalize_digits(u.get("phone_number"))) for u in users)
+        index.usernames.load((u["telegram_id"], (u.get("username") or "").casefold()) for u in users)
+        for user in users:
+            index._add_name(user["telegram_id"], user.get("full_name"))
+        return index
+
+    def add(self, user: dict):
+        telegram_id = user["telegram_id"]
+        self.remove(telegram_id)
+        self.phones.set(telegram_id, normalize_digits(user.get("phone_number")))
+        self.usernames.set(telegram_id, (user.get("username") or "").casefold())
+        self._add_name(telegram_id, user.get("full_name"))
+
+    def _add_name(self, telegram_id: int, full_name: str):
+        name = normalize_name(full_name)
+        self.names[telegram_id] = name
+        for gram in ngrams(name):
+            self.postings.setdefault(gram, set()).add(telegram_id)
+
+    def remove(self, telegram_id: int):
+        self.phones.remove(telegram_id)
+        self.usernames.remove(telegram_id)
+        name = self.names.pop(telegram_id, None)
+        if name is None:
+            return
+        for gram in ngrams(name):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(telegram_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def _match_name(self, text: str):
+        grams = ngrams(text)
+        if not grams:
+            return [telegram_id for telegram_id, name in self.names.items() if text in name]
+        # Начинаем с самого короткого списка, чтобы пересечение было дешёвым
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            ids = self.postings.get(gram)
+            if not ids:
+                return []
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return []
+        return [telegram_id for telegram_id in candidates if text in self.names[telegram_id]]
+
+    def search(self, kind: str, value: str):
+        """ID найденных пользователей по возрастанию"""
+        if not value:
+            return []
+        if kind == "phone":
+            found = self.phones.prefix(value)
+        elif kind == "username":
+            found = self.usernames.prefix(value)
+        else:
+            found = self._match_name(value)
+        return sorted(found)
@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter, TelegramAPIError
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих сообщений: чем меньше число, тем раньше отправка
+PRIORITY_HIGH = 0    # уведомления админов и прямые ответы
+PRIORITY_NORMAL = 1  # уведомления пользователей о решениях модерации
+PRIORITY_LOW = 2     # массовые рассылки
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+SEND_CHAT_INTERVAL = float(os.getenv("SEND_CHAT_INTERVAL", "1"))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+class TokenBucket:
+    """Глобальный ограничитель скорости: rate токенов в секунду, запас capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+class MessageSender:
+    """Очередь исходящих сообщений с приоритетами и ограничением скорости"""
+
+    def __init__(self, bot: Bot, workers: int = SEND_WORKERS, rate: float = SEND_RATE,
+                 chat_interval: float = SEND_CHAT_INTERVAL):
+        self.bot = bot
+        self.workers = workers
+        self.chat_interval = chat_interval
+        self.bucket = TokenBucket(rate)
+        self._queue = None
+        self._tasks = []
+        self._counter = itertools.count()
+        # Время, раньше которого нельзя писать в чат
+        self._chat_ready = {}
+        # Глобальная пауза после RetryAfter
+        self._paused_until = 0.0
+
+    async def start(self):
+        """Запустить воркеры (вызывается из on_startup)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"📤 Очередь отправки запущена ({self.workers} воркеров, {self.bucket.rate}/сек)")
+
+    async def stop(self, timeout: float = 10):
+        """Дождаться отправки очереди (не дольше timeout) и остановить воркеры"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не отправлено сообщений: {self._queue.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def qsize(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_NORMAL, **kwargs):
+        """Поставить сообщение в очередь. Возвращает future с результатом отправки"""
+        return self.submit("send_message", chat_id, priority, text=text, **kwargs)
+
+    def send_many(self, chat_ids, text: str, priority: int = PRIORITY_LOW, **kwargs):
+        """Поставить одно и то же сообщение в очередь для многих чатов"""
+        return [self.send_message(chat_id, text, priority, **kwargs) for chat_id in chat_ids]
+
+    def submit(self, method: str, chat_id: int, priority: int = PRIORITY_NORMAL, **kwargs):
+        """Поставить в очередь произвольный метод Bot API вида bot.<method>(chat_id, **kwargs)"""
+        future = asyncio.get_running_loop().create_future()
+        job = {
+            "method": method,
+            "chat_id": chat_id,
+            "kwargs": kwargs,
+            "future": future,
+            "priority": priority,
+            "seq": next(self._counter),
+            "attempt": 0,
+        }
+        self._put(job)
+        return future
+
+    def _put(self, job):
+        # Исходный порядковый номер сохраняется при повторной постановке,
+        # поэтому сообщения одного приоритета уходят в порядке поступления
+        self._queue.put_nowait((job["priority"], job["seq"], job))
+
+    def _requeue_later(self, delay, job):
+        # Задача возвращается в очередь позже, а воркер сразу берёт следующую.
+        # task_done вызывается только после повторной постановки, чтобы stop() её дождался
+        asyncio.get_running_loop().call_later(delay, self._delayed_put, job)
+
+    def _delayed_put(self, job):
+        self._put(job)
+        self._queue.task_done()
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            # Отправитель передумал (например, рассылку остановили) — не отправляем
+            if job["future"].cancelled():
+                self._queue.task_done()
+                continue
+            now = time.monotonic()
+            chat_id = job["chat_id"]
+
+            if self._paused_until > now:
+                self._requeue_later(self._paused_until - now, job)
+                continue
+            ready_at = self._chat_ready.get(chat_id, 0)
+            if ready_at > now:
+                self._requeue_later(ready_at - now, job)
+                continue
+
+            await self.bucket.acquire()
+            self._chat_ready[chat_id] = time.monotonic() + self.chat_interval
+            try:
+                result = await getattr(self.bot, job["method"])(chat_id, **job["kwargs"])
+            except RetryAfter as e:
+                job["attempt"] += 1
+                if job["attempt"] > SEND_MAX_RETRIES:
+                    self._finish(job, exception=e)
+                    continue
+                logger.warning(f"Flood control: пауза {e.timeout} сек")
+                self._paused_until = time.monotonic() + e.timeout
+                self._requeue_later(e.timeout, job)
+                continue
+            except TelegramAPIError as e:
+                logger.error(f"Не удалось отправить сообщение {chat_id}: {e}")
+                self._finish(job, exception=e)
+                continue
+            except Exception as e:
+                logger.error(f"Ошибка отправки сообщения {chat_id}: {e}")
+                self._finish(job, exception=e)
+                continue
+            self._finish(job, result=result)
+            self._cleanup_chats()
+
+    def _finish(self, job, result=None, exception=None):
+        future = job["future"]
+        if not future.done():
+            if exception is not None:
+                future.set_exception(exception)
+                # Ошибка уже залогирована: не ругаемся, если future никто не ждёт
+                future.exception()
+            else:
+                future.set_result(result)
+        self._queue.task_done()
+
+    def _cleanup_chats(self):
+        # Не даём словарю чатов расти бесконечно
+        if len(self._chat_ready) > 10000:
+            now = time.monotonic()
+            self._chat_ready = {k: v for k, v in self._chat_ready.items() if v > now}
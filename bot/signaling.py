@@ -0,0 +1,293 @@
+import os
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import secrets
+from urllib.parse import parse_qsl, urlencode
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+# Максимум участников в одной комнате и очередь исходящих сообщений на участника
+ROOM_MAX_PEERS = int(os.getenv("ROOM_MAX_PEERS", "8"))
+PEER_QUEUE_SIZE = int(os.getenv("PEER_QUEUE_SIZE", "256"))
+# ICE-кандидаты копятся столько секунд и уходят одним сообщением
+ICE_BATCH_DELAY = float(os.getenv("ICE_BATCH_DELAY", "0.02"))
+# Срок годности initData из Telegram WebApp (сек)
+INIT_DATA_MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", "86400"))
+# Сколько секунд выданный звонок ждёт участников
+CALL_TTL = int(os.getenv("CALL_TTL", "3600"))
+AUTH_TIMEOUT = 10
+
+def check_init_data(init_data: str, bot_token: str, max_age: int = INIT_DATA_MAX_AGE):
+    """Проверить подпись initData мини-приложения. Возвращает user (dict) или None"""
+    try:
+        fields = dict(parse_qsl(init_data, strict_parsing=True))
+    except ValueError:
+        return None
+    received_hash = fields.pop("hash", None)
+    if not received_hash:
+        return None
+
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    expected_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        return None
+
+    try:
+        if max_age and time.time() - int(fields.get("auth_date", 0)) > max_age:
+            return None
+        return json.loads(fields["user"])
+    except (KeyError, ValueError):
+        return None
+
+def sign_init_data(fields: dict, bot_token: str) -> str:
+    """Подписать initData так же, как Telegram (для локальных проверок и нагрузочного теста)"""
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    signature = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode({**fields, "hash": signature})
+
+class Call:
+    """Выданный ботом звонок: кто приглашён и до какого времени"""
+
+    __slots__ = ("participants", "expires_at")
+
+    def __init__(self, participants, expires_at: float):
+        self.participants = frozenset(participants)
+        self.expires_at = expires_at
+
+class Peer:
+    """Участник звонка: сокет, очередь исходящих и накопленные ICE-кандидаты"""
+
+    __slots__ = ("user_id", "ws", "room", "queue", "pending_ice", "ice_timer", "writer", "closing")
+
+    def __init__(self, user_id: int, ws: web.WebSocketResponse, room: str):
+        self.user_id = user_id
+        self.ws = ws
+        self.room = room
+        self.queue = asyncio.Queue(maxsize=PEER_QUEUE_SIZE)
+        self.pending_ice = {}
+        self.ice_timer = None
+        self.writer = None
+        # Отключение медленного клиента уже запущено: дальнейшие сообщения просто отбрасываются
+        self.closing = False
+
+class SignalingServer:
+    """
+    Сигнальный сервер WebRTC поверх WebSocket.
+
+    Комнаты — словари {user_id: Peer}, поэтому поиск адресата O(1).
+    Комната — звонок, выданный create_call: ID случайный, войти могут только
+    приглашённые участники, поэтому сообщения ходят только между ними.
+    Протокол (JSON):
+        -> {"type": "auth", "initData": "...", "room": "<call id>"}
+        <- {"type": "joined", "peers": [id, ...]}
+        <- {"type": "peer-joined" | "peer-left", "peer": id}
+        -> {"type": "offer" | "answer", "to": id, "sdp": {...}}
+        -> {"type": "ice", "to": id, "candidate": {...}}
+        <- {"type": "ice", "from": id, "candidates": [...]}
+    """
+
+    def __init__(self, bot_token: str, is_allowed):
+        self.bot_token = bot_token
+        # async is_allowed(user_id) -> bool: кому можно звонить
+        self.is_allowed = is_allowed
+        self.rooms = {}
+        self.calls = {}
+        self.relayed = 0
+        self.dropped = 0
+
+    def create_call(self, participants, ttl: float = CALL_TTL) -> str:
+        """Выдать ID звонка для участников (не угадывается, в комнату пускает только их)"""
+        self._expire_calls()
+        call_id = secrets.token_urlsafe(16)
+        self.calls[call_id] = Call(participants, time.monotonic() + ttl)
+        return call_id
+
+    def call_peers(self, user_id: int):
+        """Участники действующих звонков пользователя"""
+        self._expire_calls()
+        peers = set()
+        for call in self.calls.values():
+            if user_id in call.participants:
+                peers.update(call.participants)
+        peers.discard(user_id)
+        return peers
+
+    def _expire_calls(self):
+        now = time.monotonic()
+        # Звонок с участниками в комнате не истекает, пока они не выйдут
+        expired = [
+            call_id for call_id, call in self.calls.items()
+            if call.expires_at < now and call_id not in self.rooms
+        ]
+        for call_id in expired:
+            del self.calls[call_id]
+
+    def _is_invited(self, room: str, user_id: int):
+        call = self.calls.get(room)
+        if call is None:
+            return False
+        if call.expires_at < time.monotonic() and room not in self.rooms:
+            del self.calls[room]
+            return False
+        return user_id in call.participants
+
+    @property
+    def peers_count(self):
+        return sum(len(room) for room in self.rooms.values())
+
+    async def handle(self, request: web.Request):
+        ws = web.WebSocketResponse(heartbeat=30, max_msg_size=64 * 1024)
+        await ws.prepare(request)
+
+        peer = await self._authenticate(ws)
+        if peer is None:
+            return ws
+
+        peer.writer = asyncio.create_task(self._writer(peer))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    data = json.loads(msg.data)
+                except ValueError:
+                    continue
+                # Сообщение — только JSON-объект; массивы, строки и числа пропускаем
+                if isinstance(data, dict):
+                    self._dispatch(peer, data)
+        finally:
+            self._leave(peer)
+        return ws
+
+    async def _authenticate(self, ws):
+        try:
+            msg = await asyncio.wait_for(ws.receive(), timeout=AUTH_TIMEOUT)
+            data = json.loads(msg.data) if msg.type == WSMsgType.TEXT else {}
+        except (asyncio.TimeoutError, ValueError):
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+
+        room = str(data.get("room", ""))[:64]
+        user = check_init_data(data.get("initData", ""), self.bot_token) if data.get("type") == "auth" else None
+        if not user or not await self.is_allowed(user["id"]):
+            await ws.close(code=4001, message=b"unauthorized")
+            return None
+        # Без выданного звонка и приглашения в комнату не пускаем: иначе
+        # незнакомые люди попадали бы в одну комнату и звонили друг другу
+        if not self._is_invited(room, user["id"]):
+            await ws.close(code=4003, message=b"unknown call")
+            return None
+
+        members = self.rooms.setdefault(room, {})
+        if len(members) >= ROOM_MAX_PEERS and user["id"] not in members:
+            await ws.close(code=4002, message=b"room is full")
+            return None
+
+        old = members.get(user["id"])
+        if old is not None:
+            # Переподключение: старый сокет больше не нужен
+            self._leave(old)
+            await old.ws.close()
+            members = self.rooms.setdefault(room, {})
+
+        peer = Peer(user["id"], ws, room)
+        others = list(members)
+        members[peer.user_id] = peer
+        self._send(peer, {"type": "joined", "peers": others})
+        self._broadcast(peer, {"type": "peer-joined", "peer": peer.user_id})
+        return peer
+
+    def _dispatch(self, peer: Peer, data: dict):
+        kind = data.get("type")
+        if kind in ("offer", "answer"):
+            target = self.rooms.get(peer.room, {}).get(data.get("to"))
+            if target is not None:
+                self._send(target, {"type": kind, "from": peer.user_id, "sdp": data.get("sdp")})
+        elif kind == "ice":
+            target_id = data.get("to")
+            if target_id in self.rooms.get(peer.room, {}):
+                peer.pending_ice.setdefault(target_id, []).append(data.get("candidate"))
+                if peer.ice_timer is None:
+                    loop = asyncio.get_running_loop()
+                    peer.ice_timer = loop.call_later(ICE_BATCH_DELAY, self._flush_ice, peer)
+        elif kind == "leave":
+            asyncio.ensure_future(peer.ws.close())
+
+    def _flush_ice(self, peer: Peer):
+        peer.ice_timer = None
+        members = self.rooms.get(peer.room, {})
+        pending, peer.pending_ice = peer.pending_ice, {}
+        for target_id, candidates in pending.items():
+            target = members.get(target_id)
+            if target is not None:
+                self._send(target, {"type": "ice", "from": peer.user_id, "candidates": candidates})
+
+    def _send(self, peer: Peer, message: dict):
+        self._enqueue(peer, json.dumps(message))
+
+    def _broadcast(self, sender: Peer, message: dict):
+        # Сериализуем один раз для всех получателей
+        raw = json.dumps(message)
+        for user_id, peer in list(self.rooms.get(sender.room, {}).items()):
+            if user_id != sender.user_id:
+                self._enqueue(peer, raw)
+
+    def _enqueue(self, peer: Peer, raw: str):
+        if peer.closing:
+            self.dropped += 1
+            return
+        try:
+            peer.queue.put_nowait(raw)
+            self.relayed += 1
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: отключаем его один раз, а не копим память
+            self.dropped += 1
+            peer.closing = True
+            logger.warning(f"Сигналинг: отключаем медленного клиента {peer.user_id}")
+            asyncio.ensure_future(peer.ws.close(code=4008, message=b"too slow"))
+
+    async def _writer(self, peer: Peer):
+        try:
+            while True:
+                raw = await peer.queue.get()
+                await peer.ws.send_str(raw)
+        except (ConnectionResetError, asyncio.CancelledError, RuntimeError):
+            pass
+
+    def _leave(self, peer: Peer):
+        if peer.ice_timer is not None:
+            peer.ice_timer.cancel()
+            peer.ice_timer = None
+        if peer.writer is not None:
+            peer.writer.cancel()
+        members = self.rooms.get(peer.room)
+        if members is None or members.get(peer.user_id) is not peer:
+            return
+        del members[peer.user_id]
+        if members:
+            self._broadcast(peer, {"type": "peer-left", "peer": peer.user_id})
+        else:
+            del self.rooms[peer.room]
+
+    async def close(self):
+        """Закрыть все соединения (при остановке бота)"""
+        peers = [peer for room in self.rooms.values() for peer in room.values()]
+        await asyncio.gather(*(peer.ws.close(code=1001) for peer in peers), return_exceptions=True)
+
+def setup_signaling(app: web.Application, server: SignalingServer, path: str = "/ws"):
+    """Зарегистрировать сигнальный сервер в aiohttp-приложении"""
+    app.router.add_get(path, server.handle)
+
+    async def on_shutdown(app):
+        await server.close()
+
+    app.on_shutdown.append(on_shutdown)
@@ -0,0 +1,139 @@
+"""
+Нагрузочный тест сигнального сервера.
+
+Поднимает SignalingServer в этом же процессе (звонки выдаёт сам сервер,
+поэтому внешний сервер не подходит) и имитирует звонки: пары участников входят в комнату, обмениваются
+offer/answer и ICE-кандидатами. Печатает время установления «звонка»
+(перцентили), число сообщений в секунду и состояние сервера.
+
+Запуск:
+    python signaling_loadtest.py --peers 2000 --ice 10
+
+Для тысяч соединений может понадобиться поднять лимит файлов: ulimit -n 65536
+"""
+import json
+import time
+import argparse
+import asyncio
+import statistics
+
+from aiohttp import web, ClientSession, TCPConnector, WSMsgType
+
+from signaling import SignalingServer, setup_signaling, sign_init_data
+
+TEST_TOKEN = "123456:loadtest"
+
+def init_data_for(user_id: int, token: str):
+    return sign_init_data({
+        "auth_date": str(int(time.time())),
+        "user": json.dumps({"id": user_id, "first_name": f"Peer{user_id}"}),
+    }, token)
+
+async def receive_until(ws, predicate):
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            break
+        data = json.loads(msg.data)
+        if predicate(data):
+            return data
+    raise ConnectionError("сокет закрыт")
+
+async def run_pair(session, url, token, room, caller_id, callee_id, ice_count, stats):
+    started = time.perf_counter()
+    callee = await session.ws_connect(url)
+    await callee.send_str(json.dumps({"type": "auth", "initData": init_data_for(callee_id, token), "room": room}))
+    await receive_until(callee, lambda d: d["type"] == "joined")
+
+    caller = await session.ws_connect(url)
+    await caller.send_str(json.dumps({"type": "auth", "initData": init_data_for(caller_id, token), "room": room}))
+    joined = await receive_until(caller, lambda d: d["type"] == "joined")
+    assert callee_id in joined["peers"]
+
+    # offer -> answer
+    await caller.send_str(json.dumps({"type": "offer", "to": callee_id, "sdp": {"type": "offer", "sdp": "v=0" * 100}}))
+    await receive_until(callee, lambda d: d["type"] == "offer")
+    await callee.send_str(json.dumps({"type": "answer", "to": caller_id, "sdp": {"type": "answer", "sdp": "v=0" * 100}}))
+    await receive_until(caller, lambda d: d["type"] == "answer")
+
+    # ICE в обе стороны; сервер склеивает кандидатов в пачки
+    for i in range(ice_count):
+        candidate = {"candidate": f"candidate:{i} 1 udp 2122260223 10.0.0.1 {50000 + i} typ host", "sdpMLineIndex": 0}
+        await caller.send_str(json.dumps({"type": "ice", "to": callee_id, "candidate": candidate}))
+        await callee.send_str(json.dumps({"type": "ice", "to": caller_id, "candidate": candidate}))
+
+    async def collect(ws):
+        received, batches = 0, 0
+        while received < ice_count:
+            data = await receive_until(ws, lambda d: d["type"] == "ice")
+            received += len(data["candidates"])
+            batches += 1
+        return batches
+
+    batches = await asyncio.gather(collect(caller), collect(callee))
+    stats["setup"].append(time.perf_counter() - started)
+    stats["ice_messages"] += sum(batches)
+    stats["ice_candidates"] += 2 * ice_count
+    return caller, callee
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сигнального сервера")
+    parser.add_argument("--peers", type=int, default=1000, help="число участников (чётное)")
+    parser.add_argument("--ice", type=int, default=10, help="ICE-кандидатов от каждого участника")
+    parser.add_argument("--concurrency", type=int, default=200, help="одновременно устанавливаемых звонков")
+    parser.add_argument("--token", default=TEST_TOKEN, help="токен бота для подписи initData")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    async def allow_all(user_id):
+        return True
+    server = SignalingServer(args.token, allow_all)
+    app = web.Application()
+    setup_signaling(app, server)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    url = f"http://127.0.0.1:{args.port}/ws"
+
+    stats = {"setup": [], "ice_messages": 0, "ice_candidates": 0}
+    pairs = args.peers // 2
+    semaphore = asyncio.Semaphore(args.concurrency)
+    sockets = []
+
+    async with ClientSession(connector=TCPConnector(limit=0)) as session:
+        async def limited(i):
+            async with semaphore:
+                sockets.extend(await run_pair(
+                    session, url, args.token, server.create_call([2 * i + 1, 2 * i + 2]),
+                    2 * i + 1, 2 * i + 2, args.ice, stats
+                ))
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(limited(i) for i in range(pairs)), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        errors = [r for r in results if isinstance(r, Exception)]
+
+        setup = sorted(stats["setup"])
+        print(f"Участников: {len(sockets)} из {pairs * 2}, ошибок: {len(errors)}")
+        if errors:
+            print(f"Первая ошибка: {errors[0]!r}")
+        if setup:
+            print(f"Время: {elapsed:.2f} сек, звонков/сек: {len(setup) / elapsed:.0f}")
+            print(
+                f"Установление звонка: p50 {statistics.median(setup) * 1000:.1f} мс, "
+                f"p99 {setup[min(len(setup) - 1, int(len(setup) * 0.99))] * 1000:.1f} мс"
+            )
+            print(
+                f"ICE: {stats['ice_candidates']} кандидатов в {stats['ice_messages']} сообщениях "
+                f"({stats['ice_candidates'] / max(stats['ice_messages'], 1):.1f} в пачке)"
+            )
+        print(
+            f"Сервер: комнат {len(server.rooms)}, участников {server.peers_count}, "
+            f"сообщений {server.relayed}, сброшено {server.dropped}"
+        )
+
+        await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
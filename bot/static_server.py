@@ -0,0 +1,138 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.getenv(
+    "STATIC_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "static")
+)
+
+# Файлы с хэшем в имени не меняются никогда, остальные браузер перепроверяет по ETag
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+# Меньше этого размера сжатие не окупается
+MIN_COMPRESS_SIZE = 256
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+class Asset:
+    """Файл в памяти со сжатыми вариантами"""
+
+    __slots__ = ("body", "gzip", "br", "etag", "content_type", "cache_control")
+
+    def __init__(self, body: bytes, content_type: str, cache_control: str):
+        self.body = body
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.gzip = None
+        self.br = None
+        if len(body) >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+            self.gzip = gzip.compress(body, compresslevel=9)
+            if brotli is not None:
+                self.br = brotli.compress(body, quality=11)
+
+class StaticServer:
+    """
+    Раздача мини-приложения из памяти.
+
+    Все файлы читаются и сжимаются (gzip, brotli — если установлен) один раз при старте.
+    Для каждого файла, кроме HTML, есть копия с хэшем содержимого в имени
+    (app.js -> app.<hash>.js), и HTML ссылается на неё — такие файлы кэшируются навсегда.
+    """
+
+    def __init__(self, root: str = STATIC_DIR, index: str = "index.html"):
+        self.root = os.path.abspath(root)
+        self.index = index
+        self.assets = {}
+
+    def load(self):
+        files = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    files[rel_path] = f.read()
+
+        # Сначала ресурсы: нужны их хэшированные имена для подстановки в HTML
+        hashed_names = {}
+        for path, body in files.items():
+            if path.endswith(".html"):
+                continue
+            content_type = self._content_type(path)
+            base, ext = os.path.splitext(path)
+            hashed = f"{base}.{hashlib.sha256(body).hexdigest()[:10]}{ext}"
+            hashed_names[path] = hashed
+            self.assets[path] = Asset(body, content_type, CACHE_REVALIDATE)
+            self.assets[hashed] = Asset(body, content_type, CACHE_IMMUTABLE)
+
+        for path, body in files.items():
+            if path.endswith(".html"):
+                body = self._rewrite_links(body.decode("utf-8"), hashed_names).encode("utf-8")
+                self.assets[path] = Asset(body, "text/html; charset=utf-8", CACHE_REVALIDATE)
+
+        logger.info(f"📁 Статика: {len(files)} файлов из {self.root} (brotli: {'да' if brotli else 'нет'})")
+
+    @staticmethod
+    def _content_type(path: str):
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        return content_type
+
+    @staticmethod
+    def _rewrite_links(html: str, hashed_names: dict):
+        def replace(match):
+            attr, quote, url = match.groups()
+            target = hashed_names.get(url.lstrip("./"))
+            return f"{attr}={quote}{target}{quote}" if target else match.group(0)
+        return re.sub(r'\b(src|href)=(["\'])([^"\'#?:]+)\2', replace, html)
+
+    async def handle(self, request: web.Request):
+        path = request.match_info.get("path", "") or self.index
+        asset = self.assets.get(path)
+        if asset is None:
+            raise web.HTTPNotFound()
+
+        accept = request.headers.get("Accept-Encoding", "")
+        if asset.br is not None and "br" in accept:
+            body, encoding = asset.br, "br"
+        elif asset.gzip is not None and "gzip" in accept:
+            body, encoding = asset.gzip, "gzip"
+        else:
+            body, encoding = asset.body, None
+
+        etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        headers["Content-Type"] = asset.content_type
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return web.Response(headers=headers)
+        return web.Response(body=body, headers=headers)
+
+def setup_static(app: web.Application, server: StaticServer):
+    """Зарегистрировать раздачу статики; вызывать последним — маршрут ловит все пути"""
+    server.load()
+    app.router.add_get("/", server.handle)
+    app.router.add_get("/{path:.+}", server.handle)
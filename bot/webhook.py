@@ -0,0 +1,61 @@
+import hmac
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookHandler:
+    """Приём обновлений от Telegram: проверяет секрет, сразу отвечает 200
+    и обрабатывает обновление в фоне"""
+
+    def __init__(self, dp: Dispatcher, secret: str = None):
+        self.dp = dp
+        self.secret = secret
+        self._tasks = set()
+
+    async def __call__(self, request: web.Request):
+        if self.secret:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, self.secret):
+                logger.warning(f"Webhook: неверный секрет от {request.remote}")
+                return web.Response(status=401)
+
+        try:
+            update = types.Update(**(await request.json()))
+        except Exception as e:
+            logger.error(f"Webhook: некорректное обновление: {e}")
+            return web.Response(status=400)
+
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: types.Update):
+        try:
+            await self.dp.process_updates([update])
+        except Exception as e:
+            logger.exception(f"Ошибка обработки обновления {update.update_id}: {e}")
+
+    async def wait_closed(self, timeout: float = 10):
+        """Дождаться обновлений, которые ещё обрабатываются"""
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+def setup_webhook(app: web.Application, dp: Dispatcher, path: str, secret: str = None):
+    """Зарегистрировать обработчик вебхука в aiohttp-приложении"""
+    handler = WebhookHandler(dp, secret)
+    app.router.add_post(path, handler)
+
+    async def on_shutdown(app):
+        await handler.wait_closed()
+
+    app.on_shutdown.append(on_shutdown)
+    return handler
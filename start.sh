@@ -1,11 +1,5 @@
 #!/bin/bash
 
-# Запускаем статический сервер в фоне
-python3 -m http.server 8000 --directory static &
-
-# Ждем немного
-sleep 2
-
-# Запускаем бота
+# Мини-приложение раздаёт сам бот (встроенный HTTP-сервер на $PORT)
 cd bot
 python3 main.py
@@ -3,6 +3,19 @@ let localStream;
 let remoteStream;
 let peerConnection;
 let screenStream;
+let signaling;
+let remotePeerId = null;
+let roomPeers = [];
+let waitingForPeer = false;
+const pendingCandidates = [];
+
+// Сигнальный сервер: тот же хост, что и бот (можно переопределить window.SIGNALING_URL)
+const SIGNALING_URL = window.SIGNALING_URL ||
+    location.origin.replace(/^http/, 'ws') + '/ws';
+// ID звонка выдаёт бот и передаёт в ссылке на мини-приложение: ?call=<id>.
+// Без него в комнату не входим: общей комнаты «для всех» нет
+const callId = new URLSearchParams(location.search).get('call') ||
+    (window.Telegram && Telegram.WebApp.initDataUnsafe.start_param) || '';
 
 const servers = {
     iceServers: [
@@ -30,16 +43,49 @@ async function init() {
         });
         localVideo.srcObject = localStream;
         status.textContent = 'Камера и микрофон готовы';
+        connectSignaling();
     } catch (err) {
         status.textContent = 'Ошибка доступа к медиа: ' + err.message;
     }
 }
 
-// Начать звонок
-startBtn.onclick = async () => {
-    startBtn.disabled = true;
-    hangupBtn.disabled = false;
-    
+// Отправить сообщение на сигнальный сервер
+function signal(message) {
+    if (signaling && signaling.readyState === WebSocket.OPEN) {
+        signaling.send(JSON.stringify(message));
+    }
+}
+
+// Подключиться к сигнальному серверу и войти в комнату звонка
+function connectSignaling() {
+    if (!callId) {
+        status.textContent = 'Откройте звонок из бота: «📞 Чаты» → контакт';
+        startBtn.disabled = true;
+        return;
+    }
+    signaling = new WebSocket(SIGNALING_URL);
+    signaling.onopen = () => {
+        signal({
+            type: 'auth',
+            initData: window.Telegram ? Telegram.WebApp.initData : '',
+            room: callId
+        });
+    };
+    signaling.onmessage = event => handleSignal(JSON.parse(event.data));
+    signaling.onclose = event => {
+        signaling = null;
+        roomPeers = [];
+        if (event.code === 4001) {
+            status.textContent = 'Нет доступа к звонкам';
+        } else if (event.code === 4003) {
+            status.textContent = 'Звонок не найден или вы в него не приглашены';
+        }
+    };
+}
+
+// Создать соединение с участником
+function createPeerConnection(peerId) {
+    remotePeerId = peerId;
     peerConnection = new RTCPeerConnection(servers);
     
     // Добавляем локальный поток
@@ -53,14 +99,90 @@ startBtn.onclick = async () => {
         remoteVideo.srcObject = remoteStream;
     };
     
-    // Создаем offer
+    // ICE-кандидаты уходят по одному, сервер сам склеивает их в пачки
+    peerConnection.onicecandidate = event => {
+        if (event.candidate) {
+            signal({ type: 'ice', to: peerId, candidate: event.candidate });
+        }
+    };
+}
+
+// Обработка сообщений сигнального сервера
+async function handleSignal(message) {
+    if (message.type === 'joined') {
+        roomPeers = message.peers;
+    } else if (message.type === 'offer') {
+        if (!peerConnection) {
+            createPeerConnection(message.from);
+        }
+        await peerConnection.setRemoteDescription(message.sdp);
+        const answer = await peerConnection.createAnswer();
+        await peerConnection.setLocalDescription(answer);
+        signal({ type: 'answer', to: message.from, sdp: answer });
+        flushCandidates();
+        startBtn.disabled = true;
+        hangupBtn.disabled = false;
+        status.textContent = 'Входящий звонок принят';
+    } else if (message.type === 'answer') {
+        await peerConnection.setRemoteDescription(message.sdp);
+        flushCandidates();
+        status.textContent = 'Звонок соединен';
+    } else if (message.type === 'ice') {
+        pendingCandidates.push(...message.candidates);
+        flushCandidates();
+    } else if (message.type === 'peer-joined') {
+        roomPeers.push(message.peer);
+        status.textContent = 'Участник подключился';
+        if (waitingForPeer) {
+            await callPeer(message.peer);
+        }
+    } else if (message.type === 'peer-left') {
+        roomPeers = roomPeers.filter(id => id !== message.peer);
+        if (message.peer === remotePeerId) {
+            status.textContent = 'Участник покинул звонок';
+        }
+    }
+}
+
+// Кандидаты применяются только после установки remote description
+function flushCandidates() {
+    if (!peerConnection || !peerConnection.remoteDescription) {
+        return;
+    }
+    while (pendingCandidates.length) {
+        peerConnection.addIceCandidate(pendingCandidates.shift());
+    }
+}
+
+// Позвонить участнику комнаты
+async function callPeer(peerId) {
+    waitingForPeer = false;
+    createPeerConnection(peerId);
+    
+    // Создаем offer и отправляем его участнику через сервер
     const offer = await peerConnection.createOffer();
     await peerConnection.setLocalDescription(offer);
+    signal({ type: 'offer', to: peerId, sdp: offer });
     
     status.textContent = 'Звонок начат...';
+}
+
+// Начать звонок
+startBtn.onclick = async () => {
+    startBtn.disabled = true;
+    hangupBtn.disabled = false;
+    
+    if (!signaling) {
+        connectSignaling();
+    }
     
-    // Здесь будет отправка offer на сервер
-    console.log('Offer создан:', offer);
+    if (roomPeers.length) {
+        await callPeer(roomPeers[0]);
+    } else {
+        // Позвоним, как только участник войдет в комнату
+        waitingForPeer = true;
+        status.textContent = 'Ожидание участника...';
+    }
 };
 
 // Завершить звонок
@@ -69,6 +191,9 @@ hangupBtn.onclick = () => {
         peerConnection.close();
         peerConnection = null;
     }
+    remotePeerId = null;
+    waitingForPeer = false;
+    pendingCandidates.length = 0;
     if (remoteVideo.srcObject) {
         remoteVideo.srcObject.getTracks().forEach(track => track.stop());
         remoteVideo.srcObject = null;
@@ -133,5 +258,31 @@ remoteControl.onclick = () => {
     alert('Для удаленного управления нужен WebRTC Data Channel и специальный сервер');
 };
 
+// Пульс присутствия: пока мини-приложение открыто, пользователь в сети.
+// Сервер забывает его через 45 секунд без пульса (PRESENCE_TTL)
+const PRESENCE_URL = location.origin + '/presence';
+const PRESENCE_INTERVAL = 20000;
+
+function presenceBody(extra) {
+    return JSON.stringify(Object.assign({
+        initData: window.Telegram ? Telegram.WebApp.initData : ''
+    }, extra));
+}
+
+function sendHeartbeat() {
+    fetch(PRESENCE_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: presenceBody({})
+    }).catch(() => {});
+}
+
+sendHeartbeat();
+setInterval(sendHeartbeat, PRESENCE_INTERVAL);
+// При закрытии сразу сообщаем серверу, не дожидаясь истечения
+window.addEventListener('pagehide', () => {
+    navigator.sendBeacon(PRESENCE_URL, presenceBody({ leave: true }));
+});
+
 // Инициализация при загрузке
 init();
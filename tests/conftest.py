@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# Модули бота импортируются как в bot/main.py: из каталога bot
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot")
+sys.path.insert(0, os.path.abspath(BOT_DIR))
+
+# Тесты не ходят в настоящий Supabase: пустой URL включает локальное хранилище
+# (load_dotenv не перезаписывает уже заданные переменные)
+os.environ["SUPABASE_URL"] = ""
+os.environ["SUPABASE_KEY"] = ""
+# Синглтон database.db открывает локальное хранилище при импорте — не в рабочем каталоге
+os.environ["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "users.sqlite3")
+# Для импорта main: токен в формате Telegram и два администратора
+os.environ["BOT_TOKEN"] = "123456:test"
+os.environ["ADMIN_IDS"] = "1,2"
@@ -0,0 +1,57 @@
+import os
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+import database
+from database import Database
+from fake_supabase import FakeSupabase
+
+@asynccontextmanager
+async def local_database(path):
+    """Database на локальном хранилище в файле path"""
+    previous = database.LOCAL_DB_PATH
+    database.LOCAL_DB_PATH = str(path)
+    try:
+        db = Database()
+    finally:
+        database.LOCAL_DB_PATH = previous
+    try:
+        yield db
+    finally:
+        await db.close()
+
+@asynccontextmanager
+async def supabase_database(replica_path=None, connect=True):
+    """Database поверх fake_supabase, поднятого в этом же event loop: (db, fake).
+    replica_path — файл локальной реплики, connect=False — не ждать подключения"""
+    fake = FakeSupabase()
+    runner = web.AppRunner(fake.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    saved = {name: os.environ.get(name) for name in ("SUPABASE_URL", "SUPABASE_KEY")}
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["SUPABASE_KEY"] = "fake.fake.fake"
+    saved_replica = database.LOCAL_REPLICA, database.LOCAL_DB_PATH
+    if replica_path is not None:
+        database.LOCAL_REPLICA, database.LOCAL_DB_PATH = True, str(replica_path)
+    try:
+        db = Database()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        database.LOCAL_REPLICA, database.LOCAL_DB_PATH = saved_replica
+    if connect:
+        await db.start()
+        await db.wait_connected()
+    try:
+        yield db, fake
+    finally:
+        await db.close()
+        await runner.cleanup()
@@ -0,0 +1,79 @@
+import asyncio
+
+from audit import AuditLog
+from helpers import local_database, supabase_database
+
+async def register_and_approve(db):
+    await db.create_user(5, "+79990000005", "Test")
+    # Свежая строка не в кэше: прежний статус должен прийти из базы
+    db.user_cache.clear()
+    first = await db.change_user_status(5, "approved")
+    second = await db.change_user_status(5, "banned")
+    missing = await db.change_user_status(404, "approved")
+    return first, second, missing
+
+def check_transitions(first, second, missing):
+    assert first[0] == "pending" and first[1]["status"] == "approved"
+    assert second[0] == "approved" and second[1]["status"] == "banned"
+    assert missing == (None, None)
+
+def test_previous_status_from_local_store(tmp_path):
+    async def run():
+        async with local_database(tmp_path / "users.sqlite3") as db:
+            return await register_and_approve(db)
+
+    check_transitions(*asyncio.run(run()))
+
+def test_previous_status_from_supabase():
+    async def run():
+        async with supabase_database() as (db, fake):
+            transitions = await register_and_approve(db)
+            # Смена статуса — один запрос, без предварительного чтения
+            requests = fake.requests
+            await db.change_user_status(5, "approved")
+            assert fake.requests == requests + 1
+            return transitions
+
+    check_transitions(*asyncio.run(run()))
+
+def test_bulk_update_only_from_status(tmp_path):
+    async def run():
+        async with local_database(tmp_path / "users.sqlite3") as db:
+            for user_id in (1, 2, 3):
+                await db.create_user(user_id, f"+7999000000{user_id}", "Test")
+            await db.change_user_status(2, "banned")
+            return await db.bulk_update_status([1, 2, 3], "approved", from_status="pending")
+
+    users = asyncio.run(run())
+    assert sorted(user["telegram_id"] for user in users) == [1, 3]
+
+class SlowAuditDb:
+    """Запоминает пачки и сколько вставок шло одновременно"""
+
+    def __init__(self):
+        self.batches = []
+        self.active = 0
+        self.max_active = 0
+
+    async def insert_audit_entries(self, entries):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.batches.append([entry["telegram_id"] for entry in entries])
+        self.active -= 1
+        return True
+
+def test_concurrent_flushes_do_not_overlap():
+    async def run():
+        db = SlowAuditDb()
+        audit = AuditLog(db, batch_size=2, flush_interval=0.005)
+        for user_id in range(7):
+            audit.record(user_id, 1, "pending", "approved")
+        # Сброс из render_history вместе с фоновым и сбросом по размеру пачки
+        await asyncio.gather(audit.flush(), audit.flush(), asyncio.sleep(0.02))
+        await audit.close()
+        return db
+
+    db = asyncio.run(run())
+    assert db.max_active == 1
+    assert sorted(user_id for batch in db.batches for user_id in batch) == list(range(7))
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.utils.exceptions import BotBlocked
+from postgrest.exceptions import APIError
+
+from broadcast import Broadcaster, BroadcastStore
+from database import SchemaError
+from helpers import supabase_database
+
+class FakeDb:
+    def __init__(self, pages=(), error=None):
+        self.pages = list(pages)
+        self.error = error
+        self.blocked = []
+
+    async def get_status_counts(self):
+        return {"approved": sum(len(page) for page in self.pages)}
+
+    async def get_ids_page(self, status, after_id, limit):
+        if self.error:
+            raise self.error
+        return self.pages.pop(0) if self.pages else []
+
+    async def set_bot_blocked(self, telegram_ids, blocked=True):
+        self.blocked.append(list(telegram_ids))
+        return len(telegram_ids)
+
+class FakeSender:
+    """Отправка не идёт: future каждого получателя завершает тест"""
+
+    def __init__(self):
+        self.futures = {}
+
+    def submit(self, method, chat_id, priority, **kwargs):
+        future = self.futures[chat_id] = asyncio.get_running_loop().create_future()
+        return future
+
+class FakeBot:
+    def __init__(self):
+        self.texts = []
+
+    async def edit_message_text(self, text, **kwargs):
+        self.texts.append(text)
+
+def make_broadcaster(tmp_path, db, page_size=3):
+    return Broadcaster(
+        FakeBot(), db, FakeSender(), store=BroadcastStore(str(tmp_path / "broadcasts.sqlite3")),
+        page_size=page_size, progress_interval=0
+    )
+
+PROGRESS = SimpleNamespace(chat=SimpleNamespace(id=1), message_id=10)
+
+def test_stop_marks_unreachable_users_as_blocked(tmp_path):
+    async def scenario():
+        db = FakeDb(pages=[[11, 12, 13]])
+        broadcaster = make_broadcaster(tmp_path, db)
+        broadcast = await broadcaster.start(1, 5, PROGRESS)
+        while 13 not in broadcaster.sender.futures:
+            await asyncio.sleep(0)
+        broadcaster.sender.futures[11].set_exception(BotBlocked("Forbidden: bot was blocked by the user"))
+        broadcaster.sender.futures[12].set_result(None)
+        await asyncio.sleep(0)
+
+        assert await broadcaster.stop(broadcast["id"])
+        assert db.blocked == [[11]]
+        assert (broadcast["sent"], broadcast["blocked"], broadcast["last_id"]) == (1, 1, 12)
+        assert broadcaster.sender.futures[13].cancelled()
+        await broadcaster.close()
+
+    asyncio.run(scenario())
+
+def test_missing_column_fails_broadcast_without_retries(tmp_path):
+    async def scenario():
+        db = FakeDb(error=SchemaError("в таблице users нет колонки bot_blocked"))
+        broadcaster = make_broadcaster(tmp_path, db)
+        broadcast = await broadcaster.start(1, 5, PROGRESS)
+        await asyncio.wait_for(broadcaster._task, timeout=1)
+
+        assert broadcast["status"] == "failed"
+        assert "bot_blocked" in broadcaster.bot.texts[-1]
+        # Упавшая рассылка не продолжается после перезапуска
+        assert await broadcaster.store.running() == []
+        await broadcaster.close()
+
+    asyncio.run(scenario())
+
+def test_get_ids_page_raises_schema_error_for_missing_column():
+    async def scenario():
+        async with supabase_database() as (db, fake):
+            async def missing_column(query):
+                raise APIError({"code": "42703", "message": "column users.bot_blocked does not exist"})
+
+            db._execute = missing_column
+            with pytest.raises(SchemaError, match="bot_blocked"):
+                await db.get_ids_page("approved")
+
+            async def unavailable(query):
+                raise ConnectionError("timeout")
+
+            db._execute = unavailable
+            assert await db.get_ids_page("approved") is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,47 @@
+import pytest
+
+from contacts import normalize_phone, parse_contacts
+
+@pytest.mark.parametrize("raw, expected", [
+    ("+7 999 123-45-67", "+79991234567"),
+    ("8 (999) 123-45-67", "+79991234567"),
+    ("999 123 45 67", "+79991234567"),
+    ("79991234567", "+79991234567"),
+    ("0049 151 1234 5678", "+4915112345678"),
+    ("+44 20 7946 0958", "+442079460958"),
+    ("8 (3452) 10-11-12", "+73452101112"),
+    # Даты и короткие числа без + — не номера
+    ("2024-01-01", None),
+    ("2024.1.1", None),
+    ("01.02.2024", None),
+    ("1/2/24", None),
+    ("2024-01-01 12:30", None),
+    ("20240101", None),
+    ("12345678", None),
+    ("+0123456789", None),
+    ("", None),
+])
+def test_normalize_phone(raw, expected):
+    assert normalize_phone(raw) == expected
+
+def test_parse_contacts_skips_dates():
+    contacts, invalid = parse_contacts(
+        "Иван +7 999 123-45-67\n"
+        "Встреча 2024-01-01\n"
+        "Пётр 8 (999) 765-43-21 01.02.2024\n"
+        "31.12.2023 Маша 89990000000\n"
+    )
+    assert contacts == [
+        {"phone_number": "+79991234567", "name": "Иван"},
+        {"phone_number": "+79997654321", "name": "Пётр"},
+        {"phone_number": "+79990000000", "name": "Маша"},
+    ]
+    assert invalid == 0
+
+def test_parse_contacts_vcard():
+    contacts, invalid = parse_contacts(
+        "BEGIN:VCARD\nTEL;TYPE=CELL:+7 999 111-22-33\nFN:Анна\nEND:VCARD\n"
+        "BEGIN:VCARD\nFN:Дата\nTEL:2024-01-01\nEND:VCARD\n"
+    )
+    assert contacts == [{"phone_number": "+79991112233", "name": "Анна"}]
+    assert invalid == 1
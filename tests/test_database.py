@@ -0,0 +1,152 @@
+import asyncio
+import threading
+
+from postgrest.exceptions import APIError
+
+import database
+
+from helpers import supabase_database
+
+def test_requests_do_not_wait_for_client_creation(tmp_path):
+    async def scenario():
+        async with supabase_database(replica_path=tmp_path / "replica.sqlite3", connect=False) as (db, fake):
+            await db._local(db.local.upsert_users, [
+                {"telegram_id": 5, "full_name": "Реплика", "status": "approved"}
+            ])
+            # Давняя копия: после подключения её перечитают из Supabase
+            await db._local(db.local.mark_stale, 5)
+            fake.tables["users"] = [{"id": 1, "telegram_id": 5, "full_name": "Supabase", "status": "approved"}]
+            fake._ids["users"] = 1
+
+            # Создание клиента (импорт supabase) зависло в пуле потоков
+            release = threading.Event()
+            create_client = db._create_client
+
+            def slow_create_client():
+                release.wait(5)
+                return create_client()
+
+            db._create_client = slow_create_client
+            await db.start()
+            await asyncio.sleep(0.05)
+            assert db.supabase is None
+
+            # Event loop не заблокирован: чтение — из реплики, запись недоступна
+            user = await asyncio.wait_for(db.get_user(5), timeout=1)
+            assert user["full_name"] == "Реплика"
+            assert await asyncio.wait_for(db.create_user(6, "+79990000006", "Новый"), timeout=1) is None
+            assert await db._local(db.local.get_user, 6) is None
+
+            release.set()
+            await db.wait_connected()
+            assert db.supabase is not None
+            assert (await db.get_user(5))["full_name"] == "Supabase"
+            assert await db.create_user(6, "+79990000006", "Новый") is True
+
+    asyncio.run(scenario())
+
+def test_fresh_replica_row_is_served_without_supabase(tmp_path, monkeypatch):
+    async def scenario():
+        async with supabase_database(replica_path=tmp_path / "replica.sqlite3") as (db, fake):
+            fake.tables["users"] = [{"id": 1, "telegram_id": 5, "full_name": "Иван", "status": "pending"}]
+            fake._ids["users"] = 1
+            assert (await db.get_user(5))["status"] == "pending"
+
+            # Строку изменил другой экземпляр бота, кэш в памяти истёк
+            fake.tables["users"][0]["status"] = "banned"
+            db.user_cache.clear()
+            requests = fake.requests
+            assert (await db.get_user(5))["status"] == "pending"
+            assert fake.requests == requests
+
+            # Копия старше REPLICA_MAX_AGE — запрос в Supabase и обновление копии
+            monkeypatch.setattr(database, "REPLICA_MAX_AGE", 0)
+            assert (await db.get_user(5))["status"] == "banned"
+            assert fake.requests == requests + 1
+            assert (await db._local(db.local.get_user, 5))["status"] == "banned"
+
+    asyncio.run(scenario())
+
+def test_own_writes_and_unknown_state_update_replica(tmp_path):
+    async def scenario():
+        async with supabase_database(replica_path=tmp_path / "replica.sqlite3") as (db, fake):
+            fake.tables["users"] = [{"id": 1, "telegram_id": 5, "full_name": "Иван", "status": "pending"}]
+            fake._ids["users"] = 1
+            await db.get_user(5)
+
+            # Своя запись видна в копии сразу
+            await db.update_user_status(5, "approved")
+            db.user_cache.clear()
+            requests = fake.requests
+            assert (await db.get_user(5))["status"] == "approved"
+            assert fake.requests == requests
+
+            # Состояние строки неизвестно — копия больше не считается свежей
+            db._forget(5)
+            fake.tables["users"][0]["status"] = "banned"
+            assert (await db.get_user(5))["status"] == "banned"
+            assert fake.requests == requests + 1
+
+    asyncio.run(scenario())
+
+def test_name_search_ignores_yo():
+    async def scenario():
+        async with supabase_database() as (db, fake):
+            for telegram_id, name in ((1, "Алёна Петрова"), (2, "Алена  Сидорова"), (3, "Пётр")):
+                await db.create_user(telegram_id, f"+7999000000{telegram_id}", name)
+            rows, _ = await db.search_users("алена")
+            assert [row["telegram_id"] for row in rows] == [1, 2]
+            rows, _ = await db.search_users("Алёна Сидорова")
+            assert [row["telegram_id"] for row in rows] == [2]
+
+    asyncio.run(scenario())
+
+def test_name_search_without_migration_falls_back_to_full_name():
+    async def scenario():
+        async with supabase_database() as (db, fake):
+            await db.create_user(1, "+79990000001", "Алена")
+            execute = db._execute
+
+            async def without_column(query):
+                if "full_name_search" in str(query.params):
+                    raise APIError({"code": "42703", "message": "column users.full_name_search does not exist"})
+                return await execute(query)
+
+            db._execute = without_column
+            rows, _ = await db.search_users("Алена")
+            assert [row["telegram_id"] for row in rows] == [1]
+            assert db._name_search_column == "full_name"
+
+    asyncio.run(scenario())
+
+def test_status_counts_in_one_request():
+    async def scenario():
+        async with supabase_database() as (db, fake):
+            fake.tables["users"] = [
+                {"id": 1, "telegram_id": 1, "status": "pending"},
+                {"id": 2, "telegram_id": 2, "status": "approved"},
+                {"id": 3, "telegram_id": 3, "status": "approved"},
+            ]
+            fake._ids["users"] = 3
+            requests = fake.requests
+            counts = await db.get_status_counts()
+            assert fake.requests == requests + 1
+            assert counts == {"pending": 1, "approved": 2, "rejected": 0, "banned": 0, "total": 3}
+
+    asyncio.run(scenario())
+
+def test_create_user_relies_on_unique_telegram_id(monkeypatch):
+    import fake_supabase
+
+    async def scenario():
+        async with supabase_database() as (db, fake):
+            assert await db.create_user(7, "+79990000007", "Первый") is True
+            assert await db.create_user(7, "+79990000007", "Повтор") is False
+            assert len(fake.tables["users"]) == 1
+
+            # Без миграции из README PostgreSQL отклоняет on_conflict (42P10)
+            monkeypatch.setitem(fake_supabase.UNIQUE, "users", [])
+            assert await db.create_user(8, "+79990000008", "Новый") is None
+            assert len(fake.tables["users"]) == 1
+
+    asyncio.run(scenario())
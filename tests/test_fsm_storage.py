@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+import fsm_storage
+from fsm_storage import SQLiteStorage
+
+async def close(*storages):
+    for storage in storages:
+        await storage.close()
+        await storage.wait_closed()
+
+def test_write_is_visible_to_another_process(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "fsm.sqlite3")
+        # Два хранилища на одном файле — как два процесса бота
+        first, second = SQLiteStorage(path), SQLiteStorage(path)
+        await first.set_state(chat=1, user=1, state="Form:name")
+        await first.update_data(chat=1, user=1, data={"name": "Иван"})
+        assert await second.get_state(chat=1, user=1) == "Form:name"
+        assert await second.get_data(chat=1, user=1) == {"name": "Иван"}
+        await close(first, second)
+
+    asyncio.run(scenario())
+
+def test_write_survives_without_close(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "fsm.sqlite3")
+        storage = SQLiteStorage(path)
+        await storage.set_state(chat=1, user=1, state="Form:phone")
+        # Процесс упал: хранилище не закрыто, новое открывает тот же файл
+        reopened = SQLiteStorage(path)
+        assert await reopened.get_state(chat=1, user=1) == "Form:phone"
+        await close(storage, reopened)
+
+    asyncio.run(scenario())
+
+def test_concurrent_writes_share_transactions(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "fsm.sqlite3")
+        storage = SQLiteStorage(path)
+        batches = []
+        write_batch = storage._write_batch
+
+        def counting(batch):
+            batches.append(len(batch))
+            write_batch(batch)
+
+        storage._write_batch = counting
+        await asyncio.gather(*(storage.set_state(chat=i, user=i, state=f"S:{i}") for i in range(100)))
+        assert sum(batches) == 100
+        assert len(batches) < 100
+        reader = SQLiteStorage(path)
+        assert [await reader.get_state(chat=i, user=i) for i in range(100)] == [f"S:{i}" for i in range(100)]
+        await close(storage, reader)
+
+    asyncio.run(scenario())
+
+def test_failed_write_does_not_override_newer_value(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"))
+        write_batch = storage._write_batch
+        calls = []
+
+        def failing_once(batch):
+            calls.append(dict(batch))
+            if len(calls) == 1:
+                raise RuntimeError("disk I/O error")
+            write_batch(batch)
+
+        storage._write_batch = failing_once
+        old = asyncio.create_task(storage.set_state(chat=1, user=1, state="Old"))
+        while not calls:
+            await asyncio.sleep(0.001)
+        # Новое значение приходит, пока старое пишется (и не запишется)
+        new = asyncio.create_task(storage.set_state(chat=1, user=1, state="New"))
+        with pytest.raises(RuntimeError):
+            await old
+        await new
+        assert len(calls) == 2
+        assert await storage.get_state(chat=1, user=1) == "New"
+        await close(storage)
+
+    asyncio.run(scenario())
+
+def test_expired_state_is_not_returned(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"), ttl=-1)
+        await storage.set_state(chat=1, user=1, state="Form:name")
+        assert await storage.get_state(chat=1, user=1) is None
+        assert await storage.get_data(chat=1, user=1, default={"a": 1}) == {"a": 1}
+        await close(storage)
+
+    asyncio.run(scenario())
+
+def test_redis_storage_round_trip(monkeypatch):
+    pytest.importorskip("redis.asyncio")
+    from aiogram.contrib.fsm_storage.redis import RedisStorage2
+    from redis.exceptions import ConnectionError as RedisConnectionError
+
+    monkeypatch.setattr(fsm_storage, "FSM_STORAGE", "redis")
+    storage = fsm_storage.create_storage()
+    assert isinstance(storage, RedisStorage2)
+    assert storage._state_ttl == storage._data_ttl == storage._bucket_ttl == fsm_storage.FSM_TTL
+
+    async def scenario():
+        try:
+            await storage._redis.ping()
+        except (RedisConnectionError, OSError):
+            pytest.skip(f"Redis недоступен на {fsm_storage.REDIS_HOST}:{fsm_storage.REDIS_PORT}")
+        try:
+            await storage.set_state(chat=-1, user=-1, state="Form:name")
+            await storage.update_data(chat=-1, user=-1, data={"name": "Иван"})
+            assert await storage.get_state(chat=-1, user=-1) == "Form:name"
+            assert await storage.get_data(chat=-1, user=-1) == {"name": "Иван"}
+            # Брошенный диалог истекает, как и в SQLite
+            key = storage.generate_key(-1, -1, "state")
+            assert 0 < await storage._redis.ttl(key) <= fsm_storage.FSM_TTL
+        finally:
+            await storage.reset_state(chat=-1, user=-1, with_data=True)
+            await close(storage)
+
+    asyncio.run(scenario())
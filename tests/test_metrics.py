@@ -0,0 +1,23 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+
+import metrics
+
+async def get_metrics(headers=None):
+    app = web.Application()
+    mounted = metrics.setup_metrics(app)
+    async with TestClient(TestServer(app)) as client:
+        response = await client.get("/metrics", headers=headers or {})
+        return mounted, response.status
+
+def test_metrics_are_not_mounted_without_token(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", None)
+    assert asyncio.run(get_metrics()) == (False, 404)
+
+def test_metrics_require_token(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+    assert asyncio.run(get_metrics()) == (True, 401)
+    assert asyncio.run(get_metrics({"Authorization": "Bearer wrong"})) == (True, 401)
+    assert asyncio.run(get_metrics({"Authorization": "Bearer secret"})) == (True, 200)
@@ -0,0 +1,105 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, types
+
+from callbacks import CallbackRouter
+from middlewares import ThrottlingMiddleware, UserContextMiddleware
+
+class CountingDb:
+    def __init__(self):
+        self.lookups = []
+
+    async def get_user(self, telegram_id):
+        self.lookups.append(telegram_id)
+        return {"telegram_id": telegram_id, "status": "approved"}
+
+def message_update(update_id: int, user_id: int, text: str):
+    return types.Update.to_object({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+        },
+    })
+
+def callback_update(update_id: int, user_id: int, data: str):
+    return types.Update.to_object({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": "1", "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+        },
+    })
+
+def test_user_is_loaded_only_for_handlers_that_declare_it():
+    async def run():
+        bot = Bot(token="123456:test")
+        dp = Dispatcher(bot)
+        db = CountingDb()
+        dp.middleware.setup(UserContextMiddleware(db))
+        router = CallbackRouter(admin_ids=[])
+        router.register(dp)
+        seen = {}
+
+        @dp.message_handler(commands=["help"])
+        async def cmd_help(message: types.Message):
+            seen["help"] = True
+
+        @dp.message_handler(commands=["me"])
+        async def cmd_me(message: types.Message, user: dict):
+            seen["me"] = user
+
+        @router.route("plain")
+        async def plain(callback_query: types.CallbackQuery):
+            seen["plain"] = True
+
+        @router.route("mine")
+        async def mine(callback_query: types.CallbackQuery, user: dict):
+            seen["mine"] = user
+
+        Dispatcher.set_current(dp)
+        Bot.set_current(bot)
+        await dp.process_updates([message_update(1, 10, "/help")])
+        await dp.process_updates([callback_update(2, 11, router.pack("plain"))])
+        assert db.lookups == []
+        await dp.process_updates([message_update(3, 12, "/me")])
+        await dp.process_updates([callback_update(4, 13, router.pack("mine"))])
+        return db, seen
+
+    db, seen = asyncio.run(run())
+    assert db.lookups == [12, 13]
+    assert seen["help"] and seen["plain"]
+    assert seen["me"]["telegram_id"] == 12
+    assert seen["mine"]["telegram_id"] == 13
+
+def test_callback_routes_use_their_own_throttle_group(monkeypatch):
+    async def run():
+        bot = Bot(token="123456:test")
+        dp = Dispatcher(bot)
+        dp.middleware.setup(ThrottlingMiddleware(rules={"call": (0.001, 1), "callback": (0.001, 3)}))
+        router = CallbackRouter(admin_ids=[])
+        router.register(dp)
+        calls = []
+
+        @router.route("call", throttle="call")
+        async def call(callback_query: types.CallbackQuery):
+            calls.append("call")
+
+        @router.route("menu")
+        async def menu(callback_query: types.CallbackQuery):
+            calls.append("menu")
+
+        async def answer(*args, **kwargs):
+            calls.append("throttled")
+
+        Dispatcher.set_current(dp)
+        Bot.set_current(bot)
+        monkeypatch.setattr(types.CallbackQuery, "answer", answer)
+        for update_id, data in enumerate(["call", "call", "menu", "menu", "menu", "menu"], 1):
+            await dp.process_updates([callback_update(update_id, 10, router.pack(data))])
+        return calls
+
+    calls = asyncio.run(run())
+    # Вторая кнопка звонка отброшена, но бакет "callback" остался целым для меню
+    assert calls == ["call", "throttled", "menu", "menu", "menu", "throttled"]
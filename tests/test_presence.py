@@ -0,0 +1,68 @@
+import json
+import time
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+
+from presence import PresenceRegistry, setup_presence
+from signaling import sign_init_data
+
+TOKEN = "123456:test"
+
+def init_data(user_id: int):
+    return sign_init_data({"auth_date": str(int(time.time())), "user": json.dumps({"id": user_id})}, TOKEN)
+
+async def allow_all(user_id):
+    return True
+
+def test_query_returns_only_visible_ids():
+    async def scenario():
+        registry = PresenceRegistry()
+        # 1 видит только 2; 3 в сети, но чужой
+        visible = {1: {2}}
+        requested = []
+
+        async def visible_ids(user_id):
+            requested.append(user_id)
+            return visible.get(user_id, set())
+
+        app = web.Application()
+        setup_presence(app, registry, TOKEN, allow_all, visible_ids)
+        async with TestClient(TestServer(app)) as client:
+            for user_id in (2, 3):
+                await client.post("/presence", json={"initData": init_data(user_id)})
+            response = await client.post("/presence", json={"initData": init_data(1), "ids": [2, 3, 4]})
+            assert (await response.json()) == {"online": [2]}
+            response = await client.post("/presence", json={"initData": init_data(3), "ids": [1, 2]})
+            assert (await response.json()) == {"online": []}
+        # Пульс без ids не читает контакты
+        assert requested == [1, 3]
+
+    asyncio.run(scenario())
+
+def test_visible_ids_are_contacts_and_call_peers(monkeypatch):
+    import main
+
+    loads = []
+
+    async def get_contact_users(owner_id):
+        loads.append(owner_id)
+        return {2: "Боб"}
+
+    async def scenario():
+        monkeypatch.setattr(main, "get_contact_users", get_contact_users)
+        main.presence_contacts.clear()
+        call_id = main.signaling.create_call([1, 5])
+        try:
+            assert await main.presence_visible_ids(1) == {2, 5}
+            assert await main.presence_visible_ids(1) == {2, 5}
+            assert loads == [1]
+            # Контакты изменились — список перечитывается
+            main.presence_contacts.invalidate(1)
+            await main.presence_visible_ids(1)
+            assert loads == [1, 1]
+        finally:
+            main.signaling.calls.pop(call_id, None)
+
+    asyncio.run(scenario())
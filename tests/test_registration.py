@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from aiogram import types
+
+import main
+from helpers import local_database, supabase_database
+
+CONCURRENT_CONTACTS = 10
+USER_ID = 42
+
+class RecordingSender:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.messages.append((chat_id, text))
+
+def contact_message(message_id: int):
+    return types.Message.to_object({
+        "message_id": message_id,
+        "date": 0,
+        "chat": {"id": USER_ID, "type": "private"},
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "Ivan", "username": "ivan"},
+        "contact": {"phone_number": "79991234567", "first_name": "Ivan", "user_id": USER_ID},
+    })
+
+async def send_duplicate_contacts(db, monkeypatch):
+    sender = RecordingSender()
+    answers = []
+
+    async def answer(self, text, **kwargs):
+        answers.append(text)
+
+    monkeypatch.setattr(main, "db", db)
+    monkeypatch.setattr(main, "sender", sender)
+    monkeypatch.setattr(types.Message, "answer", answer)
+    await asyncio.gather(*(main.process_contact(contact_message(i)) for i in range(CONCURRENT_CONTACTS)))
+    return sender, answers
+
+def check_single_registration(sender, answers, rows):
+    assert len(rows) == 1
+    assert rows[0]["phone_number"] == "+79991234567"
+    # Ровно одно уведомление каждому администратору
+    assert sorted(chat_id for chat_id, _ in sender.messages) == sorted(main.ADMIN_IDS)
+    assert sum("Спасибо" in text for text in answers) == 1
+    assert len(answers) == CONCURRENT_CONTACTS
+
+@pytest.mark.parametrize("backend", ["local", "supabase"])
+def test_concurrent_duplicate_contacts_create_one_row(backend, tmp_path, monkeypatch):
+    async def run():
+        if backend == "local":
+            async with local_database(tmp_path / "users.sqlite3") as db:
+                sender, answers = await send_duplicate_contacts(db, monkeypatch)
+                rows = await db._local(db.local.get_users)
+        else:
+            async with supabase_database() as (db, fake):
+                sender, answers = await send_duplicate_contacts(db, monkeypatch)
+                rows = [row for row in fake.tables.get("users", []) if row["telegram_id"] == USER_ID]
+        return sender, answers, rows
+
+    check_single_registration(*asyncio.run(run()))
+
+def test_new_registration_does_not_read_user_first(tmp_path, monkeypatch):
+    async def run():
+        async with local_database(tmp_path / "users.sqlite3") as db:
+            lookups = []
+            original = db.get_user
+
+            async def counting_get_user(telegram_id):
+                lookups.append(telegram_id)
+                return await original(telegram_id)
+
+            monkeypatch.setattr(db, "get_user", counting_get_user)
+            monkeypatch.setattr(main, "db", db)
+            monkeypatch.setattr(main, "sender", RecordingSender())
+
+            async def answer(self, text, **kwargs):
+                pass
+
+            monkeypatch.setattr(types.Message, "answer", answer)
+            await main.process_contact(contact_message(1))
+            return lookups
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,60 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from metrics import REGISTRY, MetricsMiddleware
+from scheduler import UpdateScheduler
+
+def make_update(update_id: int, user_id: int, text: str):
+    return types.Update.to_object({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    })
+
+class RecordingMiddleware(BaseMiddleware):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    async def on_pre_process_update(self, update, data):
+        self.events.append(("pre", update.update_id))
+
+    async def on_post_process_update(self, update, results, data):
+        self.events.append(("post", update.update_id))
+
+def test_update_middlewares_run_through_scheduler():
+    async def run():
+        bot = Bot(token="123456:test")
+        dp = Dispatcher(bot)
+        recorder = RecordingMiddleware()
+        dp.middleware.setup(recorder)
+        MetricsMiddleware().register(dp)
+        handled = []
+
+        @dp.message_handler()
+        async def echo(message: types.Message):
+            handled.append(message.text)
+            return message.text
+
+        scheduler = UpdateScheduler(dp, workers=2).install()
+        try:
+            results = await dp.process_updates([make_update(1, 10, "a"), make_update(2, 10, "b")])
+        finally:
+            await scheduler.stop()
+        return recorder.events, handled, results
+
+    events, handled, results = asyncio.run(run())
+    assert handled == ["a", "b"]
+    assert events == [("pre", 1), ("post", 1), ("pre", 2), ("post", 2)]
+    # Как у Dispatcher.process_updates: на обновление — список результатов process_update
+    assert results == [[["a"]], [["b"]]]
+    rendered = REGISTRY.render()
+    assert "bot_updates_total" in rendered
+    assert "bot_update_seconds" in rendered
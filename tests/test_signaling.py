@@ -0,0 +1,112 @@
+import json
+import time
+import asyncio
+
+from aiohttp import web, WSMsgType
+from aiohttp.test_utils import TestServer, TestClient
+
+from signaling import Peer, SignalingServer, setup_signaling, sign_init_data
+
+TOKEN = "123456:test"
+
+def init_data(user_id: int):
+    return sign_init_data({"auth_date": str(int(time.time())), "user": json.dumps({"id": user_id})}, TOKEN)
+
+async def allow_all(user_id):
+    return True
+
+async def join(client, user_id: int, room: str):
+    ws = await client.ws_connect("/ws")
+    await ws.send_str(json.dumps({"type": "auth", "initData": init_data(user_id), "room": room}))
+    msg = await ws.receive()
+    return ws, msg
+
+def run_with_server(scenario):
+    async def run():
+        server = SignalingServer(TOKEN, allow_all)
+        app = web.Application()
+        setup_signaling(app, server)
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(server, client)
+    return asyncio.run(run())
+
+def test_missing_or_unknown_call_is_rejected():
+    async def scenario(server, client):
+        _, missing = await join(client, 1, "")
+        _, unknown = await join(client, 1, "default")
+        return missing, unknown
+
+    missing, unknown = run_with_server(scenario)
+    assert missing.type == WSMsgType.CLOSE and missing.data == 4003
+    assert unknown.type == WSMsgType.CLOSE and unknown.data == 4003
+
+def test_only_invited_participants_join_and_relay():
+    async def scenario(server, client):
+        call_id = server.create_call([1, 2])
+        callee, joined = await join(client, 1, call_id)
+        _, stranger = await join(client, 3, call_id)
+        caller, _ = await join(client, 2, call_id)
+        await caller.send_str(json.dumps({"type": "offer", "to": 1, "sdp": {"type": "offer"}}))
+        messages = [json.loads((await callee.receive()).data) for _ in range(2)]
+        return call_id, joined, stranger, messages
+
+    call_id, joined, stranger, messages = run_with_server(scenario)
+    assert len(call_id) >= 20
+    assert json.loads(joined.data) == {"type": "joined", "peers": []}
+    assert stranger.type == WSMsgType.CLOSE and stranger.data == 4003
+    assert messages == [
+        {"type": "peer-joined", "peer": 2},
+        {"type": "offer", "from": 2, "sdp": {"type": "offer"}},
+    ]
+
+def test_non_object_json_is_rejected_or_ignored():
+    async def scenario(server, client):
+        closes = []
+        for raw in ("[]", '"x"', "1"):
+            ws = await client.ws_connect("/ws")
+            await ws.send_str(raw)
+            closes.append(await ws.receive())
+
+        call_id = server.create_call([1, 2])
+        callee, _ = await join(client, 1, call_id)
+        caller, _ = await join(client, 2, call_id)
+        await callee.receive()
+        # После входа такие кадры пропускаются, соединение живёт дальше
+        for raw in ("[]", '"x"', "null"):
+            await caller.send_str(raw)
+        await caller.send_str(json.dumps({"type": "offer", "to": 1, "sdp": {"type": "offer"}}))
+        return closes, json.loads((await callee.receive()).data)
+
+    closes, offer = run_with_server(scenario)
+    assert all(msg.type == WSMsgType.CLOSE and msg.data == 4001 for msg in closes)
+    assert offer == {"type": "offer", "from": 2, "sdp": {"type": "offer"}}
+
+def test_call_peers():
+    server = SignalingServer(TOKEN, allow_all)
+    server.create_call([1, 2])
+    server.create_call([1, 3])
+    assert server.call_peers(1) == {2, 3}
+    assert server.call_peers(2) == {1}
+    assert server.call_peers(4) == set()
+
+def test_slow_peer_is_closed_once():
+    class FakeSocket:
+        def __init__(self):
+            self.closes = 0
+
+        async def close(self, **kwargs):
+            self.closes += 1
+
+    async def run():
+        server = SignalingServer(TOKEN, allow_all)
+        ws = FakeSocket()
+        peer = Peer(1, ws, "room")
+        for i in range(peer.queue.maxsize + 10):
+            server._enqueue(peer, str(i))
+        await asyncio.sleep(0)
+        return server, peer, ws
+
+    server, peer, ws = asyncio.run(run())
+    assert ws.closes == 1
+    assert peer.closing
+    assert server.dropped == 10